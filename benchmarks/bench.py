@@ -0,0 +1,191 @@
+"""Time the stages of a motif analysis on synthetic data.
+
+Generates (or reuses) a synthetic dataset at the requested scale (see
+`synthetic.generate`), times each stage of the pipeline several times, and
+writes the timings as JSON so that results of different commits can be
+compared.  Runs offline, on CPU only: no structures or dbPTM files are
+downloaded.
+
+The timed stages are ``load_dbptm``, ``load_structures`` (structures parsed
+again on every run), ``extract_motifs_r{radius}`` (from parsed structures) and
+``run`` (statistics at every radius).  Each has the min, median and max of its
+wall-clock times in seconds, and ``counts`` holds the numbers of proteins,
+sites and failed sites.  The report also records the commit, platform,
+scale and options of the run.
+
+    python benchmarks/bench.py -n 200 -s 10 -l 400 -o bench.json
+"""
+
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import click as ck
+
+# Benchmark the working tree, not an installed copy
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from kimono.analysis import MotifAnalysis, MotifAnalysisConfig, _extract_motifs
+from synthetic import generate
+
+
+def _timeit(
+    fn: Callable,
+    repeat: int,
+    setup: Callable = None,
+) -> Dict[str, float]:
+    """Wall-clock time of ``fn`` over ``repeat`` runs (``setup`` is not timed)."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "max": max(times),
+        "times": times,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    data_dir: Path,
+    result_dir: Path,
+    radii: List[float],
+    repeat: int = 3,
+    backend: str = "graph",
+    n_workers: int = 1,
+    prefetch_depth: int = 4,
+    granularity: str = "residue",
+) -> Dict[str, dict]:
+    """Time loading the dataset, loading structures, extracting motifs at each radius and `run`."""
+    config = MotifAnalysisConfig(
+        structure_path=data_dir,
+        dataset_path=data_dir / "dbptm.tsv",
+        use_dataset="dbptm",
+        result_path=result_dir,
+        max_sites=sys.maxsize,
+        structure_backend=backend,
+        n_workers=n_workers,
+        prefetch_depth=prefetch_depth,
+        granularity=granularity,
+        use_cache=False, # time the computation, not the cache
+        defer_loading=True,
+    )
+    with redirect_stdout(io.StringIO()):
+        analysis = MotifAnalysis(config)
+
+    results = {}
+    results["load_dbptm"] = _timeit(analysis._load_dbptm, repeat)
+
+    # Structures are parsed again on every repeat
+    results["load_structures"] = _timeit(
+        analysis._load_structures, repeat, setup=analysis.structures.clear,
+    )
+
+    # Extraction from already parsed structures
+    by_structure = {}
+    for motif in analysis.motifs.values():
+        by_structure.setdefault(id(motif.structure), (motif.structure, []))[1].append(motif.site)
+    for r in radii:
+        results[f"extract_motifs_r{r:g}"] = _timeit(
+            lambda: [_extract_motifs(structure, sites, radius=r) for structure, sites in by_structure.values()],
+            repeat,
+        )
+
+    # Statistics at every radius, from freshly extracted motifs
+    results["run"] = _timeit(
+        lambda: analysis.run(radii=radii),
+        repeat,
+        setup=lambda: analysis._load_structures(),
+    )
+
+    results["counts"] = {
+        "proteins": len(by_structure),
+        "sites": len(analysis.motifs),
+        "failed_sites": len(analysis.failed_sites),
+    }
+    return results
+
+
+@ck.command()
+@ck.option("-n", "--proteins", default=100, show_default=True, help="Number of synthetic proteins.")
+@ck.option("-s", "--sites", default=10, show_default=True, help="Phosphosites per protein.")
+@ck.option("-l", "--length", default=400, show_default=True, help="Average protein length (residues).")
+@ck.option("-r", "--radius", "radii", type=float, multiple=True, default=[6.0, 12.0, 18.0], show_default=True, help="Radii to extract motifs at.")
+@ck.option("--repeat", default=3, show_default=True, help="Number of timed runs of each stage.")
+@ck.option("--backend", type=ck.Choice(["graph", "coordinates"]), default="graph", show_default=True)
+@ck.option("-w", "--workers", default=1, show_default=True)
+@ck.option("--granularity", type=ck.Choice(["residue", "atomistic"]), default="residue", show_default=True)
+@ck.option("--prefetch", default=4, show_default=True, help="Prefetch depth (0 disables prefetching).")
+@ck.option("--data-dir", type=ck.Path(file_okay=False, path_type=Path), default=None, help="Where to generate (or reuse) the synthetic data [default: a temporary directory].")
+@ck.option("-o", "--output", type=ck.Path(dir_okay=False, path_type=Path), default=None, help="JSON file to write the results to [default: stdout].")
+def main(proteins, sites, length, radii, repeat, backend, workers, granularity, prefetch, data_dir, output):
+    """Benchmark the motif analysis pipeline on synthetic AF structures."""
+    scale = {"proteins": proteins, "sites_per_protein": sites, "length": length}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        data_dir = data_dir if data_dir is not None else tmp / "data"
+
+        # Reuse data generated at the same scale
+        scale_path = data_dir / "scale.json"
+        if not (scale_path.is_file() and json.loads(scale_path.read_text()) == scale):
+            start = time.perf_counter()
+            generate(data_dir, n_proteins=proteins, sites_per_protein=sites, length=length)
+            scale_path.write_text(json.dumps(scale))
+            ck.echo(f"Generated data in {time.perf_counter() - start:.1f}s", err=True)
+
+        results = run_benchmarks(
+            data_dir, tmp / "results", radii=sorted(radii), repeat=repeat, backend=backend, n_workers=workers, prefetch_depth=prefetch,
+            granularity=granularity,
+        )
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "radii": sorted(radii),
+        "backend": backend,
+        "workers": workers,
+        "granularity": granularity,
+        "prefetch": prefetch,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output is not None:
+        output.write_text(text)
+    else:
+        ck.echo(text)
+
+    for name, timing in results.items():
+        if "median" in timing:
+            ck.echo(f"{name:>24s}  {timing['median'] * 1000:10.1f} ms", err=True)
+
+
+if __name__ == "__main__":
+    main()
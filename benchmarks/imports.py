@@ -0,0 +1,78 @@
+"""Check that importing kimono is quick and does not load heavy dependencies.
+
+Each module is imported in a fresh interpreter (several times, keeping the
+fastest), and the check fails if an import takes longer than its budget or
+loads a dependency that should only be imported when a code path needs it.
+
+    python benchmarks/imports.py --budget 0.5
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import click as ck
+
+
+"""Dependencies that must not be loaded by importing kimono."""
+LAZY_DEPENDENCIES = ["pandas", "tqdm", "networkx", "scipy", "graphein", "pyarrow"]
+
+"""Modules whose import time is checked."""
+MODULES = ["kimono", "kimono.motif", "kimono.analysis", "kimono.cli"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def import_time(
+    module: str,
+    repeat: int = 5,
+) -> Dict[str, object]:
+    """Fastest import time (s) of ``module`` in a fresh interpreter, and the lazy dependencies it loaded."""
+    root = Path(__file__).resolve().parent.parent
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, lazy=LAZY_DEPENDENCIES)],
+            cwd=root, capture_output=True, text=True, check=True,
+        ).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return {
+        "time": min(r["time"] for r in results),
+        "loaded": sorted(set(m for r in results for m in r["loaded"])),
+    }
+
+
+@ck.command()
+@ck.option("-m", "--module", "modules", multiple=True, default=MODULES, show_default=True, help="Modules to import.")
+@ck.option("--budget", type=float, default=0.5, show_default=True, help="Maximum import time of each module (s).")
+@ck.option("--repeat", default=5, show_default=True, help="Number of fresh imports of each module.")
+@ck.option("-o", "--output", type=ck.Path(dir_okay=False, path_type=Path), default=None, help="JSON file to write the results to.")
+def main(modules, budget, repeat, output):
+    """Check the import time of kimono against a budget."""
+    results = {module: import_time(module, repeat=repeat) for module in modules}
+
+    failures: List[str] = []
+    for module, result in results.items():
+        ck.echo(f"{module:>24s}  {result['time'] * 1000:8.1f} ms  {', '.join(result['loaded'])}", err=True)
+        if result["time"] > budget:
+            failures.append(f"{module} took {result['time']:.3f}s (budget {budget:.3f}s)")
+        if result["loaded"]:
+            failures.append(f"{module} loaded {', '.join(result['loaded'])}")
+
+    if output is not None:
+        output.write_text(json.dumps({"budget": budget, "results": results}, indent=2))
+
+    if failures:
+        raise ck.ClickException("; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
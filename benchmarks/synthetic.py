@@ -0,0 +1,177 @@
+"""Synthetic AlphaFold structures and dbPTM tables for benchmarking.
+
+Structures are random self-avoiding-ish C-alpha walks (3.8 Å steps, folded
+into a globule), with backbone, C-beta and hydroxyl side-chain atoms, written
+as gzipped AF-style PDB files with pLDDT in the B-factor column.  The dbPTM
+table lists phosphosites (S/T/Y) on every protein.  Everything is seeded, so
+the same scale always gives the same files.
+"""
+
+import gzip
+from pathlib import Path
+from typing import List, Tuple
+
+import click as ck
+import numpy as np
+
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+THREE_LETTER = {
+    "A": "ALA", "C": "CYS", "D": "ASP", "E": "GLU", "F": "PHE",
+    "G": "GLY", "H": "HIS", "I": "ILE", "K": "LYS", "L": "LEU",
+    "M": "MET", "N": "ASN", "P": "PRO", "Q": "GLN", "R": "ARG",
+    "S": "SER", "T": "THR", "V": "VAL", "W": "TRP", "Y": "TYR",
+}
+
+"""Side-chain atoms beyond C-beta that are written (the hydroxyl groups of phosphosites)."""
+SIDE_CHAINS = {
+    "S": ["OG"],
+    "T": ["OG1", "CG2"],
+    "Y": ["CG", "CD1", "CD2", "CE1", "CE2", "CZ", "OH"],
+}
+
+_ATOM_FORMAT = "ATOM  {:5d} {:<4s} {:3s} A{:4d}    {:8.3f}{:8.3f}{:8.3f}{:6.2f}{:6.2f}          {:>2s}"
+
+
+def accession(i: int) -> str:
+    """Accession of the ``i``-th synthetic protein."""
+    return f"P{i:05d}"
+
+
+def af_filename(acc_id: str) -> str:
+    return f"AF-{acc_id}-F1-model_v3.pdb.gz"
+
+
+def random_sequence(
+    rng: np.random.Generator,
+    length: int,
+) -> str:
+    return "".join(rng.choice(list(AMINO_ACIDS), size=length))
+
+
+def random_walk(
+    rng: np.random.Generator,
+    length: int,
+    step: float = 3.8, # C-alpha to C-alpha distance in Å
+) -> np.ndarray:
+    """C-alpha coordinates of a compact chain: a persistent random walk confined to a sphere."""
+    # Radius of gyration of a globular protein scales as ~2.2 N^0.38 Å
+    confinement = 2.2 * length ** 0.38 * 1.3
+
+    coords = np.zeros((length, 3))
+    direction = rng.normal(size=3)
+    direction /= np.linalg.norm(direction)
+    for i in range(1, length):
+        direction = direction + 0.8 * rng.normal(size=3)
+        if np.linalg.norm(coords[i - 1]) > confinement:
+            direction -= coords[i - 1] / np.linalg.norm(coords[i - 1]) # turn back inwards
+        direction /= np.linalg.norm(direction)
+        coords[i] = coords[i - 1] + step * direction
+    return coords
+
+
+def plddt_profile(
+    rng: np.random.Generator,
+    length: int,
+) -> np.ndarray:
+    """Smoothly varying pLDDT between ~30 (disordered) and ~95 (confident)."""
+    noise = np.convolve(rng.normal(size=length + 20), np.ones(21) / 21, mode="valid")[:length]
+    return np.clip(70 + 120 * noise, 20, 98)
+
+
+def pdb_lines(
+    sequence: str,
+    coords: np.ndarray,
+    plddt: np.ndarray,
+    rng: np.random.Generator,
+) -> List[str]:
+    """SEQRES and ATOM records of a structure, with backbone atoms placed around each C-alpha."""
+    lines = ["HEADER    SYNTHETIC STRUCTURE FOR KIMONO BENCHMARKS"]
+    for k in range(0, len(sequence), 13):
+        names = " ".join(THREE_LETTER[aa] for aa in sequence[k:k + 13])
+        lines.append(f"SEQRES {k // 13 + 1:3d} A {len(sequence):4d}  {names}")
+    serial = 1
+    for i, (aa, ca, b) in enumerate(zip(sequence, coords, plddt), start=1):
+        atoms: List[Tuple[str, np.ndarray]] = [
+            ("N", ca + (-1.2, 0.6, 0.3)),
+            ("CA", ca),
+            ("C", ca + (1.2, 0.6, -0.3)),
+            ("O", ca + (1.6, 1.7, -0.4)),
+        ]
+        if aa != "G":
+            atoms.append(("CB", ca + (0.0, -1.5, 0.4)))
+        for k, name in enumerate(SIDE_CHAINS.get(aa, [])):
+            atoms.append((name, ca + (0.3 * k, -2.5 - 0.4 * k, 0.8 + 0.2 * rng.random())))
+
+        for name, (x, y, z) in atoms:
+            name = name if len(name) == 4 else f" {name}"
+            lines.append(_ATOM_FORMAT.format(serial, name, THREE_LETTER[aa], i, x, y, z, 1.0, b, name.strip()[0]))
+            serial += 1
+    lines += ["TER", "END"]
+    return lines
+
+
+def seq_window(
+    sequence: str,
+    position: int, # 1-based
+    flank: int = 10,
+) -> str:
+    """dbPTM sequence window centred on a residue, padded with '-'."""
+    left = sequence[max(0, position - 1 - flank):position - 1].rjust(flank, "-")
+    right = sequence[position:position + flank].ljust(flank, "-")
+    return left + sequence[position - 1] + right
+
+
+def generate(
+    path: Path,
+    n_proteins: int = 100,
+    sites_per_protein: int = 10,
+    length: int = 400,
+    seed: int = 0,
+) -> Path:
+    """Write ``n_proteins`` structures and a dbPTM table (``dbptm.tsv``) to ``path``.
+
+    Protein lengths vary by ±25% around ``length``.  Up to ``sites_per_protein``
+    S/T/Y residues of each protein are listed as phosphosites.  Returns the path
+    of the dbPTM table.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    rows = []
+    for i in range(n_proteins):
+        rng = np.random.default_rng([seed, i])
+        acc_id = accession(i)
+        n = int(length * rng.uniform(0.75, 1.25))
+
+        sequence = random_sequence(rng, n)
+        lines = pdb_lines(sequence, random_walk(rng, n), plddt_profile(rng, n), rng)
+        with gzip.open(path / af_filename(acc_id), "wt") as f:
+            f.write("\n".join(lines) + "\n")
+
+        candidates = [p for p, aa in enumerate(sequence, start=1) if aa in "STY"]
+        positions = sorted(rng.choice(candidates, size=min(sites_per_protein, len(candidates)), replace=False))
+        for position in positions:
+            rows.append("\t".join([
+                f"SYN{i}_HUMAN", acc_id, str(position), "Phosphorylation", "0", seq_window(sequence, position),
+            ]))
+
+    dbptm_path = path / "dbptm.tsv"
+    dbptm_path.write_text("\n".join(rows) + "\n")
+    return dbptm_path
+
+
+@ck.command()
+@ck.argument("path", type=ck.Path(file_okay=False, path_type=Path))
+@ck.option("-n", "--proteins", default=100, show_default=True, help="Number of proteins.")
+@ck.option("-s", "--sites", default=10, show_default=True, help="Phosphosites per protein.")
+@ck.option("-l", "--length", default=400, show_default=True, help="Average protein length (residues).")
+@ck.option("--seed", default=0, show_default=True)
+def main(path, proteins, sites, length, seed):
+    """Generate synthetic AF structures and a dbPTM table in PATH."""
+    ck.echo(generate(path, n_proteins=proteins, sites_per_protein=sites, length=length, seed=seed))
+
+
+if __name__ == "__main__":
+    main()
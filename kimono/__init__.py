@@ -6,6 +6,8 @@
 from pathlib import Path
 
 
+__version__ = "0.1"
+
 PROJECT_ROOT_DIR = Path(__file__).parent.parent
 
 DATA_DIR = PROJECT_ROOT_DIR / "data"
@@ -1,35 +1,163 @@
 """Classes for analysis of structural motifs."""
 
 
-import json
 import os
-from typing import List
-import networkx as nx
-import click as ck
-
-from tqdm import tqdm
-
-import pandas as pd 
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Tuple, Union
+import numpy as np
 
 from pathlib import Path
 
 from kimono import SEQUENCE_SAVE_DIR, STRUCTURE_SAVE_DIR, RESULTS_SAVE_DIR
-from kimono.motif import StructuralMotif
-
-from kimono.protein.data import protein_letters_1to3, protein_letters_3to1
-
-from kimono.utils.utils import get_node_id_string
+from kimono.analysis.cache import CachedStats, MotifCache
+from kimono.analysis.checkpoint import Checkpoint
+from kimono.analysis.compare import StructureComparison
+from kimono.analysis.results import RESULT_COLUMNS, ResultWriter
+from kimono.analysis.shard import shard_of
+from kimono.motif import StructuralMotif, query_motifs
+from kimono.motif.scoring import DEFAULT_CONTACT_THRESHOLD, nonlinearity_scores
+from kimono.motif.transform import STAT_COLUMNS, difference_transform_stats, to_csr
+from kimono.structure import ProteinStructure, StructureRegistry
+from kimono.structure import definitions as structure_definitions
+from kimono.structure.alphafold import AlphaFoldFile, AlphaFoldIndex
+from kimono.structure.experimental import PDBIndex
+from kimono.structure.index import CoordinateIndex
+from kimono.structure.pdb import PDBResidues
+from kimono.structure.prefetch import Prefetcher, read_ahead
+from kimono.structure.store import ResidueStore
+
+from kimono.utils.profiling import PROFILER
 
 from kimono.ptm import PTMSite
+from kimono.ptm.dbptm import filter_dbptm, iter_dbptm, match_sequences, read_dbptm
+from kimono.ptm.sequence import SEQUENCE_SOURCES, SequenceIndex
+from kimono.ptm.table import PTMSiteTable
 
 
 from pydantic import BaseModel
 
+# pandas and tqdm are only imported when needed, to keep imports (and workers) quick to start
+if TYPE_CHECKING:
+    import pandas as pd
+
+
 
 
 
 
 
+def _motif_key(site: PTMSite) -> str:
+    """Key of a site's motif in `MotifAnalysis.motifs`."""
+    return f"{site.entry_name}-{site.node_id}"
+
+
+def _query_sites(
+    structure: ProteinStructure,
+    sites: List[PTMSite],
+    radius: float,
+) -> Tuple[List[PTMSite], List[Tuple[np.ndarray, np.ndarray]], List[PTMSite]]:
+    """Neighbours (rows, distances) of each site on a single protein, closest first.
+
+    The neighbours of all sites are found with one batched query of the 
+    protein's coordinate (or atom) index.  Returns the sites found in the 
+    structure with their neighbours, and the sites whose residue is not in the 
+    structure (e.g. a position past its end). 
+    """
+    centres = structure.index.find([site.node_id for site in sites])
+    found = centres >= 0
+    found_sites = [site for site, f in zip(sites, found) if f]
+    neighbours = structure.neighbour_index.query_radius(centres[found], r=radius) if found_sites else []
+    return found_sites, neighbours, [site for site, f in zip(sites, found) if not f]
+
+
+def _extract_motifs(
+    structure: ProteinStructure,
+    sites: List[PTMSite],
+    radius: float,
+) -> Tuple[Dict[str, StructuralMotif], List[PTMSite]]:
+    """Extract the motif around each site on a single protein (see `_query_sites`).
+
+    Returns the motifs, and the sites whose residue is not in the structure. 
+    """
+    found_sites, neighbours, unresolved = _query_sites(structure, sites, radius)
+    motifs = {
+        _motif_key(site): StructuralMotif(
+            structure=structure, 
+            site=site, 
+            radius=radius, 
+            neighbours=rows_distances,
+        )
+        for site, rows_distances in zip(found_sites, neighbours)
+    }
+    return motifs, unresolved
+
+
+def _order_motifs(
+    motifs: Dict[str, StructuralMotif],
+    sites: List[PTMSite],
+) -> Dict[str, StructuralMotif]:
+    """Motifs of the given sites in site order, skipping sites without a motif (e.g. filtered)."""
+    keys = (_motif_key(site) for site in sites)
+    return {key: motifs[key] for key in keys if key in motifs}
+
+
+"""Result of loading one protein: (acc_id, motifs, failed sites, filtered sites)."""
+ProteinResult = Tuple[str, Dict[str, StructuralMotif], List[PTMSite], List[PTMSite]]
+
+
+_WORKER_STORES: Dict[Path, ResidueStore] = {}
+
+
+def _load_protein_motifs(
+    acc_id: str,
+    model_version: int,
+    structure_path: Path,
+    sites: List[PTMSite],
+    radius: float,
+    residue_store_path: Path = None,
+    backend: str = "graph",
+    profile: bool = False,
+    fragment: int = 1,
+    residue_offset: int = 0,
+    granularity: str = "residue",
+) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]], CoordinateIndex, List[PTMSite], dict]:
+    """Load a protein structure and find the neighbours of its sites.
+
+    Runs in a worker process.  Only a summary of each motif is returned, keyed 
+    by motif key: the rows, distances and residue numbers of its neighbours.  
+    The coordinate index they refer to is returned with them, so that the motifs 
+    are rebuilt on the parent's structure without pickling (or parsing) the 
+    protein graph (see `MotifAnalysis._restore_motifs`).  The sites whose 
+    residue is not in the structure are also returned and, if ``profile``, the 
+    worker's profiling report (otherwise None). 
+    """
+    PROFILER.enabled = profile
+    PROFILER.reset()
+
+    store = None
+    if residue_store_path is not None:
+        # Residue stores are opened once per worker process 
+        if residue_store_path not in _WORKER_STORES:
+            _WORKER_STORES[residue_store_path] = ResidueStore(residue_store_path)
+        store = _WORKER_STORES[residue_store_path]
+
+    structure = StructureRegistry(maxsize=1, store=store, backend=backend, granularity=granularity).get(
+        acc_id=acc_id, 
+        model_version=model_version, 
+        structure_path=structure_path,
+        fragment=fragment,
+        residue_offset=residue_offset,
+    )
+    with PROFILER.stage("extract_motifs"):
+        found_sites, neighbours, unresolved = _query_sites(structure=structure, sites=sites, radius=radius)
+    summaries = {
+        _motif_key(site): (rows, distances, structure.index.residue_numbers[rows])
+        for site, (rows, distances) in zip(found_sites, neighbours)
+    }
+    return summaries, structure.index, unresolved, PROFILER.report() if profile else None
+
 
 class MotifAnalysisConfig(BaseModel):
     """Configuration for motif analysis."""
@@ -57,18 +185,36 @@ class MotifAnalysisConfig(BaseModel):
 
     alphafold_structure_dir: Path = None
 
-    af_ignore_fragments: bool = True
-    af_model_version: int = 3
+    af_ignore_fragments: bool = False # If True, only the first fragment (F1) of proteins split into several AlphaFold files is used.
+    af_model_version: int = 3 # If None, the latest model version in `alphafold_structure_dir` is used for each protein.
     af_file_extension: str = "pdb.gz"
+    af_manifest_path: Path = None # If not None, a text file listing the AlphaFold files (one per line), read instead of listing `alphafold_structure_dir`.
+
+    pdb_structure_dir: Path = None # If not None, a directory of experimental structures (e.g. 1abc.pdb.gz) that `MotifAnalysis.compare_structures` compares the AF motifs with.
+    pdb_mapping_path: Path = None # SIFTS pdb_chain_uniprot.tsv (columns PDB, CHAIN and SP_PRIMARY) mapping the chains in `pdb_structure_dir` to UniProt accessions.
 
     af_model_params: dict = {
-        "ignore_fragments": True,
+        "ignore_fragments": False,
         "model_version": 3, 
         "file_extension": "pdb.gz", 
     }
 
     radius: float = 12.0 # Radius of motif subgraph in Ångströms
 
+    granularity: str = "residue" # "residue" measures distances between residue nodes; "atomistic" includes residues with any heavy atom within `radius` of the modified side-chain oxygen of the site.
+
+    structure_cache_size: int = 32 # Maximum number of structures whose graphs (and parsed residues and atoms) are held in memory at once; the coordinate indexes of structures are held as long as their motifs.
+
+    structure_backend: str = "graph" # "graph" builds graphein graphs; "coordinates" reads residue coordinates only, without constructing graphs.
+
+    residue_store_path: Path = None # If not None, residue coordinates are read from this store (see `kimono convert`) instead of structure files.
+
+    n_workers: int = 1 # Number of processes used to extract motifs; each protein is processed by one worker.
+
+    prefetch_depth: int = 4 # Number of upcoming structure files read (and decompressed) in background threads while the current protein is processed; 0 disables prefetching.
+
+    use_cache: bool = True # If True, motif neighbours and statistics are cached under `result_path` (one file per shard) and reused between runs.
+
     
 
     """Which PTM dataset to use."""
@@ -84,11 +230,34 @@ class MotifAnalysisConfig(BaseModel):
 
     species_filter: List[str] = None # If not None, will only include sequences from the given species.
 
+    mod_type_filter: List[str] = None # If not None, will only include sites with the given modification types (e.g. "Phosphorylation").
+
+    stream_chunk_size: int = None # If not None, the dataset is streamed in chunks of this many rows rather than loaded into memory at once.
+
+
+    """pLDDT filters"""
+    # pLDDT is read from the B-factor column of the structure (or the residue store) before 
+    # any motifs are extracted; filtered sites are recorded in `MotifAnalysis.filtered_sites`. 
+    plddt_threshold: float = None # If not None, sites whose own pLDDT is below this are filtered.
+
+    bubble_plddt_threshold: float = None # If not None, sites whose average pLDDT over the residues within `radius` is below this are filtered.
 
-    """Filter dict for storing a parameter (i.e. column in dataset) and a threshold value"""
-    # plddt score (if available); need to use a file first from a given path in config to then join;
-    # to the dataframe.  If no path exists (none) and threshold specified; then the class automatically 
-    # loads from AF files as we go. 
+    """Sequence validation"""
+    sequence_validation: str = None # If not None, "structures" or "fasta": sites whose residue does not match the sequence of their protein are dropped (see `MotifAnalysis.mismatched_sites`) before any structures are loaded.
+
+    sequence_fasta_path: Path = None # FASTA file of protein sequences, for `sequence_validation="fasta"`.
+
+    """Execution"""
+    shard_index: int = 0 # Only proteins in this shard (0-based) are processed.
+
+    num_shards: int = 1 # Number of shards the proteins are split into, by a stable hash of their accession.
+
+    defer_loading: bool = False # If True, structures are not loaded on construction; use `MotifAnalysis.run_units` to process proteins one at a time.
+
+    """Profiling"""
+    profile: bool = False # If True, stage timers and counters are collected and reported in `results["profile"]` by `run`.
+
+    profiler: str = None # If not None, "cprofile" or "pyinstrument": the whole pipeline is profiled, and written to `result_path` by `run`.
 
     def __init__(self, **data):
         super().__init__(**data)
@@ -128,6 +297,11 @@ class MotifAnalysis():
 
         self.results = {}
 
+        # Profiling costs next to nothing unless enabled 
+        PROFILER.enabled = config.profile
+        PROFILER.reset()
+        if config.profiler is not None:
+            PROFILER.start(config.profiler)
 
         self.dataset_path = config.dataset_path
         self.result_path = config.result_path
@@ -147,6 +321,13 @@ class MotifAnalysis():
         self.af_ignore_fragments    = config.af_ignore_fragments
         self.af_model_version       = config.af_model_version
         self.af_file_extension      = config.af_file_extension
+        self.af_manifest_path       = config.af_manifest_path
+        self._af_index: AlphaFoldIndex = None
+        self._af_index_lock = threading.Lock()
+
+        self.pdb_structure_dir = config.pdb_structure_dir
+        self.pdb_mapping_path = config.pdb_mapping_path
+        self._comparison: StructureComparison = None
  
         self.dbptm_path = config.dbptm_path
 
@@ -154,154 +335,614 @@ class MotifAnalysis():
 
         # Filtering
         self.species_filter = config.species_filter
+        self.mod_type_filter = config.mod_type_filter
         self._max_sites = config.max_sites
 
+        self.stream_chunk_size = config.stream_chunk_size
+
         self.radius = config.radius
 
-        self.sites = []
+        self.plddt_threshold = config.plddt_threshold
+        self.bubble_plddt_threshold = config.bubble_plddt_threshold
+
+        if not 0 <= config.shard_index < config.num_shards:
+            raise ValueError(f"Invalid shard {config.shard_index} of {config.num_shards}")
+        self.shard_index = config.shard_index
+        self.num_shards = config.num_shards
+
+        # Parsed structures shared between all sites on the same protein 
+        self.structures = StructureRegistry(
+            maxsize=config.structure_cache_size,
+            store=ResidueStore(config.residue_store_path) if config.residue_store_path is not None else None,
+            backend=config.structure_backend,
+            granularity=config.granularity,
+        )
+
+        self.n_workers = config.n_workers
+        self.prefetch_depth = config.prefetch_depth
+
+        # Persistent cache of motif neighbours and statistics; shards (e.g. on 
+        # different nodes sharing `result_path`) each have their own file, since 
+        # SQLite locking is unreliable on network filesystems 
+        suffix = f"-shard{self.shard_index}of{self.num_shards}" if self.num_shards > 1 else ""
+        self.cache = MotifCache(
+            self.result_path / f"motif_cache{suffix}.sqlite", 
+            model_version=self.af_model_version, 
+            granularity=config.granularity,
+            graph_config=structure_definitions.DEFAULT_PROTEIN_GRAPH_CONFIG if config.structure_backend == "graph" else None,
+            backend=config.structure_backend,
+        ) if config.use_cache else None
+        self._structure_keys: Dict[str, str] = {} # motif key -> cache structure key 
+
+        self._sites: Union[PTMSiteTable, List[PTMSite]] = None
+
+        if config.sequence_validation not in (None, *SEQUENCE_SOURCES):
+            raise ValueError(f"Invalid sequence validation: {config.sequence_validation}")
+        if config.sequence_validation == "fasta" and config.sequence_fasta_path is None:
+            raise ValueError("A FASTA file (sequence_fasta_path) is needed to validate sites against.")
+        self.sequence_validation = config.sequence_validation
+        self.sequence_fasta_path = config.sequence_fasta_path
+        self._sequences: SequenceIndex = None
+        self._mismatched: List["pd.DataFrame"] = []
 
         if self.use_dataset == "dbptm":
-            self._load_dbptm()
+            with PROFILER.stage("load_dataset"):
+                self._load_dbptm()
         else:
             raise ValueError(f"Invalid dataset: {self.use_dataset}")
 
+        self.motifs: Dict[str, StructuralMotif] = {}
+        self.failed_sites: List[PTMSite] = []
+        self.filtered_sites: List[PTMSite] = []
+
         # Load in structures 
-        self._load_structures()
+        if not config.defer_loading:
+            self._load_structures()
 
     
-    def _load_dbptm(self) -> pd.DataFrame:
+    def _load_dbptm(self) -> "pd.DataFrame":
         """Load the DBPTM database."""
         
         if self.dataset_path is None: # use default dbPTM if `dataset_path` unspecified
             self.dataset_path = self.dbptm_path
         
+        if self.stream_chunk_size is not None:
+            # Sites are streamed from the file as structures are loaded (see `_iter_site_groups`)
+            print(f"Streaming from {self.dataset_path}")
+            self.dataset = None
+            return None
+
         print(f"Loading from {self.dataset_path}")
-        df = pd.read_csv(
-            self.dataset_path, 
-            sep="\t",
-            names=[
-                "entry_name",       # dbPTM columns
-                "acc_id", 
-                "position", 
-                "mod_type",
-                "pmids", 
-                "seq_window",  
-            ],
+        df = read_dbptm(self.dataset_path)
+
+        # All filtering happens on the dataframe, before any sites are created 
+        df = filter_dbptm(
+            df, 
+            species_filter=self.species_filter, 
+            include_isoforms=self.include_isoforms, 
+            mod_type_filter=self.mod_type_filter,
+            max_sites=self._max_sites if self.sequence_validation is None else None,
         )
 
-        #print(df.entry_name)
-        #exit(0)
-        # Add species column, which is the 2nd part of `entry_name` 
-        df["entry_name"] = df["entry_name"].astype(str)
-        df["species"] = df["entry_name"].apply(lambda x: x.split("_")[-1].lower())
-
-        # Filter by species
-        if self.species_filter is not None:
-            df = df[df["species"].isin(self.species_filter)]
+        # Sites that do not match the sequence of their protein are dropped before `max_sites` is applied 
+        if self.sequence_validation is not None:
+            df = self._validate_sequences(df)
+            if self._max_sites is not None:
+                df = df.head(self._max_sites)
+
+        # Sites are stored as columns; `PTMSite`s are only created when needed
+        self.dataset = df.reset_index(drop=True)
+        self._sites = PTMSiteTable.from_dataframe(self.dataset)
+        return self.dataset
+
+    @property
+    def sequences(self) -> SequenceIndex:
+        """Sequences that sites are validated against, read on first use."""
+        if self._sequences is None:
+            if self.sequence_validation == "fasta":
+                with PROFILER.stage("read_sequences"):
+                    self._sequences = SequenceIndex.from_fasta(self.sequence_fasta_path)
+            else:
+                self._sequences = SequenceIndex(reader=self._read_sequence, depth=max(self.prefetch_depth, 1))
+        return self._sequences
 
-        df = df.head(self._max_sites) # Restrict number of sites in dataset
+    def _read_sequence(
+        self,
+        acc_id: str,
+    ) -> str:
+        """Sequence of a protein from its AlphaFold files (None if it has none, or they cannot be read)."""
+        try:
+            return self.af_index.sequence(acc_id)
+        except (OSError, ValueError):
+            return None
+
+    def _validate_sequences(
+        self,
+        df: "pd.DataFrame",
+    ) -> "pd.DataFrame":
+        """Drop (and record) filtered dbPTM sites that do not match the sequence of their protein."""
+        df, mismatched = match_sequences(df, self.sequences)
+        if len(mismatched):
+            print(f"Dropped {len(mismatched)} sites that do not match the sequence of their protein")
+            self._mismatched.append(mismatched)
+        return df
 
-        if not self.include_isoforms:
-            # Remove rows where the `acc_id` is a seqeuence isoform.
-            df = df[~df["acc_id"].str.contains("-")]
+    @property
+    def mismatched_sites(self) -> "pd.DataFrame":
+        """dbPTM rows dropped by sequence validation, with the residue found in the sequence (`sequence_residue`)."""
+        import pandas as pd
+        return pd.concat(self._mismatched, ignore_index=True) if self._mismatched else pd.DataFrame()
 
-        
-        # Create residue column from seq_window.  
-        # This is the character in the `seq_window` which is calculated
-        # by dividing the length of the `seq_window` by 2 and rounding down.
-        df["seq_window"] = df["seq_window"].astype(str)
-        df["residue"] = df["seq_window"].apply(lambda x: x[int(len(x)/2)]) 
-        
+    @property
+    def sites(self) -> Union[PTMSiteTable, List[PTMSite]]:
+        """PTM sites in the dataset.  
 
+        When the dataset is streamed, the sites are read from the file on first access.
         """
-        TODO: 
-        - for each entry, get sequence from uniprot `acc_id`
-        - confirm that middle of `seq_window` residue matches the `acc_id` sequence at the `position` 
-        
-        """
-
-    
-        # Create list of sites for each PTM site recorded in the dataset. 
-        for i, row in df.iterrows():
-            ptm_site = PTMSite(
-                entry_name=row["entry_name"],
-                acc_id=row["acc_id"], 
-                residue=row["residue"], 
-                position=row["position"], 
-                ptm_type=row["mod_type"], 
-            )
-            self.sites.append(ptm_site)
-
-        self.dataset = df
-        return df
+        if self._sites is None:
+            self._sites = [site for _, sites in self._iter_all_site_groups() for site in sites]
+        return self._sites
 
     def _load_structures(self) -> None:
+        from tqdm import tqdm
 
         # If use alphafold, load structures from alphafold directory
 
         # TODO: If use alternative structure database, load structures from that directory 
         
+        # Every protein is independent, so sites are processed in per-protein groups; 
+        # the sites of each group are only created when it is processed.
+        n_groups = self.dataset["acc_id"].nunique() if self.dataset is not None and self.num_shards == 1 else None
+
         failed_sites = []
         motifs = {}
-        for site in tqdm(self.sites):
-            #site.load_structure(self.alphafold_structure_dir, self.af_model_params)
-            try:
-                motif: StructuralMotif = self._load_alphafold(site=site)
-                motifs[f"{site.entry_name}-{site.node_id}"] = motif
-            except FileNotFoundError:
-                failed_sites.append(site)
-                print(f"Alphafold structure not found for {site.acc_id}")
-                continue
-
+        for _, protein_motifs, protein_failed, protein_filtered in tqdm(
+            self._iter_proteins(self._iter_site_groups()), total=n_groups,
+        ):
+            motifs.update(protein_motifs)
+            failed_sites.extend(protein_failed)
+            self.filtered_sites.extend(protein_filtered)
+
+        # Order results by input site, independent of how proteins were scheduled 
+        # (streamed sites are already in file order).
+        if self.dataset is not None:
+            motifs = {
+                key: motifs[key] 
+                for key in self.site_keys() if key in motifs
+            }
         self.motifs = motifs
         self.failed_sites = failed_sites
 
-    def _load_alphafold(
+    def _iter_proteins(
         self,
-        site: PTMSite,
+        groups: Iterable[Tuple[str, Iterable[PTMSite]]],
+    ) -> Iterator[ProteinResult]:
+        """Load the motifs of each protein group, serially or in a process pool, in group order."""
+        groups = self._prefetch(groups)
+        if self.n_workers > 1:
+            return self._load_structures_parallel(groups)
+        return (self._load_protein(acc_id, sites, residues) for acc_id, sites, residues in groups)
+
+    def _prefetch(
+        self,
+        groups: Iterable[Tuple[str, Iterable[PTMSite]]],
+    ) -> Iterator[Tuple[str, Iterable[PTMSite], Dict[AlphaFoldFile, PDBResidues]]]:
+        """Read the structures of upcoming protein groups in background threads.
+
+        Yields ``(acc_id, sites, residues)``, where ``residues`` holds the residues 
+        read ahead from each structure file (fragment) of the protein.  Where the 
+        residues are used in this process (the ``coordinates`` backend, or pLDDT 
+        filtering), they are read ahead; with the ``graph`` backend, graphein reads 
+        the file itself, so it is only read into the page cache.  With ``atomistic`` 
+        granularity, files are also only read into the page cache, since residues 
+        and atoms are parsed together from one read (see `ProteinStructure.atoms`). 
+        ``residues`` is empty if nothing was read ahead, e.g. if prefetching is 
+        disabled or the files could not be read.
+        """
+        filter_plddt = self.plddt_threshold is not None or self.bubble_plddt_threshold is not None
+        read_residues = (
+            (filter_plddt or (self.structures.backend == "coordinates" and self.n_workers == 1)) 
+            and self.structures.granularity == "residue"
+        )
 
-    ) -> None:
+        # Structures are read from the store, or only by worker processes 
+        if self.prefetch_depth < 1 or self.structures.store is not None or not (read_residues or self.n_workers == 1):
+            for acc_id, sites in groups:
+                yield acc_id, sites, {}
+            return
+
+        def read(group: Tuple[str, Iterable[PTMSite]]) -> Tuple[List[PTMSite], Dict[AlphaFoldFile, PDBResidues]]:
+            acc_id, sites = group
+            sites = list(sites)
+            residues = {}
+            for af_file in self._locate_sites(acc_id, sites)[0]:
+                if (acc_id, af_file.model_version, af_file.fragment) in self.structures:
+                    continue
+                try:
+                    if read_residues:
+                        residues[af_file] = PDBResidues.from_file(af_file.path)
+                    else:
+                        read_ahead(af_file.path)
+                except (OSError, ValueError):
+                    pass # raised again when the structure is read in this thread 
+            return sites, residues
+
+        self.af_index # listed before the threads start
+        for (acc_id, _), (sites, residues) in Prefetcher(read, depth=self.prefetch_depth).map(groups):
+            yield acc_id, sites, residues
+
+    def _load_structures_parallel(
+        self,
+        groups: Iterable[Tuple[str, Iterable[PTMSite], Dict[AlphaFoldFile, PDBResidues]]],
+    ) -> Iterator[ProteinResult]:
+        """Load structures for each protein group in a process pool.
+
+        Results are yielded in the same order as ``groups`` as they complete.  
+        At most a few groups per worker are in flight at once, so that sites 
+        streamed from the dataset are not all held in memory.  Only sites that 
+        are not in the cache are sent to the pool, in one task per structure 
+        file (fragment) of the protein.
+        """
+        max_pending = 4 * self.n_workers
+
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            pending = deque()
+            for acc_id, sites, residues in groups:
+                sites = list(sites)
+                with PROFILER.stage("find_structure"):
+                    located, failed = self._locate_sites(acc_id, sites)
+                if failed:
+                    print(f"Alphafold structure not found for {acc_id}")
+
+                parts = []
+                for af_file, part_sites in located.items():
+                    try:
+                        structure, cached, missing, filtered = self._get_cached_motifs(af_file, part_sites, residues.get(af_file))
+                    except (OSError, ValueError) as e:
+                        print(f"Could not read {af_file.path}: {e}")
+                        failed.extend(part_sites)
+                        continue
+
+                    future = None
+                    if missing:
+                        future = executor.submit(
+                            _load_protein_motifs, 
+                            acc_id=acc_id,
+                            model_version=af_file.model_version,
+                            structure_path=af_file.path,
+                            sites=missing,
+                            radius=self.radius,
+                            residue_store_path=self.structures.store.path if self.structures.store is not None else None,
+                            backend=self.structures.backend,
+                            profile=PROFILER.enabled,
+                            fragment=af_file.fragment,
+                            residue_offset=af_file.offset,
+                            granularity=self.structures.granularity,
+                        )
+                    parts.append((af_file, structure, missing, cached, future, filtered))
+                pending.append((acc_id, sites, parts, failed))
+
+                while len(pending) > max_pending:
+                    yield self._get_pending_result(*pending.popleft())
+
+            while pending:
+                yield self._get_pending_result(*pending.popleft())
+
+    def _get_pending_result(
+        self,
+        acc_id: str,
+        sites: List[PTMSite],
+        parts: List[Tuple[AlphaFoldFile, ProteinStructure, List[PTMSite], Dict[str, StructuralMotif], Future, List[PTMSite]]],
+        failed: List[PTMSite],
+    ) -> ProteinResult:
+        """Wait for the motifs of a protein group submitted to the process pool.
+
+        As when loading serially, the sites of a structure file that could not be 
+        read in the worker are failed. 
+        """
+        motifs = {}
+        filtered = []
+        for af_file, structure, missing, cached, future, part_filtered in parts:
+            motifs.update(cached)
+            filtered.extend(part_filtered)
+            if future is not None:
+                try:
+                    with PROFILER.stage("wait_for_workers"):
+                        summaries, index, unresolved, report = future.result()
+                except (OSError, ValueError) as e:
+                    # Raised in the worker, e.g. by a file that cannot be read 
+                    print(f"Could not read {af_file.path}: {e}")
+                    failed = failed + missing
+                    continue
+                PROFILER.merge(report)
+                failed = failed + unresolved
+                with PROFILER.stage("restore_motifs"):
+                    computed = self._restore_motifs(structure, missing, summaries, index)
+                self._cache_motifs(af_file.path, computed)
+                motifs.update(computed)
+
+        return acc_id, _order_motifs(motifs, sites), failed, filtered
+
+    def _restore_motifs(
+        self,
+        structure: ProteinStructure,
+        sites: List[PTMSite],
+        summaries: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]], # See `_load_protein_motifs`
+        index: CoordinateIndex, # Index the rows of ``summaries`` refer to
+    ) -> Dict[str, StructuralMotif]:
+        """Rebuild the motifs computed by a worker process on the (shared) structure of this process.
+
+        The worker's index is used by the structure unless it already has one, 
+        e.g. built from its residues for pLDDT filtering; the rows are then 
+        mapped onto that index by node ID. 
+        """
+        own = structure.use_index(index)
+        remap = own is not index and not np.array_equal(own.node_ids, index.node_ids)
 
-        """Load an alphafold structure."""
+        motifs = {}
+        for site in sites:
+            key = _motif_key(site)
+            if key not in summaries:
+                continue
+            rows, distances, residue_numbers = summaries[key]
+            if remap:
+                rows = own.rows(index.node_ids[rows])
+            motifs[key] = StructuralMotif(
+                structure=structure, 
+                site=site, 
+                radius=self.radius, 
+                neighbours=(rows, distances), 
+                residue_numbers=residue_numbers,
+            )
+        return motifs
 
-        #self.sites: List[PTMSite]          # set of sites (i.e. ID and residue position)
-        #self.motifs: List[StructuralMotif]  # subgraph centred around each site # TODO make 
-                                            # this efficient without multiple subgraphs; but 
-                                            # rather just a refernce to the original graph 
+    def _load_protein(
+        self,
+        acc_id: str,
+        sites: List[PTMSite],
+        residues: Dict[AlphaFoldFile, PDBResidues] = None, # Residues read ahead (see `_prefetch`)
+    ) -> ProteinResult:
+        """Load the motifs for all sites on a single protein."""
+        sites = list(sites)
+        residues = residues if residues is not None else {}
+        with PROFILER.stage("find_structure"):
+            located, failed = self._locate_sites(acc_id, sites)
+        if failed:
+            print(f"Alphafold structure not found for {acc_id}")
 
-        # TODO: maybe change from List to Dict with key as site ID for easier referencing? 
+        motifs = {}
+        filtered = []
+        for af_file, part_sites in located.items():
+            # Sites on a file that cannot be read fail, rather than the whole run 
+            try:
+                structure, cached, missing, part_filtered = self._get_cached_motifs(af_file, part_sites, residues.get(af_file))
+            except (OSError, ValueError) as e:
+                print(f"Could not read {af_file.path}: {e}")
+                failed.extend(part_sites)
+                continue
+            motifs.update(cached)
+            filtered.extend(part_filtered)
+
+            if missing:
+                try:
+                    with PROFILER.stage("extract_motifs"):
+                        computed, unresolved = _extract_motifs(structure=structure, sites=missing, radius=self.radius)
+                except (OSError, ValueError) as e:
+                    print(f"Could not read {af_file.path}: {e}")
+                    failed.extend(missing)
+                    continue
+                failed.extend(unresolved)
+                self._cache_motifs(af_file.path, computed)
+                motifs.update(computed)
+
+        return acc_id, _order_motifs(motifs, sites), failed, filtered
+
+    def _locate_sites(
+        self,
+        acc_id: str,
+        sites: List[PTMSite],
+    ) -> Tuple[Dict[AlphaFoldFile, List[PTMSite]], List[PTMSite]]:
+        """Split the sites of a protein by the structure file (fragment) that holds them.
 
-        
-        pdb_path = self.alphafold_structure_dir / self._get_af_filename(site.acc_id)
-        print(pdb_path)
+        Returns the sites of each file, in fragment order, and the sites that 
+        are not in any file (see `AlphaFoldIndex.locate`). 
+        """
+        located = {}
+        missing = []
+        for site in sites:
+            af_file = self.af_index.locate(acc_id, site.position)
+            if af_file is None:
+                missing.append(site)
+            else:
+                located.setdefault(af_file, []).append(site)
+        return dict(sorted(located.items(), key=lambda item: item[0].fragment)), missing
 
-        # Check if path is an existing file
-        if not pdb_path.is_file():
- 
-            raise FileNotFoundError(f"Alphafold structure not found for {site.acc_id} at {pdb_path}")
-        
-        motif = StructuralMotif(
-            site=site,
-            structure_path=pdb_path, 
-            radius=self.radius,
+    def _get_cached_motifs(
+        self,
+        af_file: AlphaFoldFile,
+        sites: List[PTMSite],
+        residues: PDBResidues = None, # Residues read ahead (see `_prefetch`)
+    ) -> Tuple[ProteinStructure, Dict[str, StructuralMotif], List[PTMSite], List[PTMSite]]:
+        """Restore the motifs of sites on one structure file from the cache.
+
+        Sites are first filtered by pLDDT (see `_filter_plddt`).  The structure 
+        is not parsed for sites found in the cache.  Returns the (shared) 
+        structure, the cached motifs, the sites that still need to be computed 
+        and the filtered sites. 
+        """
+        PROFILER.count("proteins")
+        structure = self.structures.get(
+            acc_id=af_file.acc_id, 
+            model_version=af_file.model_version, 
+            structure_path=af_file.path,
+            residues=residues,
+            fragment=af_file.fragment,
+            residue_offset=af_file.offset,
         )
-        return motif
-            
+        with PROFILER.stage("filter_plddt"):
+            sites, filtered = self._filter_plddt(structure, sites)
+        PROFILER.count("sites_filtered", len(filtered))
 
-        
+        if self.cache is None:
+            return structure, {}, sites, filtered
 
+        with PROFILER.stage("cache_lookup"):
+            structure_key = self.cache.structure_key(af_file.path)
+            cached = self.cache.get_neighbours(structure_key, radius=self.radius)
 
+        motifs = {}
+        missing = []
+        for site in sites:
+            key = _motif_key(site)
+            self._structure_keys[key] = structure_key
+            if site.node_id not in cached:
+                missing.append(site)
+                continue
 
-    def _get_af_filename(
+            rows, distances, residue_numbers, _ = cached[site.node_id]
+            motifs[key] = StructuralMotif(
+                structure=structure, 
+                site=site, 
+                radius=self.radius, 
+                neighbours=(rows, distances), 
+                residue_numbers=residue_numbers,
+            )
+
+        self.cache.hits += len(motifs)
+        self.cache.misses += len(missing)
+        PROFILER.count("cache_hits", len(motifs))
+        PROFILER.count("cache_misses", len(missing))
+        return structure, motifs, missing, filtered
+
+    def _filter_plddt(
         self,
-        acc_id: str, 
-    ) -> str: 
+        structure: ProteinStructure,
+        sites: List[PTMSite],
+    ) -> Tuple[List[PTMSite], List[PTMSite]]:
+        """Split sites into those that pass the pLDDT thresholds and those that are filtered.
+
+        Only the residues of the structure are read (from the store, or the ATOM 
+        records of the file), so filtered sites never cause a graph to be built. 
+        Sites missing from the structure are kept, and fail as usual when their 
+        motif is extracted. 
+        """
+        if self.plddt_threshold is None and self.bubble_plddt_threshold is None:
+            return sites, []
+
+        # Read the residues first, so the index is built from them rather than a graph 
+        plddt = structure.residues.plddt
+        index = structure.index
+        rows = index.find([site.node_id for site in sites])
+        found = rows >= 0
+
+        keep = np.ones(len(sites), dtype=bool)
+        if self.plddt_threshold is not None:
+            keep[found] &= plddt[rows[found]] >= self.plddt_threshold
+        if self.bubble_plddt_threshold is not None and found.any():
+            bubbles = structure.neighbour_index.query_radius(rows[found], r=self.radius)
+            keep[found] &= np.array(
+                [plddt[bubble].mean() >= self.bubble_plddt_threshold for bubble, _ in bubbles], 
+                dtype=bool,
+            )
 
-        if self.af_ignore_fragments:
-            fragment = 1
-            return f"AF-{acc_id}-F{fragment}-model_v{self.af_model_version}.{self.af_file_extension}"
+        return (
+            [site for site, k in zip(sites, keep) if k], 
+            [site for site, k in zip(sites, keep) if not k],
+        )
+
+    def _cache_motifs(
+        self,
+        pdb_path: Path,
+        motifs: Dict[str, StructuralMotif],
+    ) -> None:
+        """Store the neighbours of newly computed motifs in the cache."""
+        if self.cache is None:
+            return
+
+        with PROFILER.stage("cache_store"):
+            self.cache.put_neighbours(
+                self.cache.structure_key(pdb_path), 
+                (
+                    (motif.centre_node, motif.queried_neighbours())
+                    for motif in motifs.values()
+                ),
+            )
+
+    def _iter_site_groups(self) -> Iterator[Tuple[str, Iterable[PTMSite]]]:
+        """Iterate over the sites of each protein in the shard."""
+        for acc_id, sites in self._iter_all_site_groups():
+            if self._in_shard(acc_id):
+                yield acc_id, sites
+
+    def _iter_all_site_groups(self) -> Iterator[Tuple[str, Iterable[PTMSite]]]:
+        """Iterate over the sites of each protein in the dataset."""
+        if self.dataset is None:
+            self._mismatched = [] # recorded again on each pass over the file
+            yield from iter_dbptm(
+                self.dataset_path, 
+                chunk_size=self.stream_chunk_size,
+                species_filter=self.species_filter, 
+                include_isoforms=self.include_isoforms, 
+                mod_type_filter=self.mod_type_filter,
+                max_sites=self._max_sites,
+                validate=self._validate_sequences if self.sequence_validation is not None else None,
+            )
         else:
-            raise NotImplementedError(f"Multiple fragments for AF structure not implemented.")
+            for acc_id, rows in self._group_sites().items():
+                yield acc_id, self._get_sites(rows)
+
+    def _in_shard(
+        self,
+        acc_id: str,
+    ) -> bool:
+        return self.num_shards == 1 or shard_of(acc_id, self.num_shards) == self.shard_index
+
+    def _group_sites(self) -> Dict[str, np.ndarray]:
+        """Group the rows of the dataset by protein, in order of first appearance."""
+        return self.sites.groups()
+
+    def _get_sites(
+        self,
+        rows: np.ndarray,
+    ) -> PTMSiteTable:
+        """Get the sites for the given rows of the dataset."""
+        return self.sites.take(rows)
+
+    def site_keys(self) -> List[str]:
+        """Motif keys of every site in the dataset (in all shards), in dataset order."""
+        if isinstance(self.sites, PTMSiteTable):
+            return self.sites.motif_keys().tolist()
+        return [_motif_key(site) for site in self.sites]
+
+    @property
+    def af_index(self) -> AlphaFoldIndex:
+        """Index of the AlphaFold structure directory, listed on first use.
+
+        Prefetch threads (see `_prefetch` and `sequences`) may ask for the index 
+        at the same time; it is only built once. 
+        """
+        if self._af_index is None:
+            with self._af_index_lock:
+                if self._af_index is None:
+                    with PROFILER.stage("index_structures"):
+                        self._af_index = AlphaFoldIndex(
+                            self.alphafold_structure_dir, 
+                            file_extension=self.af_file_extension, 
+                            model_version=self.af_model_version, 
+                            ignore_fragments=self.af_ignore_fragments,
+                            manifest=self.af_manifest_path,
+                        )
+        return self._af_index
+
+    def _get_af_file(
+        self,
+        site: PTMSite,
+    ) -> AlphaFoldFile:
+        """Get the alphafold structure file (fragment) that holds a site."""
+        af_file = self.af_index.locate(site.acc_id, site.position)
+        if af_file is None:
+            raise FileNotFoundError(f"Alphafold structure not found for {site.acc_id} at position {site.position}")
+        return af_file
     
 
     """
@@ -323,28 +964,314 @@ class MotifAnalysis():
     def run(
         self,
         radius: float = None, 
-    ):
+        radii: List[float] = None, 
+    ) -> "pd.DataFrame":
+        """Difference transform statistics for each (site, radius).
+
+        Each site's neighbours are queried once at the largest radius, sorted by 
+        distance; every smaller radius is a prefix of those neighbours. 
+        """
+
+        radii = self._get_radii(radius, radii)
+        with PROFILER.stage("difference_transform"):
+            table = self._stats_table(self.motifs, radii)
+        self.difference_transform_table = table
+
+        if len(radii) == 1:
+            diff = dict(zip(table["site"], table["average_difference_transform"]))
+
+            self.difference_transform = diff
+            self.results["difference_transform"] = self.difference_transform
+        else:
+            self.results["radius_sweep"] = table.to_dict(orient="list")
+
+        if PROFILER.enabled:
+            self.results["profile"] = self.profile_report()
+        if PROFILER.is_running:
+            self.profile_path = PROFILER.stop(self.result_path / "profile")
+
+        return table
+
+    def profile_report(self) -> dict:
+        """Stage timers and counters collected so far (requires ``profile`` in the config).
+
+        Stages may be nested (e.g. ``read_structure`` within ``extract_motifs``), so 
+        their times do not add up to the total. 
+        """
+        report = PROFILER.report()
+        counters = report["counters"]
+        if counters.get("motifs"):
+            counters["nodes_per_motif"] = counters["motif_nodes"] / counters["motifs"]
+        counters["structure_registry_hits"] = self.structures.hits
+        counters["structure_registry_misses"] = self.structures.misses
+        counters["sites_failed"] = len(self.failed_sites)
+        return report
+
+    def run_units(
+        self,
+        checkpoint: Checkpoint,
+        radius: float = None, 
+        radii: List[float] = None, 
+        contact_threshold: float = DEFAULT_CONTACT_THRESHOLD,
+        writer: ResultWriter = None, 
+    ) -> None:
+        """Load, extract and score the motifs of one protein at a time, recording each in ``checkpoint``.
 
-        radius = radius if radius is not None else self.radius
+        Sites already in the checkpoint are skipped, so an interrupted run resumes 
+        where it stopped.  Only the motifs of the proteins in flight are held in memory. 
+        The results of each protein are also streamed to ``writer``, if given. 
+        """
+        from tqdm import tqdm
+        radii = self._get_radii(radius, radii)
+
+        groups = (
+            (acc_id, sites) for acc_id, sites in (
+                (acc_id, self._pending_sites(sites, checkpoint)) 
+                for acc_id, sites in self._iter_site_groups()
+            ) 
+            if len(sites)
+        )
+        for acc_id, motifs, failed, filtered in tqdm(self._iter_proteins(groups)):
+            with PROFILER.stage("result_table"):
+                table = self._result_table(motifs, radii, contact_threshold)
+            checkpoint.append(
+                acc_id, 
+                table, 
+                failed=[_motif_key(site) for site in failed], 
+                filtered=[_motif_key(site) for site in filtered],
+            )
+            if writer is not None:
+                writer.write(table)
 
-        diff = {
-            k: v.average_difference_transform() for k, v in self.motifs.items()
-        }
+            # Motifs of completed proteins are not needed again 
+            for key in motifs:
+                self._structure_keys.pop(key, None)
 
-        self.difference_transform = diff
+    def _pending_sites(
+        self,
+        sites: Iterable[PTMSite],
+        checkpoint: Checkpoint,
+    ) -> Union[PTMSiteTable, List[PTMSite]]:
+        """Sites of a protein group that are not yet in the checkpoint.
 
-        self.results["difference_transform"] = self.difference_transform
+        The sites of a protein may be split over several groups (e.g. when a 
+        streamed dataset is not sorted by protein), so sites are skipped one by one. 
+        """
+        if not len(checkpoint):
+            return sites if isinstance(sites, PTMSiteTable) else list(sites)
+        if isinstance(sites, PTMSiteTable):
+            pending = [i for i, key in enumerate(sites.motif_keys()) if key not in checkpoint]
+            return sites.take(pending)
+        return [site for site in sites if _motif_key(site) not in checkpoint]
+
+    def _get_radii(
+        self,
+        radius: float = None, 
+        radii: List[float] = None, 
+    ) -> List[float]:
+        """Sorted, unique radii to compute statistics at; defaults to the motif radius."""
+        if radii is None:
+            radii = [radius if radius is not None else self.radius]
+        return sorted(set(float(r) for r in radii))
+
+    def _result_table(
+        self,
+        motifs: Dict[str, StructuralMotif],
+        radii: List[float],
+        contact_threshold: float = DEFAULT_CONTACT_THRESHOLD,
+    ) -> "pd.DataFrame":
+        """Statistics, scores and neighbours of the given motifs at each radius (see `RESULT_COLUMNS`)."""
+        import pandas as pd
+        if not motifs: # e.g. every site of a protein failed
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        table = self._stats_table(motifs, radii)
+        scores = pd.concat(
+            [self._score_table(motifs, r, contact_threshold) for r in radii], 
+            ignore_index=True,
+        )
+        table = table.merge(scores, on=["site", "radius"], how="left")
+
+        sites = [motifs[key].site for key in table["site"]]
+        table["acc_id"] = [site.acc_id for site in sites]
+        table["position"] = [site.position for site in sites]
+        table["neighbours"] = [
+            motifs[key].residue_numbers_within(r).tolist() 
+            for key, r in zip(table["site"], table["radius"])
+        ]
+        return table[RESULT_COLUMNS]
+
+    def _stats_table(
+        self,
+        motifs: Dict[str, StructuralMotif],
+        radii: List[float],
+    ) -> "pd.DataFrame":
+        """Difference transform statistics of the given motifs at each radius."""
+        import pandas as pd
+        cached = self._get_cached_stats(motifs, radii)
+
+        # Statistics missing from the cache; their motifs are queried once at 
+        # the largest radius and transformed together in one batch 
+        missing = [
+            (key, r) for key in motifs 
+            for r in radii if (key, r) not in cached
+        ]
+        query_motifs(
+            {key: motifs[key] for key, _ in missing}.values(), 
+            radius=max(radii),
+        )
+
+        values, offsets = to_csr(
+            motifs[key].residue_numbers_within(r) for key, r in missing
+        )
+        computed = difference_transform_stats(values, offsets)
+        stats = dict(cached)
+        stats.update(zip(missing, zip(*(computed[c].tolist() for c in STAT_COLUMNS))))
+
+        if self.cache is not None:
+            self.cache.put_stats(
+                (self._structure_keys[key], motifs[key].centre_node, r, stats[(key, r)])
+                for key, r in missing if key in self._structure_keys
+            )
+
+        return pd.DataFrame(
+            [(key, r, *stats[(key, r)]) for key in motifs for r in radii], 
+            columns=["site", "radius", *STAT_COLUMNS],
+        )
+
+    def _get_cached_stats(
+        self,
+        motifs: Dict[str, StructuralMotif],
+        radii: List[float],
+    ) -> Dict[Tuple[str, float], CachedStats]:
+        """Cached statistics of the given motifs, keyed by (motif key, radius)."""
+        if self.cache is None:
+            return {}
+
+        by_structure = {}
+        for key, motif in motifs.items():
+            if key in self._structure_keys:
+                by_structure.setdefault(self._structure_keys[key], []).append((key, motif.centre_node))
+
+        stats = {}
+        for structure_key, keys in by_structure.items():
+            cached = self.cache.get_stats(structure_key)
+            for key, node_id in keys:
+                for r in radii:
+                    if (node_id, r) in cached:
+                        stats[(key, r)] = cached[(node_id, r)]
+        return stats
+
+    def score(
+        self,
+        radius: float = None, 
+        contact_threshold: float = DEFAULT_CONTACT_THRESHOLD,
+    ) -> "pd.DataFrame":
+        """Distance-ordered sequence and non-linearity score of every motif.
+
+        The pairwise distance blocks of all motifs are scored together in batches 
+        (see `kimono.motif.scoring`). 
+        """
+        radius = float(radius if radius is not None else self.radius)
+        table = self._score_table(self.motifs, radius, contact_threshold)
+        self.score_table = table
+        self.results["nonlinearity_score"] = dict(zip(table["site"], table["nonlinearity_score"]))
+        return table
+
+    def _score_table(
+        self,
+        motifs: Dict[str, StructuralMotif],
+        radius: float,
+        contact_threshold: float = DEFAULT_CONTACT_THRESHOLD,
+    ) -> "pd.DataFrame":
+        """Distance-ordered sequence and non-linearity score of the given motifs."""
+        import pandas as pd
+        query_motifs(motifs.values(), radius=radius)
+
+        rows = [motif.neighbours(radius) for motif in motifs.values()]
+        residue_numbers, offsets = to_csr(
+            motif.index.residue_numbers[r] for motif, r in zip(motifs.values(), rows)
+        )
+        coords = np.concatenate(
+            [motif.index.coords[r] for motif, r in zip(motifs.values(), rows)]
+        ) if rows else np.empty((0, 3))
+
+        with PROFILER.stage("score"):
+            scores = nonlinearity_scores(
+                coords, residue_numbers, offsets, contact_threshold=contact_threshold,
+            )
+
+        return pd.DataFrame({
+            "site": list(motifs), 
+            "radius": radius, 
+            "sequence": [
+                "".join(motif.index.residue_letters[r]) 
+                for motif, r in zip(motifs.values(), rows)
+            ], 
+            "nonlinearity_score": scores,
+        })
+
+    @property
+    def comparison(self) -> StructureComparison:
+        """Comparison with the experimental structures, whose chains are cached between calls."""
+        if self._comparison is None:
+            if self.pdb_structure_dir is None or self.pdb_mapping_path is None:
+                raise ValueError("Experimental structures (pdb_structure_dir and pdb_mapping_path) are needed to compare with.")
+            with PROFILER.stage("index_pdb_structures"):
+                pdb_index = PDBIndex(self.pdb_structure_dir, self.pdb_mapping_path)
+            self._comparison = StructureComparison(
+                pdb_index, 
+                granularity=self.structures.granularity, 
+                maxsize=self.structures.maxsize,
+            )
+        return self._comparison
+
+    def compare_structures(
+        self,
+        radius: float = None, 
+        radii: List[float] = None, 
+    ) -> "pd.DataFrame":
+        """Compare the motif of every site with its motifs in the experimental structures of its protein.
+
+        Residues of the experimental structures are numbered by aligning them to the 
+        sequence of the protein (see `sequences`).  Returns the Jaccard overlap of 
+        the motif residues and the difference transform statistics in both 
+        structures for each (site, chain, radius) (see `COMPARISON_COLUMNS`). 
+        """
+        radii = self._get_radii(radius, radii)
+        comparison = self.comparison
+
+        acc_ids = [acc_id for acc_id in dict.fromkeys(motif.site.acc_id for motif in self.motifs.values()) if acc_id in comparison.pdb_index]
+        self.sequences.load(acc_ids)
+
+        with PROFILER.stage("compare_structures"):
+            table = comparison.compare(self.motifs, radii, sequence=self.sequences.get)
+        self.comparison_table = table
+        self.results["structure_comparison"] = table.to_dict(orient="list")
+        return table
 
     """
     Saves results to the results directory
     """
     def save(
         self,
-    ):
-        # Save to results directory
-
+        path: Path = None, # Defaults to a directory in `result_path` 
+        radii: List[float] = None, # Defaults to the radii of the last `run`, or the motif radius 
+        chunk_size: int = 10000, # Number of motifs processed and written at a time 
+    ) -> Path:
+        """Write the results of every motif as Parquet (see `kimono.analysis.results`)."""
+        if radii is None:
+            radii = (
+                self.difference_transform_table["radius"].unique().tolist() 
+                if hasattr(self, "difference_transform_table") else [self.radius]
+            )
+        radii = self._get_radii(radii=radii)
 
-        path = self.results_path / f"{self.use_dataset}-R{int(self.radius)}.json" 
-        with open(path, "w") as f:
-            json.dump(self.results, f)
+        if path is None:
+            path = self.result_path / f"{self.use_dataset}-R{int(max(radii))}.parquet"
 
+        keys = list(self.motifs)
+        with ResultWriter(path) as writer:
+            for start in range(0, len(keys), chunk_size):
+                motifs = {key: self.motifs[key] for key in keys[start:start + chunk_size]}
+                writer.write(self._result_table(motifs, radii))
+        return Path(path)
@@ -0,0 +1,353 @@
+"""Background distributions of motif statistics over every residue of a proteome."""
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from kimono.motif.transform import STAT_COLUMNS, difference_transform_stats, segment_ids
+from kimono.structure import ProteinStructure
+from kimono.structure.alphafold import AlphaFoldFile, AlphaFoldIndex, central_fragments
+from kimono.structure.store import ResidueStore, structure_name
+from kimono.utils.profiling import PROFILER
+
+# pandas is only imported when a table is built
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+"""Residue types (one-letter codes) the background is computed over by default."""
+BACKGROUND_RESIDUES = "STY"
+
+"""Columns of the store: dtype of each residue's entry (statistics have shape (n_radii, n_stats))."""
+BACKGROUND_COLUMNS: Dict[str, str] = {
+    "residue_numbers": "int32",
+    "residue_letters": "S1",
+    "stats": "float32",
+}
+
+_INDEX_FILENAME = "index.json"
+
+_WORKER_STORES: Dict[Path, ResidueStore] = {}
+
+
+def background_stats(
+    structure: ProteinStructure,
+    radii: Sequence[float],
+    residue_types: str = BACKGROUND_RESIDUES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Difference transform statistics of the motif of every residue of the given types in a structure.
+
+    No motifs are built: the neighbours of all residues are found with one batched
+    query of the structure's coordinate (or atom) index at the largest radius, and
+    the statistics of every residue at every radius are computed in one batch.
+    Returns the rows of the residues in the coordinate index and their statistics,
+    of shape (n_residues, n_radii, n_stats) in the order of `STAT_COLUMNS`.
+    """
+    radii = sorted(radii)
+    index = structure.index
+    rows = np.flatnonzero(np.isin(index.residue_letters, list(residue_types)))
+    stats = np.empty((len(rows), len(radii), len(STAT_COLUMNS)), dtype=np.float32)
+    if not len(rows):
+        return rows, stats
+
+    with PROFILER.stage("query_background"):
+        neighbours = structure.neighbour_index.query_radius(rows, r=radii[-1])
+    lengths = np.array([len(neighbour_rows) for neighbour_rows, _ in neighbours], dtype=np.int64)
+    neighbour_rows = np.concatenate([neighbour_rows for neighbour_rows, _ in neighbours])
+    distances = np.concatenate([distances for _, distances in neighbours])
+    values = index.residue_numbers[neighbour_rows]
+    segments = segment_ids(np.r_[0, np.cumsum(lengths)])
+
+    # The neighbours within each smaller radius are a subset of those at the largest
+    with PROFILER.stage("background_stats"):
+        for i, r in enumerate(radii):
+            within = distances < r
+            offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(segments[within], minlength=len(rows)), out=offsets[1:])
+            stats[:, i] = difference_transform_stats(values[within], offsets).to_numpy(dtype=np.float32)
+
+    return rows, stats
+
+
+def _protein_background(
+    files: List[AlphaFoldFile],
+    radii: List[float],
+    residue_types: str,
+    granularity: str = "residue",
+    residue_store_path: Path = None,
+) -> Dict[str, np.ndarray]:
+    """Background statistics of one protein, from each of its structure files (fragments).
+
+    Each residue is taken from the fragment in which it is most central (see
+    `central_fragments`).  Returns the columns of the protein in the store, in
+    residue order, or None if a structure could not be read.
+    """
+    store = None
+    if residue_store_path is not None:
+        # Residue stores are opened once per worker process 
+        if residue_store_path not in _WORKER_STORES:
+            _WORKER_STORES[residue_store_path] = ResidueStore(residue_store_path)
+        store = _WORKER_STORES[residue_store_path]
+
+    parts = []
+    for i, af_file in enumerate(files):
+        residues = None
+        if store is not None and structure_name(af_file.path) in store:
+            residues = store.residues(structure_name(af_file.path))
+        structure = ProteinStructure(
+            structure_path=af_file.path,
+            backend="coordinates",
+            residues=residues,
+            residue_offset=af_file.offset,
+            granularity=granularity,
+        )
+        try:
+            rows, stats = background_stats(structure, radii, residue_types)
+        except (OSError, ValueError):
+            return None
+
+        residue_numbers = structure.index.residue_numbers[rows]
+        owned = central_fragments(files, residue_numbers) == i
+        parts.append((residue_numbers[owned], structure.index.residue_letters[rows][owned], stats[owned]))
+
+    residue_numbers, residue_letters, stats = (np.concatenate(column) for column in zip(*parts))
+    order = np.argsort(residue_numbers, kind="stable")
+    return {
+        "residue_numbers": residue_numbers[order],
+        "residue_letters": residue_letters[order].astype("S1"),
+        "stats": stats[order],
+    }
+
+
+class BackgroundStore():
+    """Difference transform statistics of every residue of some types in a proteome, for percentile lookups.
+
+    Laid out like a `ResidueStore`: each column is a flat binary file of all
+    residues, memory-mapped on first use, and ``index.json`` maps each protein
+    (UniProt accession) to its (offset, length) in the columns, along with the
+    radii, residue types and granularity the statistics were computed with.
+    Residues are numbered as in the full protein.
+    """
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+    ) -> None:
+
+        self.path = Path(path)
+
+        index_path = self.path / _INDEX_FILENAME
+        if not index_path.is_file():
+            raise FileNotFoundError(f"Background store not found at {self.path}")
+
+        with open(index_path) as f:
+            index = json.load(f)
+
+        self.n_residues: int = index["n_residues"]
+        self.radii: List[float] = index["radii"]
+        self.residue_types: str = index["residue_types"]
+        self.granularity: str = index["granularity"]
+        self.stat_columns: List[str] = index["stat_columns"]
+        self.proteins: Dict[str, Tuple[int, int]] = {
+            acc_id: tuple(entry) for acc_id, entry in index["proteins"].items()
+        }
+        self._columns: Dict[str, np.ndarray] = {}
+        self._distributions: Dict[Tuple[str, float, str], np.ndarray] = {}
+
+    @classmethod
+    def build(
+        cls,
+        af_index: AlphaFoldIndex,
+        path: Union[Path, str],
+        radii: Sequence[float],
+        residue_types: str = BACKGROUND_RESIDUES,
+        granularity: str = "residue",
+        residue_store_path: Path = None, # If given, residue coordinates are read from this store
+        acc_ids: Sequence[str] = None, # Defaults to every protein in `af_index`
+        n_workers: int = 1,
+    ) -> "BackgroundStore":
+        """Compute the background statistics of every protein in an AlphaFold index into a new store.
+
+        Columns are appended one protein at a time, so the memory used does not
+        depend on the size of the proteome.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        radii = sorted(set(float(r) for r in radii))
+        acc_ids = list(acc_ids) if acc_ids is not None else sorted(af_index.keys())
+
+        proteins = {}
+        offset = 0
+        files = {name: open(path / f"{name}.bin", "wb") for name in BACKGROUND_COLUMNS}
+        try:
+            backgrounds = _compute_backgrounds(
+                [(acc_id, af_index.files(acc_id)) for acc_id in acc_ids if acc_id in af_index], 
+                n_workers=n_workers,
+                radii=radii, 
+                residue_types=residue_types, 
+                granularity=granularity, 
+                residue_store_path=residue_store_path,
+            )
+            for acc_id, columns in backgrounds:
+                if columns is None:
+                    print(f"Could not read the structure of {acc_id}")
+                    continue
+
+                for name, dtype in BACKGROUND_COLUMNS.items():
+                    files[name].write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+
+                n = len(columns["residue_numbers"])
+                proteins[acc_id] = (offset, n)
+                offset += n
+        finally:
+            for f in files.values():
+                f.close()
+
+        with open(path / _INDEX_FILENAME, "w") as f:
+            json.dump({
+                "n_residues": offset,
+                "radii": radii,
+                "residue_types": residue_types,
+                "granularity": granularity,
+                "stat_columns": STAT_COLUMNS,
+                "proteins": proteins,
+            }, f)
+
+        return cls(path)
+
+    def column(
+        self,
+        name: str,
+    ) -> np.ndarray:
+        """Memory map of a column for all residues in the store."""
+        if name not in self._columns:
+            dtype = BACKGROUND_COLUMNS[name]
+            shape = (len(self.radii), len(self.stat_columns)) if name == "stats" else ()
+            if self.n_residues == 0:
+                self._columns[name] = np.empty((0, *shape), dtype=dtype)
+            else:
+                self._columns[name] = np.memmap(
+                    self.path / f"{name}.bin", dtype=dtype, mode="r", shape=(self.n_residues, *shape),
+                )
+        return self._columns[name]
+
+    def protein(
+        self,
+        acc_id: str,
+    ) -> "pd.DataFrame":
+        """Statistics of every residue of a protein at every radius."""
+        import pandas as pd
+        try:
+            offset, length = self.proteins[acc_id]
+        except KeyError:
+            raise KeyError(f"Protein {acc_id} not in background store {self.path}")
+
+        stats = self.column("stats")[offset:offset + length]
+        table = pd.DataFrame({
+            "position": np.repeat(self.column("residue_numbers")[offset:offset + length], len(self.radii)),
+            "residue": np.repeat(np.char.decode(self.column("residue_letters")[offset:offset + length]), len(self.radii)),
+            "radius": np.tile(self.radii, length),
+        })
+        for j, name in enumerate(self.stat_columns):
+            table[name] = stats[:, :, j].ravel()
+        return table
+
+    def distribution(
+        self,
+        stat: str,
+        radius: float,
+        residue: str = None, # One-letter code; if None, all residue types
+    ) -> np.ndarray:
+        """Sorted values of a statistic over the background (NaN dropped), computed once."""
+        key = (stat, float(radius), residue)
+        if key not in self._distributions:
+            if float(radius) not in self.radii:
+                raise ValueError(f"Radius {radius} not in background store (radii: {self.radii})")
+            values = self.column("stats")[:, self.radii.index(float(radius)), self.stat_columns.index(stat)]
+            if residue is not None:
+                values = values[self.column("residue_letters") == residue.encode()]
+            values = np.sort(np.asarray(values, dtype=np.float64))
+            self._distributions[key] = values[~np.isnan(values)]
+        return self._distributions[key]
+
+    def percentile(
+        self,
+        values: Sequence[float],
+        stat: str = "average_difference_transform",
+        radius: float = None, # Defaults to the only radius in the store
+        residue: str = None, # One-letter code; if None, compared with all residue types
+    ) -> np.ndarray:
+        """Percentage of the background at or below each value (NaN for NaN values)."""
+        if radius is None:
+            if len(self.radii) != 1:
+                raise ValueError(f"A radius must be given (radii: {self.radii})")
+            radius = self.radii[0]
+
+        values = np.asarray(values, dtype=np.float64)
+        distribution = self.distribution(stat, radius, residue)
+        if not len(distribution):
+            return np.full(len(values), np.nan)
+
+        percentiles = 100.0 * np.searchsorted(distribution, values, side="right") / len(distribution)
+        percentiles[np.isnan(values)] = np.nan
+        return percentiles
+
+    def percentiles(
+        self,
+        table: "pd.DataFrame",
+        stats: Sequence[str] = ("average_difference_transform",),
+        by_residue: bool = True, # Compare each site with residues of its own type only
+    ) -> "pd.DataFrame":
+        """Add the background percentile of each statistic to a result table (see `RESULT_COLUMNS`).
+
+        A ``<stat>_percentile`` column is added for each statistic.  The residue of a
+        site is the first letter of its ``sequence``, its centre residue.
+        """
+        import pandas as pd
+        table = table.copy()
+        groups = pd.DataFrame({
+            "radius": table["radius"].to_numpy(), 
+            "residue": table["sequence"].str[0].to_numpy() if by_residue else "",
+        }).groupby(["radius", "residue"], sort=False).indices
+
+        for stat in stats:
+            values = table[stat].to_numpy(dtype=np.float64)
+            percentiles = np.full(len(table), np.nan)
+            for (radius, residue), rows in groups.items():
+                percentiles[rows] = self.percentile(values[rows], stat=stat, radius=radius, residue=residue or None)
+            table[f"{stat}_percentile"] = percentiles
+        return table
+
+    def keys(self) -> List[str]:
+        return list(self.proteins)
+
+    def __contains__(self, acc_id: str) -> bool:
+        return acc_id in self.proteins
+
+    def __len__(self) -> int:
+        return len(self.proteins)
+
+    def __repr__(self) -> str:
+        return f"BackgroundStore({self.path}, n_proteins={len(self)}, n_residues={self.n_residues}, radii={self.radii})"
+
+
+def _compute_backgrounds(
+    proteins: List[Tuple[str, List[AlphaFoldFile]]],
+    n_workers: int = 1,
+    **kwargs, # Passed to `_protein_background`
+) -> Iterator[Tuple[str, Dict[str, np.ndarray]]]:
+    """Compute the background of each protein, in order, optionally in a process pool."""
+    compute = partial(_protein_background, **kwargs)
+    acc_ids = [acc_id for acc_id, _ in proteins]
+    files = [af_files for _, af_files in proteins]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            yield from zip(acc_ids, executor.map(compute, files, chunksize=4))
+    else:
+        for acc_id, af_files in zip(acc_ids, files):
+            yield acc_id, compute(af_files)
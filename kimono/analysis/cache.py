@@ -0,0 +1,229 @@
+"""On-disk cache of motif results."""
+
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from pydantic import BaseModel
+
+
+"""Cached neighbours of a site: (rows, distances, residue numbers, query radius)."""
+CachedNeighbours = Tuple[np.ndarray, np.ndarray, np.ndarray, float]
+
+"""Cached difference transform statistics, in the order of `STAT_COLUMNS`."""
+CachedStats = Tuple[int, float, int, float, int, float]
+
+
+"""Bumped whenever the stats schema changes; older statistics are discarded."""
+_SCHEMA_VERSION = 2
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, 
+    size INTEGER, 
+    mtime_ns INTEGER, 
+    checksum TEXT
+);
+CREATE TABLE IF NOT EXISTS neighbours (
+    structure TEXT, 
+    node_id TEXT, 
+    query_radius REAL, 
+    rows BLOB, 
+    distances BLOB, 
+    residue_numbers BLOB, 
+    PRIMARY KEY (structure, node_id)
+);
+CREATE TABLE IF NOT EXISTS stats (
+    structure TEXT, 
+    node_id TEXT, 
+    radius REAL, 
+    n_residues INTEGER, 
+    average REAL, 
+    sum INTEGER, 
+    max REAL, 
+    n_nonzero INTEGER, 
+    average_pos REAL, 
+    PRIMARY KEY (structure, node_id, radius)
+);
+"""
+
+
+def config_hash(
+    config: BaseModel,
+) -> str:
+    """Stable hash of a config object.
+
+    Functions are identified by their qualified name rather than ``repr``, 
+    which includes a memory address that changes between runs.
+    """
+    def _default(o):
+        if isinstance(o, BaseModel):
+            return dict(o)
+        if callable(o):
+            return f"{getattr(o, '__module__', '')}.{getattr(o, '__qualname__', repr(o))}"
+        return str(o)
+
+    dump = json.dumps(dict(config), default=_default, sort_keys=True)
+    return hashlib.sha1(dump.encode()).hexdigest()
+
+
+class MotifCache():
+    """Content-addressed SQLite cache of motif neighbours and difference transform statistics.
+
+    Entries are keyed by a structure key, which combines the checksum of the structure 
+    file with the model version, granularity, backend and graph config, so a changed structure 
+    or config never returns stale results.  Neighbours are stored with the radius they 
+    were queried at and can be reused for any smaller radius. 
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        model_version: int,
+        granularity: str = "residue",
+        graph_config: BaseModel = None,
+        backend: str = "graph",
+    ) -> None:
+        
+        self.path = Path(path)
+
+        # The graph config only affects results when the index is built from a graph 
+        self._params = (
+            f"v{model_version}:{granularity}:{backend}:"
+            f"{config_hash(graph_config) if backend == 'graph' else None}"
+        )
+
+        self._connection = sqlite3.connect(self.path)
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+            self._connection.execute("DROP TABLE IF EXISTS stats")
+            self._connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self._connection.executescript(_SCHEMA)
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def checksum(
+        self,
+        structure_path: Path,
+    ) -> str:
+        """Checksum of a structure file; only recomputed if its size or mtime changed."""
+        path = str(Path(structure_path).resolve())
+        stat = os.stat(path)
+
+        row = self._connection.execute(
+            "SELECT size, mtime_ns, checksum FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        checksum = digest.hexdigest()
+
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", 
+                (path, stat.st_size, stat.st_mtime_ns, checksum),
+            )
+        return checksum
+
+    def structure_key(
+        self,
+        structure_path: Path,
+    ) -> str:
+        """Key of all cache entries for a structure file under the cache parameters."""
+        key = f"{self.checksum(structure_path)}:{self._params}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get_neighbours(
+        self,
+        structure_key: str,
+        radius: float,
+    ) -> Dict[str, CachedNeighbours]:
+        """Cached neighbours of every site on a structure queried at ``radius`` or larger."""
+        neighbours = {}
+        rows = self._connection.execute(
+            "SELECT node_id, query_radius, rows, distances, residue_numbers FROM neighbours "
+            "WHERE structure = ? AND query_radius >= ?", 
+            (structure_key, radius),
+        )
+        for node_id, query_radius, r, d, n in rows:
+            neighbours[node_id] = (
+                np.frombuffer(r, dtype=np.int32).astype(np.intp),
+                np.frombuffer(d, dtype=np.float64),
+                np.frombuffer(n, dtype=np.int32),
+                query_radius,
+            )
+        return neighbours
+
+    def put_neighbours(
+        self,
+        structure_key: str,
+        neighbours: Iterable[Tuple[str, CachedNeighbours]],
+    ) -> None:
+        """Store the neighbours of sites on a structure, keyed by node ID."""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO neighbours VALUES (?, ?, ?, ?, ?, ?)", 
+                (
+                    (
+                        structure_key, 
+                        node_id, 
+                        float(query_radius), 
+                        np.asarray(rows, dtype=np.int32).tobytes(), 
+                        np.asarray(distances, dtype=np.float64).tobytes(), 
+                        np.asarray(residue_numbers, dtype=np.int32).tobytes(),
+                    )
+                    for node_id, (rows, distances, residue_numbers, query_radius) in neighbours
+                ),
+            )
+
+    def get_stats(
+        self,
+        structure_key: str,
+    ) -> Dict[Tuple[str, float], CachedStats]:
+        """Cached statistics of every site on a structure, keyed by (node ID, radius)."""
+        rows = self._connection.execute(
+            "SELECT node_id, radius, n_residues, average, sum, max, n_nonzero, average_pos "
+            "FROM stats WHERE structure = ?", 
+            (structure_key,),
+        )
+        return {
+            (node_id, radius): tuple(float("nan") if v is None else v for v in values)
+            for node_id, radius, *values in rows
+        }
+
+    def put_stats(
+        self,
+        stats: Iterable[Tuple[str, str, float, CachedStats]],
+    ) -> None:
+        """Store statistics, given as (structure key, node ID, radius, stats)."""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", 
+                (
+                    (structure_key, node_id, float(radius), *_nan_to_none(values))
+                    for structure_key, node_id, radius, values in stats
+                ),
+            )
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __repr__(self) -> str:
+        return f"MotifCache({self.path}, hits={self.hits}, misses={self.misses})"
+
+
+def _nan_to_none(
+    values: CachedStats,
+) -> List:
+    """SQLite stores NaN as NULL; make that explicit."""
+    return [None if isinstance(v, float) and np.isnan(v) else v for v in values]
@@ -0,0 +1,149 @@
+"""Append-only checkpoint of completed work units."""
+
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, List, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class Checkpoint():
+    """Results of completed work units, appended to a JSON lines file as each one finishes.
+
+    The first line records the parameters of the run, and every following line one
+    unit (the sites of one protein): its statistics table, failed sites and filtered
+    sites.  Lines are flushed to disk as they are written, so after a crash or
+    pre-emption the checkpoint holds every unit that completed; a partially written
+    last line is discarded when the checkpoint is reopened.  Resuming with different
+    parameters raises a ``ValueError`` rather than mixing results.
+
+    Units are numbered in order of completion, since the sites of a protein may be
+    split over several units (e.g. when a streamed dataset is not sorted).  Only the
+    accession of each unit and the keys of its sites are held in memory; the tables
+    are read back from disk by `tables`.
+    """
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        params: dict = None, # Parameters of the run (e.g. radii, shard); must match when resuming
+    ) -> None:
+
+        self.path = Path(path)
+        self.params = params if params is not None else {}
+        self.units: List[str] = [] # accession of each unit, by unit number
+        self.site_rows: Counter = Counter() # number of result rows of each site
+        self.failed_sites: List[str] = []
+        self.filtered_sites: List[str] = []
+        self._excluded: set = set() # failed and filtered sites
+
+        if self.path.is_file():
+            self._load()
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._write({"params": self.params})
+
+    def _load(self) -> None:
+        """Read the completed units, truncating a partially written last line."""
+        size = 0
+        with open(self.path, "rb") as f:
+            for i, line in enumerate(f):
+                if not line.endswith(b"\n"): # incomplete last line
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if i == 0:
+                    self._check_params(record)
+                else:
+                    self._add(record)
+                size += len(line)
+
+        if size == 0:
+            raise ValueError(f"Invalid checkpoint: {self.path}")
+
+        with open(self.path, "r+b") as f:
+            f.truncate(size)
+
+    def _check_params(
+        self,
+        record: dict,
+    ) -> None:
+        if "params" not in record:
+            raise ValueError(f"Invalid checkpoint: {self.path}")
+
+        params = json.loads(json.dumps(self.params)) # compare in JSON form (e.g. tuples as lists)
+        if self.params and record["params"] != params:
+            raise ValueError(
+                f"Checkpoint {self.path} was written with different parameters: "
+                f"{record['params']} (expected {params})"
+            )
+        self.params = record["params"]
+
+    def _add(
+        self,
+        record: dict,
+    ) -> None:
+        """Keep the accession and site keys of a unit (not its table)."""
+        self.units.append(record["acc_id"])
+        self.site_rows.update(record["table"].get("site", []))
+        self.failed_sites.extend(record["failed"])
+        self.filtered_sites.extend(record["filtered"])
+        self._excluded.update(record["failed"], record["filtered"])
+
+    def _write(
+        self,
+        record: dict,
+    ) -> None:
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(
+        self,
+        acc_id: str,
+        table: "pd.DataFrame",
+        failed: List[str] = None,
+        filtered: List[str] = None,
+    ) -> None:
+        """Record a completed unit of sites on one protein."""
+        record = {
+            "unit": len(self.units),
+            "acc_id": acc_id,
+            "table": table.to_dict(orient="list"),
+            "failed": failed if failed is not None else [],
+            "filtered": filtered if filtered is not None else [],
+        }
+        self._write(record)
+        self._add(record)
+
+    def tables(self) -> Iterator["pd.DataFrame"]:
+        """Statistics of each completed unit, read from disk in order of completion."""
+        import pandas as pd
+        with open(self.path, "rb") as f:
+            next(f) # parameters
+            for line in f:
+                table = pd.DataFrame(json.loads(line)["table"])
+                if len(table):
+                    yield table
+
+    def table(self) -> "pd.DataFrame":
+        """Statistics of every completed unit, in order of completion."""
+        import pandas as pd
+        tables = list(self.tables())
+        return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+
+    def __contains__(self, site: str) -> bool:
+        """Whether a site (motif key) is done: it has results, failed or was filtered."""
+        return site in self.site_rows or site in self._excluded
+
+    def __len__(self) -> int:
+        return len(self.units)
+
+    def __repr__(self) -> str:
+        return f"Checkpoint({self.path}, n_units={len(self)})"
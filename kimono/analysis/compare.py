@@ -0,0 +1,194 @@
+"""Comparison of the motifs of sites in AlphaFold models and experimental (PDB) structures."""
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from kimono.motif import StructuralMotif, query_motifs
+from kimono.motif.transform import STAT_COLUMNS, difference_transform_stats, segment_ids, to_csr
+from kimono.structure import ProteinStructure
+from kimono.structure.experimental import PDBChain, PDBIndex, read_pdb_chain
+from kimono.structure.index import prefix_length
+from kimono.utils.profiling import PROFILER
+
+# pandas is only imported when a table is built
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+"""Statistics compared between the motifs in both structures."""
+COMPARED_STATS = [stat for stat in STAT_COLUMNS if stat != "n_residues"]
+
+"""Columns of `StructureComparison.compare`."""
+COMPARISON_COLUMNS = [
+    "site",
+    "acc_id",
+    "position",
+    "radius",
+    "pdb_id",
+    "chain_id",
+    "n_residues_af",
+    "n_residues_pdb",
+    "n_shared",
+    "jaccard", # Shared residues over residues in either motif
+    *[column for stat in COMPARED_STATS for column in (f"{stat}_af", f"{stat}_pdb", f"delta_{stat}")], # delta: PDB - AF
+]
+
+
+class StructureComparison():
+    """Compare the motifs of sites in AlphaFold models with the same sites in experimental structures.
+
+    Each chain of an experimental structure is read once, its residues are
+    numbered as in the protein's sequence (see `read_pdb_chain`), and the chain
+    is kept with its coordinate index in a cache of the ``maxsize`` most recently
+    used chains; every site and radius on a chain is queried from that index in
+    one batch.  Motifs are compared by their residue numbers, so the motifs in
+    both structures are compared residue for residue.
+
+    With ``observed_only``, residues of the AlphaFold motif that are not observed
+    in the experimental chain are left out of the comparison (and of the AF
+    statistics), so that only differences in structure, not in coverage, count.
+    """
+
+    def __init__(
+        self,
+        pdb_index: PDBIndex,
+        granularity: str = "residue", # See `GRANULARITIES`
+        maxsize: int = 32, # Maximum number of chains held in memory
+        observed_only: bool = True,
+    ) -> None:
+
+        self.pdb_index = pdb_index
+        self.granularity = granularity
+        self.maxsize = maxsize
+        self.observed_only = observed_only
+
+        self._structures: OrderedDict = OrderedDict()
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def structure(
+        self,
+        chain: PDBChain,
+        reference: str, # Sequence of the protein
+    ) -> ProteinStructure:
+        """Structure of a chain, numbered as in ``reference``; read on first use."""
+        key = (chain, reference)
+        if key in self._structures:
+            self.hits += 1
+            self._structures.move_to_end(key)
+            return self._structures[key]
+
+        self.misses += 1
+        with PROFILER.stage("read_pdb_chain"):
+            residues, atoms = read_pdb_chain(chain, reference, atoms=self.granularity == "atomistic")
+        structure = ProteinStructure(
+            structure_path=chain.path,
+            backend="coordinates",
+            residues=residues,
+            atoms=atoms,
+            granularity=self.granularity,
+        )
+        self._structures[key] = structure
+
+        while len(self._structures) > self.maxsize:
+            self._structures.popitem(last=False)
+
+        return structure
+
+    def compare(
+        self,
+        motifs: Dict[str, StructuralMotif], # AlphaFold motifs
+        radii: Sequence[float],
+        sequence: Callable[[str], str], # Sequence of a protein, by accession
+    ) -> "pd.DataFrame":
+        """Compare each motif with the motif of the same site in every experimental chain of its protein.
+
+        Returns one row per (site, chain, radius) in which the site is observed
+        (see `COMPARISON_COLUMNS`).
+        """
+        import pandas as pd
+        radii = sorted(radii)
+        query_motifs(motifs.values(), radius=radii[-1])
+
+        by_protein: Dict[str, List[str]] = {}
+        for key, motif in motifs.items():
+            by_protein.setdefault(motif.site.acc_id, []).append(key)
+
+        pairs: List[Tuple] = []
+        af_numbers: List[np.ndarray] = []
+        pdb_numbers: List[np.ndarray] = []
+        for acc_id, keys in by_protein.items():
+            chains = self.pdb_index.chains(acc_id)
+            reference = sequence(acc_id) if chains else None
+            if not reference:
+                continue
+
+            for chain in chains:
+                try:
+                    structure = self.structure(chain, reference)
+                    centres = structure.index.find([motifs[key].centre_node for key in keys])
+                except (OSError, ValueError) as e:
+                    print(f"Could not read {chain.pdb_id} chain {chain.chain_id}: {e}")
+                    continue
+
+                found = centres >= 0
+                if not found.any():
+                    continue
+
+                with PROFILER.stage("query_pdb_motifs"):
+                    neighbours = structure.neighbour_index.query_radius(centres[found], r=radii[-1])
+
+                observed = structure.index.residue_numbers
+                for key, (rows, distances) in zip([k for k, f in zip(keys, found) if f], neighbours):
+                    motif = motifs[key]
+                    for r in radii:
+                        af = motif.residue_numbers_within(r)
+                        if self.observed_only:
+                            af = af[np.isin(af, observed)]
+                        af_numbers.append(af)
+                        pdb_numbers.append(observed[rows[:prefix_length(distances, r)]])
+                        pairs.append((key, acc_id, motif.site.position, r, chain.pdb_id, chain.chain_id))
+
+        table = pd.DataFrame(pairs, columns=COMPARISON_COLUMNS[:6])
+        if not pairs:
+            return table.reindex(columns=COMPARISON_COLUMNS)
+
+        with PROFILER.stage("compare_motifs"):
+            af_values, af_offsets = to_csr(af_numbers)
+            pdb_values, pdb_offsets = to_csr(pdb_numbers)
+
+            # Residues in both motifs of each pair, found for all pairs at once
+            scale = int(max(af_values.max(initial=0), pdb_values.max(initial=0))) + 1
+            shared = np.intersect1d(
+                segment_ids(af_offsets) * scale + af_values,
+                segment_ids(pdb_offsets) * scale + pdb_values,
+            )
+            n_shared = np.bincount(shared // scale, minlength=len(pairs))
+            n_af, n_pdb = np.diff(af_offsets), np.diff(pdb_offsets)
+
+            af_stats = difference_transform_stats(af_values, af_offsets)
+            pdb_stats = difference_transform_stats(pdb_values, pdb_offsets)
+
+        table["n_residues_af"] = n_af
+        table["n_residues_pdb"] = n_pdb
+        table["n_shared"] = n_shared
+        with np.errstate(divide="ignore", invalid="ignore"):
+            table["jaccard"] = n_shared / (n_af + n_pdb - n_shared)
+        for stat in COMPARED_STATS:
+            table[f"{stat}_af"] = af_stats[stat].to_numpy()
+            table[f"{stat}_pdb"] = pdb_stats[stat].to_numpy()
+            table[f"delta_{stat}"] = table[f"{stat}_pdb"] - table[f"{stat}_af"]
+        return table[COMPARISON_COLUMNS]
+
+    def clear(self) -> None:
+        """Remove all chains from the cache."""
+        self._structures.clear()
+
+    def __len__(self) -> int:
+        return len(self._structures)
+
+    def __repr__(self) -> str:
+        return f"StructureComparison({self.pdb_index}, size={len(self)}, hits={self.hits}, misses={self.misses})"
@@ -0,0 +1,151 @@
+"""Columnar (Parquet) output of motif analysis results.
+
+Results are written as a directory of Parquet part files, one row per
+(site, radius), so that they can be written incrementally during a run and
+read back, in full or by column, without parsing one large JSON file.
+Requires ``pyarrow``.
+"""
+
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Union
+
+from kimono.motif.transform import STAT_COLUMNS
+from kimono.utils.profiling import PROFILER
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+"""Columns of the results, one row per (site, radius)."""
+RESULT_COLUMNS = [
+    "site",
+    "acc_id",
+    "position",
+    "radius",
+    *STAT_COLUMNS,
+    "sequence",
+    "nonlinearity_score",
+    "neighbours", # Residue numbers within the radius, closest first
+]
+
+_PART_FORMAT = "part-{:05d}.parquet"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is required to write and read results: pip install pyarrow")
+    return pa, pq
+
+
+def result_schema():
+    """Arrow schema of the results; fixed so that every part file has the same types."""
+    pa, _ = _import_pyarrow()
+    return pa.schema([
+        ("site", pa.string()),
+        ("acc_id", pa.string()),
+        ("position", pa.int32()),
+        ("radius", pa.float64()),
+        ("n_residues", pa.int64()),
+        ("average_difference_transform", pa.float64()),
+        ("sum_difference_transform", pa.int64()),
+        ("max_difference_transform", pa.float64()),
+        ("n_nonzero_difference_transform", pa.int64()),
+        ("average_pos_difference_transform", pa.float64()),
+        ("sequence", pa.string()),
+        ("nonlinearity_score", pa.float64()),
+        ("neighbours", pa.list_(pa.int32())),
+    ])
+
+
+class ResultWriter():
+    """Streaming writer of results to a directory of Parquet part files.
+
+    Tables are buffered and written as a new part once ``rows_per_part`` rows
+    have accumulated.  Each part is written to a temporary file and renamed, so
+    the directory only ever holds complete parts.  Any parts already in the
+    directory are removed when the writer is opened.
+    """
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        rows_per_part: int = 100000,
+    ) -> None:
+
+        self._pa, self._pq = _import_pyarrow()
+        self.schema = result_schema()
+
+        self.path = Path(path)
+        self.rows_per_part = rows_per_part
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        for part in self.path.glob("part-*.parquet"):
+            part.unlink()
+
+        self._buffer: List["pd.DataFrame"] = []
+        self._buffered: int = 0
+        self.n_parts: int = 0
+        self.n_rows: int = 0
+
+    def write(
+        self,
+        table: "pd.DataFrame",
+    ) -> None:
+        """Add rows to the results."""
+        if not len(table):
+            return
+        self._buffer.append(table)
+        self._buffered += len(table)
+        if self._buffered >= self.rows_per_part:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows as a new part."""
+        import pandas as pd
+        if not self._buffer:
+            return
+
+        table = pd.concat(self._buffer, ignore_index=True).reindex(columns=RESULT_COLUMNS)
+        table = self._pa.Table.from_pandas(table, schema=self.schema, preserve_index=False)
+
+        path = self.path / _PART_FORMAT.format(self.n_parts)
+        tmp_path = path.with_suffix(".tmp")
+        with PROFILER.stage("write_results"):
+            self._pq.write_table(table, tmp_path)
+            os.replace(tmp_path, path)
+
+        self.n_parts += 1
+        self.n_rows += self._buffered
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"ResultWriter({self.path}, n_parts={self.n_parts}, n_rows={self.n_rows})"
+
+
+def load_results(
+    path: Union[Path, str],
+    columns: List[str] = None, # Only read these columns (e.g. without `neighbours`)
+) -> "pd.DataFrame":
+    """Load results written by `ResultWriter` into a dataframe."""
+    import pandas as pd
+    _, pq = _import_pyarrow()
+
+    parts = sorted(Path(path).glob("part-*.parquet"))
+    if not parts:
+        return pd.DataFrame(columns=columns if columns is not None else RESULT_COLUMNS)
+
+    return pq.read_table(parts, schema=result_schema(), columns=columns).to_pandas()
@@ -0,0 +1,94 @@
+"""Deterministic sharding of proteins, and merging of shard results."""
+
+import zlib
+from collections import Counter
+from typing import TYPE_CHECKING, Iterable, Iterator, List
+
+from kimono.analysis.checkpoint import Checkpoint
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def shard_of(
+    acc_id: str,
+    num_shards: int,
+) -> int:
+    """Shard of a protein; stable across runs, machines and Python versions (unlike ``hash``)."""
+    return zlib.crc32(acc_id.encode()) % num_shards
+
+
+def merge_checkpoints(
+    checkpoints: Iterable[Checkpoint],
+    expected_sites: Iterable[str] = None, # If given, every site must be accounted for exactly once
+) -> Iterator["pd.DataFrame"]:
+    """Combine the results of the checkpoints of every shard of a run.
+
+    Raises a ``ValueError`` if the checkpoints come from different runs, a shard is
+    missing or given twice, a protein is in the wrong shard, or a site is missing
+    or duplicated.  A site is accounted for by its result rows or by being failed
+    or filtered in one of the shards.  The checks only use the site keys held by
+    each checkpoint; the tables of every shard are then read from disk one unit at
+    a time as the returned iterator is consumed.
+    """
+    checkpoints = list(checkpoints)
+    if not checkpoints:
+        raise ValueError("No checkpoints to merge.")
+
+    # All shards must be from the same run
+    params = [{k: v for k, v in c.params.items() if k != "shard"} for c in checkpoints]
+    for checkpoint, p in zip(checkpoints[1:], params[1:]):
+        if p != params[0]:
+            raise ValueError(f"{checkpoint.path} is from a different run than {checkpoints[0].path}")
+
+    shards = [tuple(c.params.get("shard", (0, 1))) for c in checkpoints]
+    num_shards = shards[0][1]
+    if any(n != num_shards for _, n in shards):
+        raise ValueError(f"Checkpoints were split into different numbers of shards: {sorted(set(n for _, n in shards))}")
+
+    counts = Counter(index for index, _ in shards)
+    duplicated = sorted(index for index, n in counts.items() if n > 1)
+    missing = sorted(set(range(num_shards)) - set(counts))
+    if duplicated:
+        raise ValueError(f"Shards given more than once: {duplicated}")
+    if missing:
+        raise ValueError(f"Missing shards: {missing} (of {num_shards})")
+
+    for checkpoint, (index, _) in zip(checkpoints, shards):
+        wrong = [acc_id for acc_id in dict.fromkeys(checkpoint.units) if shard_of(acc_id, num_shards) != index]
+        if wrong:
+            raise ValueError(f"Proteins in the wrong shard in {checkpoint.path}: {wrong[:5]}")
+
+    # Every site must be accounted for exactly once (once per radius for results)
+    n_radii = len(params[0].get("radii", [])) or 1
+    rows: Counter = Counter()
+    for checkpoint in checkpoints:
+        rows.update(checkpoint.site_rows)
+
+    duplicated = [site for site, n in rows.items() if n > n_radii]
+    if duplicated:
+        raise ValueError(f"Duplicated sites: {duplicated[:5]}")
+    incomplete = [site for site, n in rows.items() if n < n_radii]
+    if incomplete:
+        raise ValueError(f"Sites missing results for some radii: {incomplete[:5]}")
+
+    sites: List[str] = list(rows)
+    for checkpoint in checkpoints:
+        sites.extend(checkpoint.failed_sites)
+        sites.extend(checkpoint.filtered_sites)
+
+    counts = Counter(sites)
+    duplicated = [site for site, n in counts.items() if n > 1]
+    if duplicated:
+        raise ValueError(f"Duplicated sites: {duplicated[:5]}")
+
+    if expected_sites is not None:
+        expected = set(expected_sites)
+        missing = [site for site in expected if site not in counts]
+        unexpected = [site for site in counts if site not in expected]
+        if missing:
+            raise ValueError(f"{len(missing)} sites are missing: {sorted(missing)[:5]}")
+        if unexpected:
+            raise ValueError(f"{len(unexpected)} sites are not in the dataset: {sorted(unexpected)[:5]}")
+
+    return (table for checkpoint in checkpoints for table in checkpoint.tables())
@@ -3,10 +3,33 @@
 from kimono import __version__
 import click as ck 
 
+import json
 import pathlib
 
+from kimono.analysis import MotifAnalysis, MotifAnalysisConfig
+from kimono.analysis.background import BACKGROUND_RESIDUES, BackgroundStore
+from kimono.analysis.checkpoint import Checkpoint
+from kimono.analysis.results import ResultWriter
+from kimono.analysis.shard import merge_checkpoints, shard_of
+from kimono.structure.alphafold import AlphaFoldIndex
+from kimono.structure.definitions import GRANULARITIES
+from kimono.structure.store import ResidueStore
+from kimono.utils.config_parser import parse_config
+from kimono.utils.profiling import PROFILER, PROFILERS
 
-@ck.command()
+
+def parse_shard(ctx, param, value):
+    """Parse a shard given as ``i/n`` (0-based)."""
+    try:
+        index, n = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise ck.BadParameter("must be given as i/n, e.g. 0/4")
+    if not 0 <= index < n:
+        raise ck.BadParameter(f"shard index must be between 0 and {n - 1}")
+    return index, n
+
+
+@ck.group()
 @ck.version_option(__version__)
 @ck.option(
     "-c",
@@ -16,8 +39,235 @@ import pathlib
         exists=True, file_okay=True, dir_okay=False, path_type=pathlib.Path
     ),
 )
-def main(config_path):
+@ck.pass_context
+def main(ctx, config_path):
     """Run kimono."""
     config = parse_config(config_path) if config_path else None 
 
-    pass 
+    ctx.obj = config
+
+
+@main.command()
+@ck.argument(
+    "structure_dir",
+    type=ck.Path(exists=True, file_okay=False, dir_okay=True, path_type=pathlib.Path),
+)
+@ck.argument(
+    "store_path",
+    type=ck.Path(file_okay=False, dir_okay=True, path_type=pathlib.Path),
+)
+@ck.option("--pattern", default="AF-*.pdb.gz", show_default=True, help="Glob pattern of structure files to convert.")
+@ck.option("-w", "--workers", default=1, show_default=True, help="Number of processes used to read structures.")
+def convert(structure_dir, store_path, pattern, workers):
+    """Convert a directory of structures into a residue coordinate store.
+
+    The store is read by `MotifAnalysis` (``residue_store_path``) in place of 
+    parsing the structure files on every run.
+    """
+    store = ResidueStore.build(structure_dir, store_path, pattern=pattern, n_workers=workers)
+    ck.echo(store)
+
+
+@main.command()
+@ck.argument(
+    "structure_dir",
+    type=ck.Path(exists=True, file_okay=False, dir_okay=True, path_type=pathlib.Path),
+)
+@ck.argument(
+    "store_path",
+    type=ck.Path(file_okay=False, dir_okay=True, path_type=pathlib.Path),
+)
+@ck.option("-r", "--radius", type=float, multiple=True, default=[12.0], show_default=True, help="Motif radius in Ångströms; repeat for several radii.")
+@ck.option("--residues", default=BACKGROUND_RESIDUES, show_default=True, help="One-letter codes of the residue types to compute statistics for.")
+@ck.option("--granularity", type=ck.Choice(GRANULARITIES), default="residue", show_default=True)
+@ck.option("--model-version", type=int, default=None, help="AlphaFold model version [default: the latest of each protein].")
+@ck.option(
+    "--residue-store", 
+    type=ck.Path(exists=True, file_okay=False, dir_okay=True, path_type=pathlib.Path), 
+    default=None, 
+    help="Residue coordinate store to read structures from (see `convert`).",
+)
+@ck.option("-w", "--workers", default=1, show_default=True, help="Number of processes used to compute statistics.")
+def background(structure_dir, store_path, radius, residues, granularity, model_version, residue_store, workers):
+    """Compute the motif statistics of every residue of some types in a directory of AF structures.
+
+    The store holds the background distribution that the statistics of PTM sites 
+    are compared with (see `BackgroundStore.percentiles`). 
+    """
+    af_index = AlphaFoldIndex(structure_dir, model_version=model_version)
+    store = BackgroundStore.build(
+        af_index, 
+        store_path, 
+        radii=radius, 
+        residue_types=residues.upper(), 
+        granularity=granularity, 
+        residue_store_path=residue_store, 
+        n_workers=workers,
+    )
+    ck.echo(store)
+
+
+@main.command()
+@ck.option("-w", "--workers", type=int, default=None, help="Number of processes used to extract motifs [default: from config].")
+@ck.option("--prefetch", type=int, default=None, help="Number of structure files read ahead in background threads; 0 disables prefetching [default: from config].")
+@ck.option("-r", "--radius", type=float, multiple=True, help="Motif radius in Ångströms; repeat for a radius sweep [default: from config].")
+@ck.option("--shard", default="0/1", show_default=True, callback=parse_shard, help="Only process shard i of n (0-based), split by accession.")
+@ck.option(
+    "--checkpoint", 
+    type=ck.Path(file_okay=True, dir_okay=False, path_type=pathlib.Path), 
+    default=None, 
+    help="Checkpoint file to resume from [default: in the result directory].",
+)
+@ck.option("--restart", is_flag=True, help="Discard an existing checkpoint instead of resuming from it.")
+@ck.option("--profile", type=ck.Choice(PROFILERS), default=None, help="Profile the run, and write stage timers and the profiler output to the result directory.")
+@ck.pass_obj
+def run(config, workers, prefetch, radius, shard, checkpoint, restart, profile):
+    """Run a motif analysis, one protein at a time.
+
+    Each completed protein is appended to a checkpoint; if the run is interrupted, 
+    running the same command again resumes from the checkpoint.  The statistics, 
+    scores and neighbours of every site are streamed to a Parquet directory in the 
+    result directory as each protein completes (see `load_results`).
+    """
+    if not isinstance(config, MotifAnalysisConfig):
+        raise ck.UsageError("A MotifAnalysisConfig must be given with -c/--config_path.")
+
+    radii = sorted(set(radius)) if radius else [config.radius]
+    config.radius = max(radii) # neighbours are extracted once, at the largest radius
+    config.shard_index, config.num_shards = shard
+    config.defer_loading = True
+    if workers is not None:
+        config.n_workers = workers
+    if prefetch is not None:
+        config.prefetch_depth = prefetch
+    if profile is not None:
+        config.profile, config.profiler = True, profile
+
+    suffix = f"-shard{shard[0]}of{shard[1]}" if shard[1] > 1 else ""
+    if checkpoint is None:
+        checkpoint = config.result_path / f"{config.use_dataset}{suffix}.checkpoint.jsonl"
+    if restart and checkpoint.exists():
+        checkpoint.unlink()
+
+    try:
+        checkpoint = Checkpoint(checkpoint, params={
+            "dataset": str(config.dataset_path),
+            "use_dataset": config.use_dataset,
+            "max_sites": config.max_sites,
+            "species_filter": config.species_filter,
+            "mod_type_filter": config.mod_type_filter,
+            "include_isoforms": config.include_isoforms,
+            "structure_backend": config.structure_backend,
+            "radii": radii,
+            "shard": list(shard),
+            "plddt_threshold": config.plddt_threshold,
+            "bubble_plddt_threshold": config.bubble_plddt_threshold,
+            "af_model_version": config.af_model_version,
+            "af_ignore_fragments": config.af_ignore_fragments,
+            "sequence_validation": config.sequence_validation,
+            "granularity": config.granularity,
+        })
+    except ValueError as e:
+        raise ck.ClickException(f"{e}; use --restart to discard it.")
+    if len(checkpoint):
+        ck.echo(f"Resuming from {checkpoint}")
+
+    analysis = MotifAnalysis(config)
+
+    path = config.result_path / f"{config.use_dataset}{suffix}.parquet"
+    with ResultWriter(path) as writer:
+        # Proteins completed before an interruption are rewritten from the checkpoint 
+        for table in checkpoint.tables():
+            writer.write(table)
+        analysis.run_units(checkpoint, radii=radii, writer=writer)
+
+    ck.echo(
+        f"Wrote {writer.n_rows} rows to {path} "
+        f"({len(checkpoint.failed_sites)} failed, {len(checkpoint.filtered_sites)} filtered sites)"
+    )
+
+    mismatched = analysis.mismatched_sites
+    if len(mismatched) and shard[1] > 1:
+        mismatched = mismatched[[shard_of(acc_id, shard[1]) == shard[0] for acc_id in mismatched["acc_id"].astype(str)]]
+    if len(mismatched):
+        mismatched_path = config.result_path / f"{config.use_dataset}{suffix}.mismatched.tsv"
+        mismatched.to_csv(mismatched_path, sep="\t", index=False)
+        ck.echo(f"Wrote {len(mismatched)} sites that do not match the sequence of their protein to {mismatched_path}")
+
+    if profile is not None:
+        report_path = config.result_path / f"{config.use_dataset}{suffix}.profile.json"
+        with open(report_path, "w") as f:
+            json.dump(analysis.profile_report(), f, indent=2)
+        ck.echo(f"Wrote profile to {report_path} and {PROFILER.stop(report_path.with_suffix(''))}")
+
+
+@main.command()
+@ck.argument(
+    "checkpoints",
+    nargs=-1,
+    required=True,
+    type=ck.Path(exists=True, file_okay=True, dir_okay=False, path_type=pathlib.Path),
+)
+@ck.option(
+    "-o", 
+    "--output", 
+    required=True, 
+    type=ck.Path(file_okay=True, dir_okay=False, path_type=pathlib.Path), 
+    help="Directory to write the merged results to, as Parquet.",
+)
+@ck.pass_obj
+def merge(config, checkpoints, output):
+    """Merge the checkpoints of every shard of a run into one result file.
+
+    Fails if a shard is missing, or if a site is missing or duplicated.  With a 
+    config (-c), every site in the dataset must be in the results, or have failed 
+    or been filtered. 
+    """
+    expected = None
+    if isinstance(config, MotifAnalysisConfig):
+        config.defer_loading = True
+        config.shard_index, config.num_shards = 0, 1
+        expected = MotifAnalysis(config).site_keys()
+
+    try:
+        tables = merge_checkpoints([Checkpoint(path) for path in checkpoints], expected_sites=expected)
+    except ValueError as e:
+        raise ck.ClickException(str(e))
+
+    with ResultWriter(output) as writer:
+        for table in tables:
+            writer.write(table)
+    ck.echo(f"Merged {len(checkpoints)} shards: wrote {writer.n_rows} rows to {output}")
+
+
+@main.command()
+@ck.option("-r", "--radius", type=float, multiple=True, help="Motif radius in Ångströms; repeat for several radii [default: from config].")
+@ck.option(
+    "-o", 
+    "--output", 
+    type=ck.Path(file_okay=True, dir_okay=False, path_type=pathlib.Path), 
+    default=None, 
+    help="TSV file to write the comparison to [default: in the result directory].",
+)
+@ck.pass_obj
+def compare(config, radius, output):
+    """Compare the motifs of sites in their AF models with the same sites in experimental structures.
+
+    Needs ``pdb_structure_dir`` and ``pdb_mapping_path`` in the config; writes one 
+    row per site, chain and radius (see `COMPARISON_COLUMNS`). 
+    """
+    if not isinstance(config, MotifAnalysisConfig):
+        raise ck.UsageError("A MotifAnalysisConfig must be given with -c/--config_path.")
+    if config.pdb_structure_dir is None or config.pdb_mapping_path is None:
+        raise ck.UsageError("pdb_structure_dir and pdb_mapping_path must be set in the config.")
+
+    radii = sorted(set(radius)) if radius else [config.radius]
+    config.radius = max(radii)
+
+    analysis = MotifAnalysis(config)
+    table = analysis.compare_structures(radii=radii)
+
+    if output is None:
+        output = config.result_path / f"{config.use_dataset}.comparison.tsv"
+    table.to_csv(output, sep="\t", index=False)
+    ck.echo(f"Wrote {len(table)} comparisons of {table['site'].nunique()} sites to {output}")
@@ -1,20 +1,20 @@
 """Classes for motifs."""
 
-import networkx as nx
-import click as ck 
+import numpy as np
 
-from kimono.motif.definitions import DEFAULT_PROTEIN_GRAPH_CONFIG
+from kimono.motif import scoring, transform
 from kimono.ptm import PTMSite
+from kimono.structure import ProteinStructure
+from kimono.structure.index import CoordinateIndex, prefix_length
+from kimono.utils.profiling import PROFILER
 
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List, Tuple
 
-from graphein.protein import ProteinGraphConfig 
-from graphein.protein.graphs import construct_graph 
-from graphein.protein.config import DSSPConfig
-
-from graphein.protein.subgraphs import extract_subgraph_from_point
-from graphein.protein.edges.distance import *	
-from graphein.protein.features.nodes import rsa as rsa_function
+# graphein and networkx are only imported when a graph is needed (see `ProteinStructure`)
+if TYPE_CHECKING:
+    import networkx as nx
+    from graphein.protein import ProteinGraphConfig 
 
 class LinearMotif():
     """Represents a sequence of residues that form a motif.  The actual
@@ -32,65 +32,109 @@ class PsuedoLinearMotif():
 class StructuralMotif():
     """Represents a structural motif on a protein.
     
-    It is a graph of residues (or atomistic) that are within a threshold distance from the 
-    centre node, which is a post-translational modification (PTM) site.
+    It is a graph of residues that are within a threshold distance from the centre node, 
+    which is a post-translational modification (PTM) site.  With ``atomistic`` granularity, 
+    a residue is in the motif if any of its heavy atoms is within the threshold distance 
+    of the modified atom of the centre residue, and its distance is that of its closest atom. 
 
     The 'bubble' around the centre node is the motif.  The radius can be updated. 
-    """
 
-    """
-    TODO: 
-    - we need a directory to store these motifs (serialisable) so that we don't have
-    - multiple copies of the same graph (protein ID) in memory. 
-    - each instance of this class that references the same protein ID should point to the same graph; 
-    and simply return a different subgraph. 
-    - obviously the first time it needs to create the graph. 
+    Only a reference to the protein structure (graph and coordinate index) is held, along 
+    with the rows of the motif residues in the index; pass a structure shared through a 
+    ``StructureRegistry`` to avoid multiple copies of the same protein in memory.  The 
+    motif subgraph itself is only built when ``motif`` is accessed. 
     """
 
     def __init__(
         self, 
-        g: nx.Graph = None, 
+        g: "nx.Graph" = None, 
         site: PTMSite = None,
         structure_path: Path = None,
         filename: str = None,
-        graph_config: ProteinGraphConfig = DEFAULT_PROTEIN_GRAPH_CONFIG,
+        graph_config: "ProteinGraphConfig" = None, # Defaults to `DEFAULT_PROTEIN_GRAPH_CONFIG` 
         radius: float = 12.0, # Distance threshold from the center node in Ångströms 
         rsa: float = 0.0, # Relative solvent accessibility threshold 
-        granularity: str = "residue", # TODO: implement atomistic granularity
+        granularity: str = None, # "residue" or "atomistic"; defaults to that of `structure`, or "residue" 
+        index: CoordinateIndex = None, 
+        neighbours: Tuple[np.ndarray, np.ndarray] = None, # Precomputed (rows, distances) from `structure.neighbour_index.query_radius` at `radius` 
+        residue_numbers: np.ndarray = None, # Residue numbers of `neighbours`, if already known 
+        structure: ProteinStructure = None, # Shared (possibly not yet parsed) structure; overrides `g` and `index` 
+        backend: str = "graph", # How the structure is read from `structure_path`; see `STRUCTURE_BACKENDS` 
     ) -> None:
         
         if site is None:
             raise ValueError("Must provide a PTM site.")
 
+        self.site = site 
         self.centre_node = site.node_id 
-        self.granularity = granularity
 
         self._radius    = radius
         self._rsa       = rsa
 
-        if g is None:
-            # TODO: create graph from uniprot ID and residue position 
-            if structure_path is None:
-                raise ValueError("Must provide either a graph or a structure path.")
-            
-            
-            # Check if structure is directory
-            if structure_path.is_dir():
-                if filename is None:
-                    raise ValueError("Must provide a filename for structure path.")
-                structure_path = structure_path / filename 
-
-            # Check if structure_path exists 
-            if not structure_path.exists():
-                raise ValueError(f"Path does not exist: {structure_path}") 
+        if structure is None:
+            if g is None:
+                # TODO: create graph from uniprot ID and residue position 
+                if structure_path is None:
+                    raise ValueError("Must provide either a graph or a structure path.")
+                
+                
+                # Check if structure is directory
+                if structure_path.is_dir():
+                    if filename is None:
+                        raise ValueError("Must provide a filename for structure path.")
+                    structure_path = structure_path / filename 
+
+                # Check if structure_path exists 
+                if not structure_path.exists():
+                    raise ValueError(f"Path does not exist: {structure_path}") 
+
+            structure = ProteinStructure(
+                structure_path=structure_path, 
+                g=g, 
+                index=index, 
+                graph_config=graph_config, 
+                backend=backend,
+                granularity=granularity if granularity is not None else "residue",
+            )
+        elif granularity is not None and granularity != structure.granularity:
+            raise ValueError(f"Granularity {granularity} does not match the structure ({structure.granularity}).")
+
+        self.structure = structure 
+
+        # Neighbours sorted by distance, queried at `_query_radius` >= `radius` 
+        self._centre: int = None
+        self._rows: np.ndarray = None
+        self._distances: np.ndarray = None
+        self._residue_numbers: np.ndarray = None
+        self._query_radius: float = None
+
+        if neighbours is not None:
+            self._set_neighbours(*neighbours, query_radius=radius, residue_numbers=residue_numbers)
+        else:
+            self._query_neighbours(radius)
+
+        if PROFILER.enabled:
+            PROFILER.count("motifs")
+            PROFILER.count("motif_nodes", self._prefix_length(radius))
 
-            g = construct_graph(pdb_path=structure_path, config=graph_config)
+    @property
+    def g(self) -> "nx.Graph":
+        return self.structure.g
 
-        self.g = g 
+    @property
+    def index(self) -> CoordinateIndex:
+        return self.structure.index
 
-        self._motif = self._get_motif_subgraph() # GET SUBGRAPH 
+    @property
+    def granularity(self) -> str:
+        return self.structure.granularity
 
-        
+    @property
+    def centre(self) -> int:
+        """Row of the centre node in the coordinate index."""
+        if self._centre is None:
+            self._centre = self.index.rows([self.centre_node])[0]
+        return self._centre
 
     @property
     def radius(self) -> float:
@@ -100,55 +144,87 @@ class StructuralMotif():
     def radius(self, radius: float) -> None:
         self._radius = radius
 
-        # Reload subgraph
-        self._motif = self._get_motif_subgraph()
+        # A smaller radius is a prefix of the existing neighbours; only 
+        # query the coordinate index again if the radius grows. 
+        if radius > self._query_radius:
+            self._query_neighbours(radius)
+
+    @property
+    def motif(self) -> "nx.Graph":
+        """Subgraph of the motif, extracted from the protein graph on demand."""
+        from graphein.protein.subgraphs import extract_subgraph_from_node_list
 
-        """
-        TODO:
-        - reload subgraph from original graph 
-        """
+        return extract_subgraph_from_node_list(self.g, self.nodes)
+
+    @property
+    def nodes(self) -> List[str]:
+        return self.index.node_ids[self.neighbours()].tolist()
 
     @property
-    def motif(self) -> nx.Graph:
-        return self._motif
+    def residue_numbers(self) -> np.ndarray:
+        """Residue numbers of the nodes in the motif."""
+        return self.residue_numbers_within(self.radius)
 
     @property
-    def nodes(self):
-        return self._motif.nodes(data=False)
-
-    def _get_motif_subgraph(self) -> nx.Graph:
-        """Get the subgraph of the motif."""
-        try:
-            g_site: Dict = self.g.nodes(data=True)[self.centre_node]
-        except: 
-            raise ValueError(f"Centre node '{self.centre_node}' not found in graph.")
+    def distances(self) -> np.ndarray:
+        """Distances of the nodes in the motif from the centre node."""
+        return self._distances[:prefix_length(self._distances, self.radius)]
+
+    def neighbours(
+        self, 
+        radius: float = None,
+    ) -> np.ndarray:
+        """Rows in the coordinate index of the residues within ``radius`` (default: the motif radius), closest first."""
+        return self._rows[:self._prefix_length(radius)]
+
+    def residue_numbers_within(
+        self,
+        radius: float,
+    ) -> np.ndarray:
+        """Residue numbers of the residues within ``radius`` of the centre node, closest first."""
+        return self._residue_numbers[:self._prefix_length(radius)]
+
+    def queried_neighbours(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+        """All neighbours queried so far: (rows, distances, residue numbers, query radius)."""
+        return self._rows, self._distances, self._residue_numbers, self._query_radius
+
+    def _prefix_length(
+        self,
+        radius: float = None,
+    ) -> int:
+        """Number of neighbours within ``radius``, querying further if needed."""
+        radius = radius if radius is not None else self.radius
+        if radius > self._query_radius:
+            self._query_neighbours(radius)
         
-        g_site_rsd: str = str(g_site['residue_name'])
-        g_site_pos: int = int(g_site['residue_number'])
+        return prefix_length(self._distances, radius)
+
+    def _query_neighbours(
+        self,
+        radius: float,
+    ) -> None:
+        """Query the coordinate index for the motif residues."""
 
         # Subgraph (radius)
-        s_g = self._get_protein_subgraph_radius(g=self.g, site=self.centre_node, r=self.radius)
+        rows, distances = self.structure.neighbour_index.query_radius([self.centre], r=radius)[0]
+        self._set_neighbours(rows, distances, query_radius=radius)
 
         # Subgraph (rsa)
         # TODO
 
-        return s_g
-
-    @property
-    def nodes(self):
-        return self._motif.nodes(data=False)
-
-    def _get_protein_subgraph_radius(self, g: nx.Graph, site: str, r: float) -> nx.Graph:
-        """Get the subgraph of the motif."""
-        # get centre point   
-        try:
-            x_y_z = node_coords(g, site)
-        except ValueError:
-            raise ValueError("Specified site isn't in correct format.")       
-        
-        # Get subgraph
-        s_g = extract_subgraph_from_point(g, centre_point=x_y_z, radius=r)
-        return s_g
+    def _set_neighbours(
+        self,
+        rows: np.ndarray,
+        distances: np.ndarray,
+        query_radius: float,
+        residue_numbers: np.ndarray = None,
+    ) -> None:
+        """Set the neighbours of the centre node, sorted by distance."""
+        self._rows = rows
+        self._distances = distances
+        self._residue_numbers = residue_numbers if residue_numbers is not None else self.index.residue_numbers[rows]
+        self._query_radius = query_radius
+        self._transforms = {}
 
     def average_difference_transform(self):
         """Average difference transform the motif."""
@@ -171,18 +247,50 @@ class StructuralMotif():
     def difference_transform(
         self,
         zeroed: bool = True, # Consecutive residues will result in 0 difference 
+        radius: float = None, # Defaults to the motif radius 
     ):
         """Difference transform the motif."""
         
-        # Iterate through all nodes in motif 
-        l = [
-            int(n.split(":")[-1])
-            for n in self.nodes
-        ]
-        l.sort()
-
-        # Calculate difference transform
-        return [l[i] - l[i-1] - int(zeroed) for i in range(1, len(l))]
+        # Residue numbers of all nodes in motif 
+        radius = radius if radius is not None else self.radius
+        n = self._prefix_length(radius)
+
+        # The transform only depends on the residues in the motif; reuse it 
+        # across the summary statistics 
+        key = (n, zeroed)
+        if key not in self._transforms:
+            diffs, _ = transform.difference_transform(
+                self._residue_numbers[:n], [0, n], zeroed=zeroed,
+            )
+            self._transforms[key] = diffs.tolist()
+        return self._transforms[key]
+
+    def sequence(
+        self,
+        radius: float = None, # Defaults to the motif radius 
+        order: str = "distance", # "distance" from the centre node, or "sequence" position 
+    ) -> str:
+        """One-letter sequence of the motif residues, the centre residue first when ordered by distance."""
+        rows = self.neighbours(radius)
+        if order == "sequence":
+            rows = rows[np.argsort(self.index.residue_numbers[rows], kind="stable")]
+        elif order != "distance":
+            raise ValueError(f"Invalid order: {order}")
+        return "".join(self.index.residue_letters[rows])
+
+    def nonlinearity_score(
+        self,
+        radius: float = None, # Defaults to the motif radius 
+        contact_threshold: float = scoring.DEFAULT_CONTACT_THRESHOLD, 
+    ) -> float:
+        """Non-linearity score of the motif; 0 if its residues are contiguous in sequence (see `kimono.motif.scoring`)."""
+        rows = self.neighbours(radius)
+        return float(scoring.nonlinearity_scores(
+            self.index.coords[rows], 
+            self.index.residue_numbers[rows], 
+            [0, len(rows)], 
+            contact_threshold=contact_threshold,
+        )[0])
 
     def pos_difference_transform(
         self,
@@ -192,8 +300,26 @@ class StructuralMotif():
         return [d for d in diff if d != 0]
             
     def __repr__(self) -> str:
-        return f"StructuralMotif({self.g.name} @ {self.centre_node}, granularity={self.granularity}, radius={self.radius})"
+        return f"StructuralMotif({self.structure} @ {self.centre_node}, granularity={self.granularity}, radius={self.radius})"
 
 
-    
-        
+def query_motifs(
+    motifs: Iterable[StructuralMotif],
+    radius: float,
+) -> None:
+    """Make sure the neighbours of each motif are known up to ``radius``.
+
+    Motifs that share a coordinate index (i.e. sites on the same protein) are 
+    queried together in one batch; motifs already queried at ``radius`` or 
+    larger are left unchanged. 
+    """
+    groups = {}
+    for motif in motifs:
+        if radius > motif._query_radius:
+            groups.setdefault(id(motif.structure), []).append(motif)
+
+    for group in groups.values():
+        index = group[0].structure.neighbour_index
+        neighbours = index.query_radius([motif.centre for motif in group], r=radius)
+        for motif, (rows, distances) in zip(group, neighbours):
+            motif._set_neighbours(rows, distances, query_radius=radius)
@@ -1,9 +1,9 @@
 """Definitions for the motif module."""
 
-from graphein.protein import ProteinGraphConfig
 
-
-# TODO: fill in the default config (atomistic?)
-DEFAULT_PROTEIN_GRAPH_CONFIG = ProteinGraphConfig(
-
-)
\ No newline at end of file
+def __getattr__(name: str):
+    # Resolved lazily, so that graphein is only imported when needed 
+    if name == "DEFAULT_PROTEIN_GRAPH_CONFIG":
+        from kimono.structure import definitions
+        return definitions.DEFAULT_PROTEIN_GRAPH_CONFIG
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
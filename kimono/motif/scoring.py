@@ -0,0 +1,118 @@
+"""Non-linearity scoring of structural motifs.
+
+A motif is "linear" if its residues are contiguous in sequence.  The
+non-linearity score is high when residues that are in contact in space are
+far apart in sequence, with the sequence separation measured *beyond* what
+the residues of the motif itself account for:
+
+    excess(i, j) = |seq_i - seq_j| - |rank_i - rank_j|
+
+where ``rank`` is the position of a residue in the motif sorted by residue
+number.  ``excess`` counts the residues between ``i`` and ``j`` in sequence
+that are not part of the motif, so it is 0 for every pair of a contiguous
+(e.g. 12345...) motif.  The score of a motif is the average ``excess`` over
+all of its pairs of residues closer than a contact threshold.
+"""
+
+import numpy as np
+
+from typing import Iterator
+
+
+"""Distance (Å) below which two residues of a motif are in contact."""
+DEFAULT_CONTACT_THRESHOLD = 8.0
+
+
+def _batches(
+    sizes: np.ndarray,
+    batch_size: int,
+    max_elements: int,
+) -> Iterator[np.ndarray]:
+    """Indices of the segments processed together.
+
+    Segments are taken in order of size, so that each batch is padded to a 
+    similar size, and a batch of ``b`` segments of up to ``n`` residues is cut 
+    once ``b * n * n`` would exceed ``max_elements`` (or ``b`` ``batch_size``). 
+    A segment larger than ``max_elements`` allows is processed on its own. 
+    """
+    order = np.argsort(sizes, kind="stable")
+    start = 0
+    while start < len(order):
+        n = max(int(sizes[order[start]]), 1)
+        end = start + 1
+        while end < len(order) and end - start < batch_size:
+            n = max(int(sizes[order[end]]), 1)
+            if (end - start + 1) * n * n > max_elements:
+                break
+            end += 1
+        yield order[start:end]
+        start = end
+
+
+def nonlinearity_scores(
+    coords: np.ndarray,
+    residue_numbers: np.ndarray,
+    offsets: np.ndarray,
+    contact_threshold: float = DEFAULT_CONTACT_THRESHOLD,
+    batch_size: int = 256, # Maximum number of motifs in a batch
+    max_elements: int = 2 ** 21, # Maximum size (batch * n * n) of the pairwise arrays of a batch
+) -> np.ndarray:
+    """Non-linearity score of every motif in a ragged (CSR) batch.
+
+    Motif ``i`` is given by ``coords[offsets[i]:offsets[i+1]]`` and the matching
+    ``residue_numbers``.  Motifs of similar size are batched together and padded 
+    to a common size ``n``, so the pairwise distances, contacts and sequence 
+    separations of a whole batch are computed as arrays of shape ``(batch, n, n)``; 
+    the batch is made smaller as ``n`` grows (see ``max_elements``), so large 
+    motifs (e.g. with atomistic granularity or large radii) do not need more 
+    memory.  Motifs without any contact pairs score 0.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    residue_numbers = np.asarray(residue_numbers, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    sizes = np.diff(offsets)
+
+    scores = np.zeros(len(sizes))
+    for batch in _batches(sizes, batch_size, max_elements):
+        n = int(sizes[batch].max(initial=0))
+        if n < 2:
+            continue
+
+        # Pad the motifs of the batch to `n` residues
+        b = len(batch)
+        positions = np.arange(n)
+        valid = positions[None, :] < sizes[batch, None]
+        flat = (offsets[batch, None] + positions[None, :])[valid]
+
+        padded_coords = np.zeros((b, n, 3))
+        padded_coords[valid] = coords[flat]
+
+        # Padding sorts last, so ranks of the motif residues are unaffected
+        padded_seq = np.full((b, n), np.iinfo(np.int64).max)
+        padded_seq[valid] = residue_numbers[flat]
+        ranks = np.argsort(np.argsort(padded_seq, axis=1, kind="stable"), axis=1)
+        padded_seq[~valid] = 0
+
+        # Pairwise squared distances, one axis at a time to keep to (b, n, n)
+        sq_dist = np.zeros((b, n, n))
+        for k in range(3):
+            delta = padded_coords[:, :, None, k] - padded_coords[:, None, :, k]
+            sq_dist += delta * delta
+
+        contacts = (
+            valid[:, :, None] & valid[:, None, :]
+            & (sq_dist < contact_threshold ** 2)
+            & np.triu(np.ones((n, n), dtype=bool), k=1)
+        )
+        excess = (
+            np.abs(padded_seq[:, :, None] - padded_seq[:, None, :])
+            - np.abs(ranks[:, :, None] - ranks[:, None, :])
+        )
+
+        n_contacts = contacts.sum(axis=(1, 2))
+        total = np.where(contacts, excess, 0).sum(axis=(1, 2))
+        scores[batch] = np.divide(
+            total, n_contacts, out=np.zeros(b), where=n_contacts > 0,
+        )
+
+    return scores
@@ -0,0 +1,109 @@
+"""Batched difference transform of many motifs at once.
+
+Residue numbers of a batch of motifs are held in a ragged (CSR) layout: one
+flat ``values`` array and an ``offsets`` array of length ``n_motifs + 1``,
+where motif ``i`` is ``values[offsets[i]:offsets[i+1]]``.
+"""
+
+import numpy as np
+
+from typing import TYPE_CHECKING, Iterable, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+"""Columns of `difference_transform_stats`."""
+STAT_COLUMNS = [
+    "n_residues",
+    "average_difference_transform",
+    "sum_difference_transform",
+    "max_difference_transform",
+    "n_nonzero_difference_transform",
+    "average_pos_difference_transform",
+]
+
+
+def to_csr(
+    arrays: Iterable[np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack a sequence of 1D arrays into (values, offsets)."""
+    arrays = [np.asarray(a) for a in arrays]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    values = np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int32)
+    return values.astype(np.int64, copy=False), offsets
+
+
+def segment_ids(
+    offsets: np.ndarray,
+) -> np.ndarray:
+    """Index of the segment each value belongs to."""
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def difference_transform(
+    values: np.ndarray,
+    offsets: np.ndarray,
+    zeroed: bool = True, # Consecutive residues will result in 0 difference
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Difference transform of every segment; returns (diffs, diff_offsets).
+
+    Each segment is sorted, and consecutive residue numbers are differenced; a
+    segment of ``n`` residues has ``n - 1`` differences.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    segments = segment_ids(offsets)
+
+    # Sort within segments (segments stay in order)
+    values = values[np.lexsort((values, segments))]
+
+    # Drop the differences across segment boundaries
+    keep = segments[1:] == segments[:-1]
+    diffs = (values[1:] - values[:-1])[keep] - int(zeroed)
+
+    counts = np.maximum(np.diff(offsets) - 1, 0)
+    diff_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(counts, out=diff_offsets[1:])
+    return diffs, diff_offsets
+
+
+def difference_transform_stats(
+    values: np.ndarray,
+    offsets: np.ndarray,
+    zeroed: bool = True,
+) -> "pd.DataFrame":
+    """Summary statistics of the difference transform of every segment.
+
+    Each transform is computed once; the average, sum, max and count of non-zero
+    differences are reduced from it together.  ``average_pos_difference_transform``
+    is the average of the non-zero differences only.  Statistics of an empty
+    transform are NaN (sum and count are 0).
+    """
+    import pandas as pd
+    diffs, diff_offsets = difference_transform(values, offsets, zeroed=zeroed)
+    n = len(diff_offsets) - 1
+    segments = segment_ids(diff_offsets)
+
+    counts = np.diff(diff_offsets)
+    total = np.bincount(segments, weights=diffs, minlength=n).astype(np.int64)
+    nonzero = np.bincount(segments, weights=diffs != 0, minlength=n).astype(np.int64)
+
+    maximum = np.full(n, np.nan)
+    filled = counts > 0
+    if filled.any():
+        maximum[filled] = np.maximum.reduceat(diffs, diff_offsets[:-1][filled])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average = np.where(filled, total / counts, np.nan)
+        pos_average = np.where(nonzero > 0, total / nonzero, np.nan)
+
+    return pd.DataFrame({
+        "n_residues": counts + 1,
+        "average_difference_transform": average,
+        "sum_difference_transform": total,
+        "max_difference_transform": maximum,
+        "n_nonzero_difference_transform": nonzero,
+        "average_pos_difference_transform": pos_average,
+    }, columns=STAT_COLUMNS)
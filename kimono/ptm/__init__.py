@@ -6,6 +6,17 @@ from kimono.utils.utils import get_node_id_string
 class PTMSite():
     """A site of a post-translational modification on a protein."""
 
+    __slots__ = (
+        "entry_name",
+        "acc_id",
+        "residue",
+        "position",
+        "ptm_type",
+        "chain_id",
+        "_node_id",
+        "_node_key",
+    )
+
     symbol_map = {
         "phosphorylation": "p",
         "ubiquitination": "u",
@@ -42,13 +53,18 @@ class PTMSite():
             raise ValueError(f"Invalid residue: {self.residue}")
 
         self._node_id: str = get_node_id_string(self.chain_id, self.residue.upper(), self.position)
+        self._node_key = (self.chain_id, self.residue, self.position)
 
     def __repr__(self):
         return f"PTMSite({self.acc_id}, {self.node_id}-{PTMSite.symbol_map[self.ptm_type.lower()]})" 
 
     @property
     def node_id(self) -> str:
-        self._node_id = get_node_id_string(self.chain_id, self.residue.upper(), self.position)
+        # Only rebuild the node ID if the site has been modified 
+        node_key = (self.chain_id, self.residue, self.position)
+        if node_key != self._node_key:
+            self._node_id = get_node_id_string(self.chain_id, self.residue.upper(), self.position)
+            self._node_key = node_key
         return self._node_id 
 
     
@@ -0,0 +1,218 @@
+"""Loading PTM sites from the dbPTM database."""
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, List, Tuple
+
+import numpy as np
+
+from kimono.ptm import PTMSite
+from kimono.ptm.sequence import SequenceIndex
+from kimono.utils.profiling import PROFILER
+
+# pandas is only imported when a dbPTM file is read
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+"""Columns of the dbPTM tab-separated files."""
+DBPTM_COLUMNS = [
+    "entry_name", 
+    "acc_id", 
+    "position", 
+    "mod_type",
+    "pmids", 
+    "seq_window",  
+]
+
+DBPTM_DTYPES = {
+    "entry_name": "str",
+    "acc_id": "str",
+    "position": "int32",
+    "mod_type": "category",
+    "pmids": "str",
+    "seq_window": "str",
+}
+
+
+def read_dbptm(
+    path: Path,
+) -> "pd.DataFrame":
+    """Read a dbPTM file with explicit column types."""
+    import pandas as pd
+    return pd.read_csv(
+        path, 
+        sep="\t",
+        names=DBPTM_COLUMNS,
+        dtype=DBPTM_DTYPES,
+    )
+
+
+def filter_dbptm(
+    df: "pd.DataFrame",
+    species_filter: List[str] = None,
+    include_isoforms: bool = False,
+    mod_type_filter: List[str] = None,
+    max_sites: int = None,
+) -> "pd.DataFrame":
+    """Filter dbPTM sites, and add the `species` and `residue` columns.
+
+    All filters are applied before the (comparatively expensive) `residue` 
+    column is created; ``max_sites`` is applied last, so that it counts the 
+    sites that remain after filtering. 
+    """
+    import pandas as pd
+    df["entry_name"] = df["entry_name"].fillna("nan")
+
+    # Add species column, which is the 2nd part of `entry_name` 
+    df["species"] = df["entry_name"].str.rsplit("_", n=1).str[-1].str.lower().astype("category")
+
+    mask = pd.Series(True, index=df.index)
+
+    # Filter by species
+    if species_filter is not None:
+        mask &= df["species"].isin(species_filter)
+
+    if not include_isoforms:
+        # Remove rows where the `acc_id` is a sequence isoform.
+        mask &= ~df["acc_id"].str.contains("-", regex=False, na=False)
+
+    # Filter by modification type (case insensitive)
+    if mod_type_filter is not None:
+        mask &= df["mod_type"].str.lower().isin([m.lower() for m in mod_type_filter])
+
+    df = df[mask]
+
+    if max_sites is not None:
+        df = df.head(max_sites) # Restrict number of sites in dataset
+
+    df = df.assign(
+        entry_name=df["entry_name"].astype("category"),
+        acc_id=df["acc_id"].astype("category"),
+        species=df["species"].cat.remove_unused_categories(),
+        residue=window_centre(df["seq_window"]).astype("category"),
+    )
+    return df
+
+
+def iter_dbptm(
+    path: Path,
+    chunk_size: int = 100000,
+    species_filter: List[str] = None,
+    include_isoforms: bool = False,
+    mod_type_filter: List[str] = None,
+    max_sites: int = None,
+    validate: Callable[["pd.DataFrame"], "pd.DataFrame"] = None, # Applied to each filtered chunk, e.g. `match_sequences`
+) -> Iterator[Tuple[str, List[PTMSite]]]:
+    """Stream the sites of a dbPTM file, grouped by accession.
+
+    The file is read ``chunk_size`` rows at a time and each chunk is filtered 
+    before any sites are created, so memory use is bounded by the chunk size 
+    regardless of the size of the file.  Yields ``(acc_id, sites)`` for each run 
+    of consecutive rows with the same accession; the last accession in a chunk 
+    is held back until the next chunk, in case its rows continue there.  
+    """
+    import pandas as pd
+    reader = pd.read_csv(
+        path, 
+        sep="\t",
+        names=DBPTM_COLUMNS,
+        dtype=DBPTM_DTYPES,
+        chunksize=chunk_size,
+    )
+
+    n_sites = 0
+    held_acc_id, held_sites = None, []
+    for chunk in reader:
+        chunk = filter_dbptm(
+            chunk, 
+            species_filter=species_filter, 
+            include_isoforms=include_isoforms, 
+            mod_type_filter=mod_type_filter,
+        )
+        if validate is not None:
+            chunk = validate(chunk)
+        if max_sites is not None:
+            chunk = chunk.head(max_sites - n_sites - len(held_sites))
+
+        for acc_id, rows in chunk.groupby("acc_id", sort=False, observed=True).indices.items():
+            sites = list(iter_sites(chunk.iloc[rows]))
+            if acc_id == held_acc_id:
+                held_sites.extend(sites)
+                continue
+
+            if held_acc_id is not None:
+                n_sites += len(held_sites)
+                yield held_acc_id, held_sites
+            held_acc_id, held_sites = acc_id, sites
+
+        if max_sites is not None and n_sites + len(held_sites) >= max_sites:
+            break
+
+    if held_acc_id is not None:
+        yield held_acc_id, held_sites
+
+
+def window_centre(
+    seq_window: "pd.Series",
+) -> "pd.Series":
+    """Get the middle residue of each sequence window.
+
+    This is the character in the `seq_window` at half the length of the window 
+    (rounded down).  Windows are grouped by length so that each group is indexed 
+    with a single vectorised string operation. 
+    """
+    import pandas as pd
+    seq_window = seq_window.fillna("nan")
+    lengths = seq_window.str.len()
+
+    residue = pd.Series(index=seq_window.index, dtype=object)
+    for length in lengths.unique():
+        mask = lengths == length
+        residue[mask] = seq_window[mask].str[int(length) // 2]
+    return residue
+
+
+def match_sequences(
+    df: "pd.DataFrame",
+    sequences: SequenceIndex,
+) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+    """Split filtered dbPTM sites by whether their residue matches their protein's sequence.
+
+    Every site is checked in one vectorised pass.  Sites of proteins without a 
+    sequence are kept (they fail later if the protein has no structure).  The 
+    mismatched sites are returned with a `sequence_residue` column: the residue 
+    at their position, or empty if the position is outside the sequence. 
+    """
+    acc_ids = df["acc_id"].astype(object).to_numpy()
+    with PROFILER.stage("validate_sequences"):
+        proteins, codes = np.unique(acc_ids, return_inverse=True)
+        sequences.load(proteins)
+        known = np.array([acc_id in sequences for acc_id in proteins], dtype=bool)[codes]
+
+        observed = sequences.residues_at(acc_ids, df["position"].to_numpy())
+        expected = df["residue"].astype(str).str.upper().to_numpy().astype("S1")
+        match = (observed == expected) | ~known
+
+    mismatched = df[~match].assign(sequence_residue=np.char.decode(observed[~match]))
+    return df[match], mismatched
+
+
+def iter_sites(
+    df: "pd.DataFrame",
+) -> Iterator[PTMSite]:
+    """Create a `PTMSite` for each row of a filtered dbPTM dataframe."""
+    columns = zip(
+        df["entry_name"].tolist(), 
+        df["acc_id"].tolist(), 
+        df["residue"].tolist(), 
+        df["position"].tolist(), 
+        df["mod_type"].tolist(),
+    )
+    for entry_name, acc_id, residue, position, mod_type in columns:
+        yield PTMSite(
+            entry_name=entry_name,
+            acc_id=acc_id, 
+            residue=residue, 
+            position=position, 
+            ptm_type=mod_type, 
+        )
@@ -0,0 +1,120 @@
+"""Protein sequences to validate PTM sites against."""
+
+import gzip
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Union
+
+import numpy as np
+
+from kimono.structure.prefetch import Prefetcher
+
+
+"""Sources of the sequences that sites are validated against (see `SequenceIndex`)."""
+SEQUENCE_SOURCES = ("structures", "fasta")
+
+
+class SequenceIndex():
+    """Sequences of proteins by UniProt accession.
+
+    Sequences are either given (e.g. read from a FASTA file) or read on demand
+    with ``reader``, e.g. from the headers of the protein's AlphaFold files;
+    `load` reads the sequences of many proteins at once in background threads.
+    Each sequence is read once.
+    """
+
+    def __init__(
+        self,
+        sequences: Dict[str, str] = None,
+        reader: Callable[[str], str] = None, # Sequence of an accession, or None if it has none
+        depth: int = 4, # Number of sequences read at once by `load`
+    ) -> None:
+
+        self._sequences: Dict[str, str] = dict(sequences) if sequences is not None else {}
+        self._unknown = set() # accessions that `reader` has no sequence for
+        self.reader = reader
+        self.depth = depth
+
+    @classmethod
+    def from_fasta(
+        cls,
+        path: Union[Path, str],
+    ) -> "SequenceIndex":
+        """Read a (optionally gzipped) FASTA file; UniProt headers (``>sp|P12345|...``) are keyed by accession."""
+        path = Path(path)
+        opener = gzip.open if path.suffix == ".gz" else open
+
+        sequences = {}
+        acc_id, lines = None, []
+        with opener(path, "rt") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith(">"):
+                    if acc_id is not None:
+                        sequences[acc_id] = "".join(lines)
+                    name = line[1:].split()[0]
+                    fields = name.split("|")
+                    acc_id, lines = fields[1] if len(fields) >= 3 else name, []
+                elif line:
+                    lines.append(line)
+        if acc_id is not None:
+            sequences[acc_id] = "".join(lines)
+        return cls(sequences)
+
+    def load(
+        self,
+        acc_ids: Iterable[str],
+    ) -> None:
+        """Read the sequences of the given accessions that have not been read yet."""
+        if self.reader is None:
+            return
+
+        missing = [
+            acc_id for acc_id in dict.fromkeys(acc_ids)
+            if acc_id not in self._sequences and acc_id not in self._unknown
+        ]
+        for acc_id, sequence in Prefetcher(self.reader, depth=self.depth).map(missing):
+            if sequence is None:
+                self._unknown.add(acc_id)
+            else:
+                self._sequences[acc_id] = sequence
+
+    def residues_at(
+        self,
+        acc_ids: np.ndarray,
+        positions: np.ndarray, # 1-based
+    ) -> np.ndarray:
+        """One-letter residue (bytes) of each protein at each position.
+
+        Empty for proteins without a sequence and positions outside it.
+        """
+        acc_ids = np.asarray(acc_ids, dtype=object)
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(acc_ids):
+            return np.array([], dtype="S1")
+
+        # All sequences of the batch are concatenated, so every site is a single lookup
+        proteins, codes = np.unique(acc_ids, return_inverse=True)
+        sequences = [self._sequences.get(acc_id, "") for acc_id in proteins]
+        lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        concatenated = np.frombuffer("".join(sequences).encode("ascii", "replace"), dtype="S1")
+
+        residues = np.full(len(acc_ids), b"", dtype="S1")
+        valid = (positions >= 1) & (positions <= lengths[codes])
+        residues[valid] = concatenated[offsets[codes[valid]] + positions[valid] - 1]
+        return residues
+
+    def get(
+        self,
+        acc_id: str,
+    ) -> str:
+        return self._sequences.get(acc_id)
+
+    def __contains__(self, acc_id: str) -> bool:
+        return acc_id in self._sequences
+
+    def __len__(self) -> int:
+        return len(self._sequences)
+
+    def __repr__(self) -> str:
+        return f"SequenceIndex(n_sequences={len(self)})"
@@ -0,0 +1,164 @@
+"""Columnar storage for large collections of PTM sites."""
+
+from typing import TYPE_CHECKING, Dict, Iterator, List, Sequence, Union
+
+import numpy as np
+
+from kimono.protein.data import protein_letters_1to3
+from kimono.ptm import PTMSite
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+"""1-letter residue codes, indexed by the `residue` column of a `PTMSiteTable`."""
+RESIDUE_ALPHABET: np.ndarray = np.array(sorted(protein_letters_1to3))
+
+_RESIDUE_CODES: Dict[str, int] = {r: i for i, r in enumerate(RESIDUE_ALPHABET)}
+_RESIDUES_3: np.ndarray = np.array([protein_letters_1to3[r].upper() for r in RESIDUE_ALPHABET])
+
+
+class PTMSiteTable():
+    """A collection of PTM sites stored as columns.
+
+    Accessions, entry names and PTM types are categoricals, positions are 
+    ``int32`` and residues are ``uint8`` codes into ``RESIDUE_ALPHABET``.  
+    Indexing with an integer returns a `PTMSite` for that row; indexing with a 
+    slice or array of rows returns a `PTMSiteTable` sharing the same categories. 
+    """
+
+    def __init__(
+        self,
+        entry_name: "pd.Categorical",
+        acc_id: "pd.Categorical",
+        position: np.ndarray,
+        residue: np.ndarray, # codes into `RESIDUE_ALPHABET`
+        ptm_type: "pd.Categorical",
+        chain_id: str = 'A',
+    ) -> None:
+        import pandas as pd
+
+        self.entry_name: "pd.Categorical" = pd.Categorical(entry_name)
+        self.acc_id: "pd.Categorical" = pd.Categorical(acc_id)
+        self.position: np.ndarray = np.asarray(position, dtype=np.int32)
+        self.residue: np.ndarray = np.asarray(residue, dtype=np.uint8)
+        self.ptm_type: "pd.Categorical" = pd.Categorical(ptm_type)
+        self.chain_id: str = chain_id
+
+        if self.chain_id !='A':
+            raise NotImplementedError("Only chain A is supported for now.")
+
+        n = len(self.position)
+        if not all(len(c) == n for c in (self.entry_name, self.acc_id, self.residue, self.ptm_type)):
+            raise ValueError("All columns must have the same length.")
+
+    @classmethod
+    def from_dataframe(
+        cls,
+        df: "pd.DataFrame",
+    ) -> "PTMSiteTable":
+        """Create a table from a (filtered) dbPTM dataframe."""
+        residue = df["residue"].astype("category")
+        codes = np.array([
+            _RESIDUE_CODES.get(str(r).upper(), -1) for r in residue.cat.categories
+        ], dtype=np.int16)
+
+        invalid = codes < 0
+        if invalid.any():
+            raise ValueError(f"Invalid residue(s): {list(residue.cat.categories[invalid])}")
+
+        return cls(
+            entry_name=df["entry_name"].astype("category").array,
+            acc_id=df["acc_id"].astype("category").array,
+            position=df["position"].to_numpy(),
+            residue=codes[residue.cat.codes.to_numpy()],
+            ptm_type=df["mod_type"].astype("category").array,
+        )
+
+    def residues(self) -> np.ndarray:
+        """1-letter residue code of each site."""
+        return RESIDUE_ALPHABET[self.residue]
+
+    def node_ids(self) -> np.ndarray:
+        """Node ID of each site (e.g. ``A:SER:15``)."""
+        import pandas as pd
+        node_ids = (
+            self.chain_id.upper() + ":" 
+            + pd.Series(_RESIDUES_3[self.residue], dtype=object) + ":" 
+            + pd.Series(self.position).astype(str)
+        )
+        return node_ids.to_numpy(dtype=object)
+
+    def motif_keys(self) -> np.ndarray:
+        """Key of each site's motif in `MotifAnalysis.motifs` (``{entry_name}-{node_id}``)."""
+        import pandas as pd
+        keys = pd.Series(np.asarray(self.entry_name, dtype=object), dtype=object) + "-" + self.node_ids()
+        return keys.to_numpy(dtype=object)
+
+    def groups(self) -> Dict[str, np.ndarray]:
+        """Rows of the sites on each protein, in order of first appearance."""
+        import pandas as pd
+        codes = pd.Series(self.acc_id.codes)
+        return {
+            self.acc_id.categories[code]: rows 
+            for code, rows in codes.groupby(codes, sort=False).indices.items()
+        }
+
+    def take(
+        self,
+        rows: Union[slice, Sequence[int], np.ndarray],
+    ) -> "PTMSiteTable":
+        """Select rows of the table; categories are shared with this table."""
+        if not isinstance(rows, slice):
+            rows = np.asarray(rows, dtype=np.intp)
+        return PTMSiteTable(
+            entry_name=self.entry_name[rows],
+            acc_id=self.acc_id[rows],
+            position=self.position[rows],
+            residue=self.residue[rows],
+            ptm_type=self.ptm_type[rows],
+            chain_id=self.chain_id,
+        )
+
+    def to_list(self) -> List[PTMSite]:
+        """Create a `PTMSite` for every row."""
+        return list(self)
+
+    def __getitem__(
+        self,
+        i: Union[int, slice, Sequence[int], np.ndarray],
+    ) -> Union[PTMSite, "PTMSiteTable"]:
+        if isinstance(i, (int, np.integer)):
+            return PTMSite(
+                entry_name=self.entry_name[i],
+                acc_id=self.acc_id[i],
+                residue=RESIDUE_ALPHABET[self.residue[i]],
+                position=int(self.position[i]),
+                ptm_type=self.ptm_type[i],
+                chain_id=self.chain_id,
+            )
+        return self.take(i)
+
+    def __iter__(self) -> Iterator[PTMSite]:
+        columns = zip(
+            np.asarray(self.entry_name, dtype=object), 
+            np.asarray(self.acc_id, dtype=object), 
+            RESIDUE_ALPHABET[self.residue].tolist(), 
+            self.position.tolist(), 
+            np.asarray(self.ptm_type, dtype=object),
+        )
+        for entry_name, acc_id, residue, position, ptm_type in columns:
+            yield PTMSite(
+                entry_name=entry_name,
+                acc_id=acc_id, 
+                residue=residue, 
+                position=position, 
+                ptm_type=ptm_type, 
+                chain_id=self.chain_id,
+            )
+
+    def __len__(self) -> int:
+        return len(self.position)
+
+    def __repr__(self) -> str:
+        return f"PTMSiteTable(n_sites={len(self)}, n_proteins={len(self.acc_id.unique())})"
@@ -0,0 +1,287 @@
+"""Classes for loading and sharing protein structures."""
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Tuple, Union
+
+from kimono.structure.definitions import GRANULARITIES, STRUCTURE_BACKENDS
+from kimono.structure.index import AtomIndex, CoordinateIndex
+from kimono.structure.pdb import PDBAtoms, PDBResidues, read_atom_records
+from kimono.structure.store import ResidueStore, structure_name
+from kimono.utils.profiling import PROFILER
+
+if TYPE_CHECKING:
+    import networkx as nx
+    import numpy as np
+    from graphein.protein import ProteinGraphConfig
+
+
+class ProteinStructure():
+    """A protein structure: its graph and a coordinate index over its residues.
+
+    The structure file is only parsed when the graph, residues or index is first 
+    used.  With the ``coordinates`` backend, or once the residues have been read 
+    (e.g. for their pLDDT), the index is built directly from the residue coordinates 
+    and no graph is constructed unless ``g`` is accessed. 
+
+    ``residue_offset`` renumbers the residues read from the file (and ``residues`` and ``atoms``), 
+    e.g. so that the residues of an AlphaFold fragment are numbered as in the full 
+    protein. 
+
+    With ``atomistic`` granularity, motifs are found with an index over the heavy 
+    atoms of the structure file (see `AtomIndex`), which is mapped onto the rows of 
+    the residue index; the atoms are read from the file unless given. 
+    """
+
+    def __init__(
+        self,
+        structure_path: Path = None,
+        g: "nx.Graph" = None,
+        index: CoordinateIndex = None,
+        graph_config: "ProteinGraphConfig" = None, # Defaults to `DEFAULT_PROTEIN_GRAPH_CONFIG` 
+        backend: str = "graph", # See `STRUCTURE_BACKENDS` 
+        residues: PDBResidues = None, 
+        atoms: PDBAtoms = None, # Heavy atoms, if already read (e.g. for atomistic granularity)
+        residue_offset: int = 0, # Added to the residue numbers read from `structure_path`
+        granularity: str = "residue", # See `GRANULARITIES` 
+    ) -> None:
+
+        if structure_path is None and g is None:
+            raise ValueError("Must provide either a graph or a structure path.")
+
+        if backend not in STRUCTURE_BACKENDS:
+            raise ValueError(f"Invalid structure backend: {backend}")
+
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Invalid granularity: {granularity}")
+        if granularity == "atomistic" and structure_path is None and atoms is None:
+            raise ValueError("Atomistic granularity needs a structure path to read atoms from.")
+
+        self.structure_path = structure_path
+        self.graph_config = graph_config
+        self.backend = backend
+        self.residue_offset = residue_offset
+        self.granularity = granularity
+
+        self._g: "nx.Graph" = g
+        self._index: CoordinateIndex = index
+        self._residues: PDBResidues = residues.renumbered(residue_offset) if residues is not None else None
+        self._atoms: PDBAtoms = atoms.renumbered(residue_offset) if atoms is not None else None
+        self._atom_index: AtomIndex = None
+
+    @property
+    def g(self) -> "nx.Graph":
+        """Graph of the structure, constructed on first use."""
+        if self._g is None:
+            from graphein.protein.graphs import construct_graph
+            from kimono.structure.definitions import DEFAULT_PROTEIN_GRAPH_CONFIG
+
+            config = self.graph_config if self.graph_config is not None else DEFAULT_PROTEIN_GRAPH_CONFIG
+            with PROFILER.stage("build_graph"):
+                self._g = construct_graph(pdb_path=self.structure_path, config=config)
+                if self.residue_offset:
+                    self._g = _renumber_graph(self._g, self.residue_offset)
+            if PROFILER.enabled:
+                PROFILER.count("structure_files_read")
+                PROFILER.count("structure_bytes_read", Path(self.structure_path).stat().st_size)
+        return self._g
+
+    @property
+    def residues(self) -> PDBResidues:
+        """Residues read directly from the structure file (no graph), on first use."""
+        if self._residues is None:
+            records = read_atom_records(self.structure_path)
+            self._residues = PDBResidues.from_records(records).renumbered(self.residue_offset)
+            if self.granularity == "atomistic" and self._atoms is None:
+                self._atoms = self._parse_atoms(records)
+        return self._residues
+
+    @property
+    def index(self) -> CoordinateIndex:
+        """Coordinate index of the structure, built on first use."""
+        if self._index is None:
+            if self._g is None and (self.backend == "coordinates" or self._residues is not None):
+                residues = self.residues
+                with PROFILER.stage("build_index"):
+                    self._index = CoordinateIndex.from_residues(residues)
+            else:
+                g = self.g
+                with PROFILER.stage("build_index"):
+                    self._index = CoordinateIndex.from_graph(g)
+        return self._index
+
+    def use_index(
+        self,
+        index: CoordinateIndex,
+    ) -> CoordinateIndex:
+        """Use an index built elsewhere (e.g. by a worker process), unless one has been built already.
+
+        Returns the index of the structure. 
+        """
+        if self._index is None:
+            self._index = index
+        return self._index
+
+    @property
+    def atoms(self) -> PDBAtoms:
+        """Heavy atoms read from the structure file, on first use.
+
+        Residues and atoms are parsed from a single read of the file: with the 
+        ``coordinates`` backend, the residues are taken from the same records if 
+        they have not been read yet (and vice versa, see `residues`). 
+        """
+        if self._atoms is None:
+            records = read_atom_records(self.structure_path)
+            self._atoms = self._parse_atoms(records)
+            if self._residues is None and self._g is None and self.backend == "coordinates":
+                self._residues = PDBResidues.from_records(records).renumbered(self.residue_offset)
+        return self._atoms
+
+    def _parse_atoms(
+        self,
+        records: "np.ndarray",
+    ) -> PDBAtoms:
+        with PROFILER.stage("read_atoms"):
+            return PDBAtoms.from_records(records).renumbered(self.residue_offset)
+
+    @property
+    def atom_index(self) -> AtomIndex:
+        """Index of the heavy atoms of the structure, mapped onto the residue index, built on first use."""
+        if self._atom_index is None:
+            atoms = self.atoms
+            index = self.index
+            with PROFILER.stage("build_atom_index"):
+                self._atom_index = AtomIndex.from_atoms(atoms, index)
+        return self._atom_index
+
+    @property
+    def neighbour_index(self) -> Union[CoordinateIndex, AtomIndex]:
+        """Index that motifs are queried from: the residue or atom index, by granularity."""
+        return self.atom_index if self.granularity == "atomistic" else self.index
+
+    def release(self) -> None:
+        """Free the graph, residues and atoms parsed from the structure file.
+
+        The coordinate index is kept, since motifs refer to its rows; anything 
+        else is parsed again from the file if it is used later.  Structures 
+        without a file (e.g. built from a graph or given residues) keep everything. 
+        """
+        if self.structure_path is None:
+            return
+        self._g = None
+        self._residues = None
+        self._atoms = None
+        self._atom_index = None
+
+    @property
+    def is_parsed(self) -> bool:
+        return self._g is not None
+
+    def __repr__(self) -> str:
+        name = self._g.name if self._g is not None else self.structure_path
+        return f"ProteinStructure({name})"
+
+
+def _renumber_graph(
+    g: "nx.Graph",
+    offset: int,
+) -> "nx.Graph":
+    """Add ``offset`` to the residue number of every node (and its ID, e.g. ``A:SER:15``)."""
+    import networkx as nx
+
+    mapping = {}
+    for n, d in g.nodes(data=True):
+        d["residue_number"] += offset
+        fields = n.split(":")
+        fields[2] = str(d["residue_number"])
+        mapping[n] = ":".join(fields)
+    return nx.relabel_nodes(g, mapping, copy=True)
+
+
+class StructureRegistry():
+    """Registry of parsed protein structures.
+
+    Structures are keyed by UniProt accession, model version and fragment, so that every 
+    PTM site on the same protein (fragment) shares a single parsed structure and coordinate 
+    index.  With a ``ResidueStore``, residues and coordinate indexes are read from 
+    the store and structure files are only parsed if a graph is needed.  The least 
+    recently used structures are evicted once ``maxsize`` structures are held, and 
+    release their graph, residues and atoms (see `ProteinStructure.release`).  
+    Motifs hold a reference to their structure, so the coordinate index of an 
+    evicted structure is only freed once its motifs are. 
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 32, # Maximum number of structures whose graph, residues and atoms are held in memory 
+        graph_config: "ProteinGraphConfig" = None, # Defaults to `DEFAULT_PROTEIN_GRAPH_CONFIG` 
+        store: ResidueStore = None, # If given, coordinate indexes are read from the store instead of parsed 
+        backend: str = "graph", # See `STRUCTURE_BACKENDS` 
+        granularity: str = "residue", # See `GRANULARITIES` 
+    ) -> None:
+
+        if maxsize is not None and maxsize < 1:
+            raise ValueError(f"Invalid registry size: {maxsize}")
+
+        self.maxsize = maxsize
+        self.graph_config = graph_config
+        self.store = store
+        self.backend = backend
+        self.granularity = granularity
+
+        self._structures: OrderedDict = OrderedDict()
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(
+        self,
+        acc_id: str,
+        model_version: int,
+        structure_path: Path,
+        residues: PDBResidues = None, # Residues already read from `structure_path` (e.g. by a `Prefetcher`)
+        fragment: int = 1, # AlphaFold fragment of the protein in `structure_path`
+        residue_offset: int = 0, # See `ProteinStructure`
+    ) -> ProteinStructure:
+        """Get a structure; it is parsed when its graph or index is first used."""
+        key: Tuple[str, int, int] = (acc_id, model_version, fragment)
+
+        if key in self._structures:
+            self.hits += 1
+            self._structures.move_to_end(key)
+            return self._structures[key]
+
+        self.misses += 1
+        if self.store is not None and structure_name(structure_path) in self.store:
+            residues = self.store.residues(structure_name(structure_path))
+
+        structure = ProteinStructure(
+            structure_path=structure_path, 
+            graph_config=self.graph_config, 
+            backend=self.backend,
+            residues=residues,
+            residue_offset=residue_offset,
+            granularity=self.granularity,
+        )
+        self._structures[key] = structure
+
+        # Evict least recently used structures 
+        if self.maxsize is not None:
+            while len(self._structures) > self.maxsize:
+                _, evicted = self._structures.popitem(last=False)
+                evicted.release()
+
+        return structure
+
+    def clear(self) -> None:
+        """Remove all structures from the registry."""
+        self._structures.clear()
+
+    def __contains__(self, key: Tuple[str, int, int]) -> bool:
+        return key in self._structures
+
+    def __len__(self) -> int:
+        return len(self._structures)
+
+    def __repr__(self) -> str:
+        return f"StructureRegistry(size={len(self)}, maxsize={self.maxsize}, hits={self.hits}, misses={self.misses})"
@@ -0,0 +1,178 @@
+"""Index of the AlphaFold structure files in a directory."""
+
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Union
+
+import numpy as np
+
+from kimono.structure.pdb import read_pdb_sequence
+
+
+"""AlphaFold DB file names, e.g. ``AF-P12345-F1-model_v3.pdb.gz``."""
+AF_FILENAME_PATTERN = re.compile(r"^AF-(?P<acc_id>.+)-F(?P<fragment>\d+)-model_v(?P<version>\d+)\.(?P<extension>.+)$")
+
+"""Proteins longer than 2700 residues are predicted as overlapping fragments of
+1400 residues, each starting 200 residues after the previous one.  The residues
+of every fragment are numbered from 1."""
+FRAGMENT_LENGTH = 1400
+FRAGMENT_STEP = 200
+
+
+class AlphaFoldFile(NamedTuple):
+    """A structure file of (a fragment of) a protein."""
+    path: Path
+    acc_id: str
+    fragment: int # 1-based
+    model_version: int
+
+    @property
+    def offset(self) -> int:
+        """Residue number in the full protein of residue 0 of the fragment."""
+        return FRAGMENT_STEP * (self.fragment - 1)
+
+    def covers(
+        self,
+        position: int,
+    ) -> bool:
+        """Whether the fragment holds the residue at ``position`` of the full protein."""
+        return self.offset < position <= self.offset + FRAGMENT_LENGTH
+
+
+def central_fragments(
+    files: List[AlphaFoldFile], # Fragments of one protein, in order 
+    positions: Sequence[int],
+    ignore_fragments: bool = False, # If True, only the first fragment (F1) is considered
+) -> np.ndarray:
+    """Index in ``files`` of the fragment in which each position is furthest from either end, or -1.
+
+    A protein with a single file (F1) holds every residue.  Of fragments in which 
+    a position is equally central, the first is chosen. 
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(files) == 1 and files[0].fragment == 1:
+        return np.zeros(len(positions), dtype=np.intp)
+
+    best = np.full(len(positions), -1, dtype=np.intp)
+    best_margin = np.full(len(positions), -1, dtype=np.int64)
+    for i, af_file in enumerate(files):
+        if ignore_fragments and af_file.fragment != 1:
+            continue
+        margin = np.minimum(positions - af_file.offset, af_file.offset + FRAGMENT_LENGTH - positions)
+        margin[~((positions > af_file.offset) & (positions <= af_file.offset + FRAGMENT_LENGTH))] = -1
+        better = margin > best_margin
+        best[better], best_margin[better] = i, margin[better]
+    return best
+
+
+class AlphaFoldIndex():
+    """The AlphaFold files of every protein in a directory, listed once.
+
+    The directory is listed a single time (or the file names are read from a
+    manifest, e.g. the listing of a downloaded archive), so no file is checked
+    on disk per site.  For each protein one model version is used:
+    ``model_version`` if given, otherwise the latest present.  Sites are mapped
+    to the fragment in which they are furthest from the ends (see `locate`).
+    """
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        file_extension: str = "pdb.gz",
+        model_version: int = None, # If None, the latest version of each protein
+        ignore_fragments: bool = False, # If True, only sites in the first fragment (F1) of each protein are located
+        manifest: Union[Path, str] = None, # Text file of file names in `path`, one per line
+    ) -> None:
+
+        self.path = Path(path)
+        self.file_extension = file_extension
+        self.model_version = model_version
+        self.ignore_fragments = ignore_fragments
+
+        if manifest is not None:
+            with open(manifest) as f:
+                names = [Path(line.strip()).name for line in f if line.strip()]
+        else:
+            names = [entry.name for entry in os.scandir(self.path)]
+
+        self._files: Dict[str, List[AlphaFoldFile]] = self._index(names)
+
+    def _index(
+        self,
+        names: Iterable[str],
+    ) -> Dict[str, List[AlphaFoldFile]]:
+        """Fragments of the chosen model version of each protein, in fragment order."""
+        versions: Dict[str, Dict[int, List[AlphaFoldFile]]] = {}
+        for name in names:
+            match = AF_FILENAME_PATTERN.match(name)
+            if match is None or match["extension"] != self.file_extension:
+                continue
+
+            version = int(match["version"])
+            fragment = int(match["fragment"])
+            if self.model_version is not None and version != self.model_version:
+                continue
+
+            af_file = AlphaFoldFile(self.path / name, match["acc_id"], fragment, version)
+            versions.setdefault(af_file.acc_id, {}).setdefault(version, []).append(af_file)
+
+        return {
+            acc_id: sorted(files[max(files)], key=lambda af_file: af_file.fragment)
+            for acc_id, files in versions.items()
+        }
+
+    def files(
+        self,
+        acc_id: str,
+    ) -> List[AlphaFoldFile]:
+        """Fragments of a protein, in order (empty if it has no structure)."""
+        return self._files.get(acc_id, [])
+
+    def locate(
+        self,
+        acc_id: str,
+        position: int,
+    ) -> AlphaFoldFile:
+        """File holding the residue at ``position`` of a protein, or None.
+
+        A protein with a single file (F1) holds every residue.  Of several
+        overlapping fragments, the one in which the residue is furthest from
+        either end is chosen, so that its motif is not cut off.
+        """
+        files = self.files(acc_id)
+        if len(files) == 1 and files[0].fragment == 1:
+            return files[0]
+
+        i = central_fragments(files, [position], ignore_fragments=self.ignore_fragments)[0]
+        return files[i] if i >= 0 else None
+
+    def sequence(
+        self,
+        acc_id: str,
+    ) -> str:
+        """Sequence of a protein, joined from the sequences of its fragments (None if it has no structure).
+
+        Residues of missing fragments are ``X``. 
+        """
+        files = self.files(acc_id)
+        if not files:
+            return None
+
+        sequence = ""
+        for af_file in files:
+            sequence = sequence[:af_file.offset].ljust(af_file.offset, "X") + read_pdb_sequence(af_file.path)
+        return sequence
+
+    def keys(self) -> List[str]:
+        return list(self._files)
+
+    def __contains__(self, acc_id: str) -> bool:
+        return acc_id in self._files
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __repr__(self) -> str:
+        n_files = sum(len(files) for files in self._files.values())
+        return f"AlphaFoldIndex({self.path}, n_proteins={len(self)}, n_files={n_files})"
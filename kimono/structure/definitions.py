@@ -0,0 +1,48 @@
+"""Definitions for the structure module."""
+
+
+"""Ways of building the coordinate index of a structure.
+
+- ``graph``: from the nodes of a graphein protein graph.
+- ``coordinates``: directly from the residue coordinates in the structure file, 
+  without constructing a graph (graphein is only imported if a graph is requested).
+"""
+STRUCTURE_BACKENDS = ("graph", "coordinates")
+
+
+"""Granularities of motifs.
+
+- ``residue``: residues whose node (C-alpha) is within the radius of the centre node.
+- ``atomistic``: residues with any heavy atom within the radius of the modified 
+  atom of the centre residue (see `MODIFIED_ATOMS`). 
+"""
+GRANULARITIES = ("residue", "atomistic")
+
+"""Modified (side-chain oxygen) atom of each phosphorylatable residue.  Motifs of 
+other residues are centred on their C-alpha."""
+MODIFIED_ATOMS = {
+    "SER": "OG",
+    "THR": "OG1",
+    "TYR": "OH",
+}
+
+"""Modified residues (HETATM records) of experimental structures, and the residue each modifies."""
+MODIFIED_RESIDUES = {
+    "SEP": "SER",
+    "TPO": "THR",
+    "PTR": "TYR",
+}
+
+
+def __getattr__(name: str):
+    # graphein is only imported when the default graph config is first used 
+    if name == "DEFAULT_PROTEIN_GRAPH_CONFIG":
+        from graphein.protein import ProteinGraphConfig
+
+        # TODO: fill in the default config (atomistic?)
+        config = ProteinGraphConfig(
+
+        )
+        globals()[name] = config
+        return config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,185 @@
+"""Experimental (PDB) structures of proteins, numbered as in their UniProt sequence."""
+
+import csv
+import difflib
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple, Union
+
+import numpy as np
+
+from kimono.protein.data import protein_letters_3to1
+from kimono.structure.definitions import MODIFIED_RESIDUES
+from kimono.structure.pdb import PDBAtoms, PDBResidues, _column, read_atom_records
+
+
+"""PDB file names, e.g. ``1abc.pdb``, ``1ABC.pdb.gz`` or ``pdb1abc.ent.gz``."""
+PDB_FILENAME_PATTERN = re.compile(r"^(?:pdb)?(?P<pdb_id>[0-9][a-z0-9]{3})\.(?:pdb|ent)(?:\.gz)?$", re.IGNORECASE)
+
+"""Chain that the residues of experimental structures are relabelled to, as in AlphaFold models."""
+REFERENCE_CHAIN_ID = "A"
+
+
+class PDBChain(NamedTuple):
+    """A chain of an experimental structure file, mapped to a UniProt accession."""
+    path: Path
+    pdb_id: str # lower case
+    chain_id: str
+    acc_id: str
+
+
+class PDBIndex():
+    """The experimental structure files in a directory, and the UniProt accession of their chains.
+
+    The directory is listed once.  Chains are mapped to accessions by a SIFTS
+    ``pdb_chain_uniprot.tsv`` file (or any tab-separated file with the columns
+    ``PDB``, ``CHAIN`` and ``SP_PRIMARY``); chains without a file are left out.
+    """
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        mapping_path: Union[Path, str],
+    ) -> None:
+
+        self.path = Path(path)
+
+        files = {}
+        for entry in os.scandir(self.path):
+            match = PDB_FILENAME_PATTERN.match(entry.name)
+            if match is not None:
+                files.setdefault(match["pdb_id"].lower(), self.path / entry.name)
+
+        self._chains: Dict[str, List[PDBChain]] = {}
+        seen = set()
+        for pdb_id, chain_id, acc_id in _read_mapping(mapping_path):
+            pdb_id = pdb_id.lower()
+            if pdb_id in files and (pdb_id, chain_id, acc_id) not in seen:
+                seen.add((pdb_id, chain_id, acc_id))
+                self._chains.setdefault(acc_id, []).append(PDBChain(files[pdb_id], pdb_id, chain_id, acc_id))
+
+        for chains in self._chains.values():
+            chains.sort(key=lambda chain: (chain.pdb_id, chain.chain_id))
+
+    def chains(
+        self,
+        acc_id: str,
+    ) -> List[PDBChain]:
+        """Chains of experimental structures of a protein (empty if it has none)."""
+        return self._chains.get(acc_id, [])
+
+    def keys(self) -> List[str]:
+        return list(self._chains)
+
+    def __contains__(self, acc_id: str) -> bool:
+        return acc_id in self._chains
+
+    def __len__(self) -> int:
+        return len(self._chains)
+
+    def __repr__(self) -> str:
+        n_chains = sum(len(chains) for chains in self._chains.values())
+        return f"PDBIndex({self.path}, n_proteins={len(self)}, n_chains={n_chains})"
+
+
+def _read_mapping(
+    path: Union[Path, str],
+) -> List[Tuple[str, str, str]]:
+    """(PDB ID, chain, accession) of each row of a SIFTS chain mapping."""
+    with open(path, newline="") as f:
+        lines = (line for line in f if not line.startswith("#"))
+        reader = csv.reader(lines, delimiter="\t")
+        header = next(reader, [])
+        try:
+            columns = [header.index(name) for name in ("PDB", "CHAIN", "SP_PRIMARY")]
+        except ValueError:
+            raise ValueError(f"{path} must have the columns PDB, CHAIN and SP_PRIMARY")
+        return [tuple(row[i] for i in columns) for row in reader if len(row) > max(columns)]
+
+
+def align_numbering(
+    reference: str,
+    residues: PDBResidues,
+    min_block: int = 3, # Shorter runs of matching residues are not aligned
+) -> np.ndarray:
+    """Position (1-based) in ``reference`` of each residue, or 0 if it is not aligned.
+
+    The sequence of the residues (in file order, with gaps where residues are
+    not observed) is aligned to the reference sequence by its runs of identical
+    residues, so any numbering scheme of the file (offsets, insertion codes) is
+    mapped onto the reference.
+    """
+    sequence = "".join(
+        protein_letters_3to1.get(name.title(), "X")
+        for name in np.char.decode(residues.residue_names).tolist()
+    )
+    matcher = difflib.SequenceMatcher(None, sequence, reference, autojunk=False)
+
+    numbers = np.zeros(len(sequence), dtype=np.int32)
+    for a, b, size in matcher.get_matching_blocks():
+        if size >= min_block:
+            numbers[a:a + size] = np.arange(b + 1, b + size + 1)
+    return numbers
+
+
+def read_pdb_chain(
+    chain: PDBChain,
+    reference: str, # Sequence of the protein, e.g. of its AlphaFold model
+    atoms: bool = False, # Also read the heavy atoms of the chain
+    min_block: int = 3,
+) -> Tuple[PDBResidues, PDBAtoms]:
+    """Residues (and heavy atoms) of a chain of an experimental structure, numbered as in ``reference``.
+
+    Modified residues (`MODIFIED_RESIDUES`, e.g. phosphoserine) are read as the
+    residue they modify.  Residues that are not aligned to the reference (see
+    `align_numbering`) are dropped, and the chain is relabelled to
+    `REFERENCE_CHAIN_ID`, so that a site has the same node ID as in the AlphaFold
+    model.  ``plddt`` holds the B-factors of the structure.
+    """
+    records = read_atom_records(chain.path, records=(b"ATOM", b"HETATM"))
+
+    # Modified residues are kept (renamed), other HETATM records are not
+    names = np.char.strip(_column(records, 17, 20))
+    keep = (np.char.strip(_column(records, 0, 6)) == b"ATOM") | np.isin(names, [name.encode() for name in MODIFIED_RESIDUES])
+    records, names = records[keep], names[keep]
+    for name, parent in MODIFIED_RESIDUES.items():
+        records[names == name.encode(), 17:20] = np.frombuffer(parent.encode(), dtype="S1")
+
+    records = records[_column(records, 21, 22) == chain.chain_id.encode()]
+    if not len(records):
+        raise ValueError(f"Chain {chain.chain_id} not found in {chain.path}")
+
+    residues = PDBResidues.from_records(records)
+    numbers = align_numbering(reference, residues, min_block=min_block)
+    aligned = numbers > 0
+    n = int(aligned.sum())
+
+    chain_residues = PDBResidues(
+        chain_ids=np.full(n, REFERENCE_CHAIN_ID.encode(), dtype="S1"),
+        residue_names=residues.residue_names[aligned],
+        residue_numbers=numbers[aligned],
+        insertions=np.full(n, b"", dtype="S1"),
+        coords=residues.coords[aligned],
+        centroids=residues.centroids[aligned],
+        plddt=residues.plddt[aligned],
+    )
+    if not atoms:
+        return chain_residues, None
+
+    # Atoms are numbered through the residue they belong to
+    renumber = dict(zip(residues.node_ids()[aligned].tolist(), numbers[aligned].tolist()))
+    chain_atoms = PDBAtoms.from_records(records)
+    atom_numbers = np.array([renumber.get(node_id, 0) for node_id in chain_atoms.node_ids()], dtype=np.int32)
+    kept = atom_numbers > 0
+    kept_atoms = kept[chain_atoms.residues]
+
+    return chain_residues, PDBAtoms(
+        atom_names=chain_atoms.atom_names[kept_atoms],
+        residues=(np.cumsum(kept) - 1)[chain_atoms.residues[kept_atoms]],
+        coords=chain_atoms.coords[kept_atoms],
+        chain_ids=np.full(int(kept.sum()), REFERENCE_CHAIN_ID.encode(), dtype="S1"),
+        residue_names=chain_atoms.residue_names[kept],
+        residue_numbers=atom_numbers[kept],
+        insertions=np.full(int(kept.sum()), b"", dtype="S1"),
+    )
@@ -0,0 +1,239 @@
+"""Spatial indexes over the residues and atoms of a protein structure."""
+
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from kimono.protein.data import protein_letters_3to1
+from kimono.structure.definitions import MODIFIED_ATOMS
+from kimono.structure.pdb import PDBAtoms, PDBResidues
+
+# scipy is only imported when the KD-tree is first built
+if TYPE_CHECKING:
+    import networkx as nx
+    from scipy.spatial import cKDTree
+
+
+def prefix_length(
+    distances: np.ndarray,
+    r: float,
+) -> int:
+    """Number of sorted distances that are strictly less than ``r``."""
+    return int(np.searchsorted(distances, r, side="left"))
+
+
+class CoordinateIndex():
+    """Coordinates of every residue (node) in a protein, with a KD-tree for radius queries.
+
+    Residues are addressed by their row in the coordinate array; ``node_ids`` and 
+    ``residue_numbers`` map rows back to graph nodes and sequence positions. 
+    """
+
+    def __init__(
+        self,
+        node_ids: Sequence[str],
+        coords: np.ndarray,
+        residue_numbers: np.ndarray,
+    ) -> None:
+
+        self.node_ids: np.ndarray = np.asarray(node_ids, dtype=object)
+        self.coords: np.ndarray = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.residue_numbers: np.ndarray = np.asarray(residue_numbers, dtype=np.int32)
+
+        if not (len(self.node_ids) == len(self.coords) == len(self.residue_numbers)):
+            raise ValueError("Node IDs, coordinates and residue numbers must have the same length.")
+
+        self._rows: Dict[str, int] = {n: i for i, n in enumerate(self.node_ids)}
+        self._tree: "cKDTree" = None
+        self._residue_letters: np.ndarray = None
+
+    @classmethod
+    def from_graph(
+        cls,
+        g: "nx.Graph",
+    ) -> "CoordinateIndex":
+        """Build an index from the nodes of a protein graph."""
+        node_ids = list(g.nodes)
+        coords = np.array([g.nodes[n]["coords"] for n in node_ids], dtype=np.float64)
+        residue_numbers = np.array([g.nodes[n]["residue_number"] for n in node_ids], dtype=np.int32)
+        return cls(node_ids=node_ids, coords=coords, residue_numbers=residue_numbers)
+
+    @classmethod
+    def from_residues(
+        cls,
+        residues: PDBResidues,
+    ) -> "CoordinateIndex":
+        """Build an index from residues read directly from a structure file or store."""
+        return cls(
+            node_ids=residues.node_ids(), 
+            coords=residues.coords, 
+            residue_numbers=residues.residue_numbers,
+        )
+
+    @property
+    def tree(self) -> "cKDTree":
+        """KD-tree over the residue coordinates, built on first use."""
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.coords)
+        return self._tree
+
+    @property
+    def residue_letters(self) -> np.ndarray:
+        """One-letter residue code of every row (``X`` if non-standard), parsed from the node IDs on first use."""
+        if self._residue_letters is None:
+            self._residue_letters = np.array([
+                protein_letters_3to1.get(n.split(":")[1].title(), "X") for n in self.node_ids
+            ], dtype="U1")
+        return self._residue_letters
+
+    def rows(
+        self,
+        node_ids: Sequence[str],
+    ) -> np.ndarray:
+        """Get the rows of the given node IDs."""
+        try:
+            return np.array([self._rows[n] for n in node_ids], dtype=np.intp)
+        except KeyError as e:
+            raise ValueError(f"Centre node '{e.args[0]}' not found in graph.")
+
+    def find(
+        self,
+        node_ids: Sequence[str],
+    ) -> np.ndarray:
+        """Get the rows of the given node IDs, or -1 for nodes not in the index."""
+        return np.array([self._rows.get(n, -1) for n in node_ids], dtype=np.intp)
+
+    def query_radius(
+        self,
+        centres: Sequence[int],
+        r: float,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Get all residues strictly within ``r`` Å of each centre row.
+
+        All centres are queried against the KD-tree in a single batch.  For each 
+        centre, the rows of its neighbours and their distances are returned in 
+        order of increasing distance, so that the neighbours within any smaller 
+        radius are a prefix of the arrays (see ``prefix_length``).
+        """
+        centres = np.asarray(centres, dtype=np.intp)
+        centre_coords = self.coords[centres]
+
+        neighbours = []
+        for point, rows in zip(centre_coords, self.tree.query_ball_point(centre_coords, r)):
+            rows = np.sort(np.asarray(rows, dtype=np.intp))
+            dist = np.linalg.norm(self.coords[rows] - point, axis=1)
+
+            order = np.argsort(dist, kind="stable")
+            rows, dist = rows[order], dist[order]
+
+            # KD-tree ball queries are inclusive of the radius 
+            n = prefix_length(dist, r)
+            neighbours.append((rows[:n], dist[:n]))
+
+        return neighbours
+
+    def __getstate__(self) -> dict:
+        # The KD-tree and row lookup are rebuilt on use, so indexes pickled
+        # (e.g. from worker processes) only carry their arrays
+        return {"node_ids": self.node_ids, "coords": self.coords, "residue_numbers": self.residue_numbers}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def __repr__(self) -> str:
+        return f"CoordinateIndex(n_residues={len(self)})"
+
+
+class AtomIndex():
+    """Heavy atoms of a protein, with a KD-tree for radius queries that return residues.
+
+    Every atom is mapped to the row of its residue in a `CoordinateIndex`, and queries 
+    return the same as `CoordinateIndex.query_radius`: the rows of the residues with 
+    any heavy atom strictly within ``r`` Å of the centre, at the distance of their 
+    closest atom, closest first.  The centre of a residue is its modified atom (see 
+    `MODIFIED_ATOMS`), or its coordinates in the residue index for other residues. 
+    """
+
+    def __init__(
+        self,
+        coords: np.ndarray,
+        rows: np.ndarray, # Row of each atom's residue in the residue index 
+        centres: np.ndarray, # Centre of each row of the residue index 
+    ) -> None:
+
+        self.coords: np.ndarray = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.rows: np.ndarray = np.asarray(rows, dtype=np.intp)
+        self.centres: np.ndarray = np.asarray(centres, dtype=np.float64).reshape(-1, 3)
+
+        if len(self.coords) != len(self.rows):
+            raise ValueError("Atom coordinates and rows must have the same length.")
+
+        self._tree: "cKDTree" = None
+
+    @classmethod
+    def from_atoms(
+        cls,
+        atoms: PDBAtoms,
+        index: CoordinateIndex,
+    ) -> "AtomIndex":
+        """Build an index from the atoms of a structure and the residue index they are mapped to.
+
+        Atoms of residues that are not in the residue index are dropped. 
+        """
+        rows = index.find(atoms.node_ids())[atoms.residues]
+        mapped = rows >= 0
+
+        centres = index.coords.copy()
+        residue_names = atoms.residue_names[atoms.residues]
+        for residue_name, atom_name in MODIFIED_ATOMS.items():
+            modified = mapped & (residue_names == residue_name.encode()) & (atoms.atom_names == atom_name.encode())
+            centres[rows[modified]] = atoms.coords[modified]
+
+        return cls(coords=atoms.coords[mapped], rows=rows[mapped], centres=centres)
+
+    @property
+    def tree(self) -> "cKDTree":
+        """KD-tree over the atom coordinates, built on first use."""
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.coords)
+        return self._tree
+
+    def query_radius(
+        self,
+        centres: Sequence[int],
+        r: float,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Get all residues with a heavy atom strictly within ``r`` Å of the centre of each centre row.
+
+        As with `CoordinateIndex.query_radius`, all centres are queried in a single 
+        batch and the residues are returned in order of increasing distance. 
+        """
+        centres = np.asarray(centres, dtype=np.intp)
+        centre_coords = self.centres[centres]
+
+        neighbours = []
+        for point, atoms in zip(centre_coords, self.tree.query_ball_point(centre_coords, r)):
+            atoms = np.sort(np.asarray(atoms, dtype=np.intp))
+            dist = np.linalg.norm(self.coords[atoms] - point, axis=1)
+
+            order = np.argsort(dist, kind="stable")
+            n = prefix_length(dist[order], r)
+            rows, dist = self.rows[atoms[order[:n]]], dist[order[:n]]
+
+            # Closest atom of each residue 
+            rows, first = np.unique(rows, return_index=True)
+            order = np.argsort(first, kind="stable")
+            neighbours.append((rows[order], dist[first[order]]))
+
+        return neighbours
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def __repr__(self) -> str:
+        return f"AtomIndex(n_atoms={len(self)})"
@@ -0,0 +1,307 @@
+"""Lightweight reading of residue coordinates from PDB files."""
+
+import gzip
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+
+from kimono.protein.data import protein_letters_3to1
+from kimono.utils.profiling import PROFILER
+
+
+def read_pdb_lines(
+    path: Union[Path, str],
+    records: tuple = (b"ATOM",),
+) -> List[bytes]:
+    """Read the coordinate records of the first model in a (optionally gzipped) PDB file."""
+    path = Path(path)
+    opener = gzip.open if path.suffix == ".gz" else open
+    with PROFILER.stage("read_structure"), opener(path, "rb") as f:
+        data = f.read()
+    if PROFILER.enabled:
+        PROFILER.count("structure_files_read")
+        PROFILER.count("structure_bytes_read", path.stat().st_size)
+
+    # Only the first model 
+    end = data.find(b"ENDMDL")
+    if end >= 0:
+        data = data[:end]
+
+    return [line for line in data.splitlines() if line.startswith(records)]
+
+
+def read_pdb_sequence(
+    path: Union[Path, str],
+    chain_id: str = "A",
+) -> str:
+    """One-letter sequence of a chain, from the SEQRES records of a (optionally gzipped) PDB file.
+
+    Only the header is read.  Files without SEQRES records fall back to the 
+    residues in the coordinates, with unobserved residues as ``X``. 
+    """
+    path = Path(path)
+    opener = gzip.open if path.suffix == ".gz" else open
+
+    names = []
+    with PROFILER.stage("read_sequence"), opener(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"SEQRES") and line[11:12].decode() == chain_id:
+                names.extend(line[19:].split())
+            elif line.startswith((b"ATOM", b"HETATM", b"MODEL")):
+                break
+    if names:
+        return "".join(protein_letters_3to1.get(name.decode().title(), "X") for name in names)
+
+    residues = PDBResidues.from_file(path)
+    chain = (residues.chain_ids == chain_id.encode()) & (residues.residue_numbers > 0)
+    numbers = residues.residue_numbers[chain]
+    if not len(numbers):
+        return ""
+    sequence = np.full(numbers.max(), "X", dtype="U1")
+    sequence[numbers - 1] = [
+        protein_letters_3to1.get(name.title(), "X") 
+        for name in np.char.decode(residues.residue_names[chain]).tolist()
+    ]
+    return "".join(sequence.tolist())
+
+
+def read_atom_records(
+    path: Union[Path, str],
+    records: tuple = (b"ATOM",),
+) -> np.ndarray:
+    """Coordinate records of the first model of a PDB file, as an array of fixed-width lines (one byte per column).
+
+    Only the first alternative location of each atom is kept. 
+    """
+    lines = read_pdb_lines(path, records=records)
+    if not lines:
+        raise ValueError(f"No atoms found in {path}")
+
+    atoms = np.array(lines, dtype="S80").view("S1").reshape(len(lines), 80)
+
+    altloc = np.char.strip(_column(atoms, 16, 17))
+    return atoms[(altloc == b"") | (altloc == b"A")]
+
+
+def _node_ids(
+    chain_ids: np.ndarray,
+    residue_names: np.ndarray,
+    residue_numbers: np.ndarray,
+    insertions: np.ndarray,
+) -> np.ndarray:
+    """Graphein node ID of each residue (e.g. ``A:SER:15``, or ``A:SER:15:A`` with an insertion code)."""
+    columns = zip(
+        np.char.decode(chain_ids).tolist(), 
+        np.char.decode(residue_names).tolist(), 
+        residue_numbers.tolist(), 
+        np.char.decode(insertions).tolist(),
+    )
+    return np.array([
+        f"{chain_id}:{residue_name}:{residue_number}" + (f":{insertion}" if insertion else "")
+        for chain_id, residue_name, residue_number, insertion in columns
+    ], dtype=object)
+
+
+def _column(
+    atoms: np.ndarray,
+    start: int,
+    end: int,
+) -> np.ndarray:
+    """Fixed-width column of an array of PDB lines (one byte per element)."""
+    return atoms[:, start:end].copy().view(f"S{end - start}").ravel()
+
+
+class PDBResidues():
+    """Residues of a protein structure, as arrays.
+
+    Each residue is represented by its C-alpha atom (as in a residue-level graphein 
+    graph); residues without a C-alpha are dropped.  ``centroids`` are the mean of 
+    each residue's heavy atoms, and ``plddt`` is the B-factor column of the C-alpha, 
+    which holds the per-residue confidence in AlphaFold models.  Coordinates are 
+    single precision, matching the node coordinates of graphein graphs. 
+    """
+
+    def __init__(
+        self,
+        chain_ids: np.ndarray,
+        residue_names: np.ndarray,
+        residue_numbers: np.ndarray,
+        insertions: np.ndarray,
+        coords: np.ndarray,
+        centroids: np.ndarray,
+        plddt: np.ndarray,
+    ) -> None:
+        self.chain_ids: np.ndarray = np.asarray(chain_ids, dtype="S1")
+        self.residue_names: np.ndarray = np.asarray(residue_names, dtype="S3")
+        self.residue_numbers: np.ndarray = np.asarray(residue_numbers, dtype=np.int32)
+        self.insertions: np.ndarray = np.asarray(insertions, dtype="S1")
+        self.coords: np.ndarray = np.asarray(coords, dtype=np.float32)
+        self.centroids: np.ndarray = np.asarray(centroids, dtype=np.float32)
+        self.plddt: np.ndarray = np.asarray(plddt, dtype=np.float32)
+
+    @classmethod
+    def from_file(
+        cls,
+        path: Union[Path, str],
+    ) -> "PDBResidues":
+        """Read the residues of a PDB file (e.g. ``AF-P12345-F1-model_v3.pdb.gz``)."""
+        return cls.from_records(read_atom_records(path))
+
+    @classmethod
+    def from_records(
+        cls,
+        atoms: np.ndarray,
+    ) -> "PDBResidues":
+        """Residues of the atom records returned by `read_atom_records`."""
+        names = np.char.strip(_column(atoms, 12, 16))
+        elements = np.char.strip(_column(atoms, 76, 78))
+        xyz = np.stack([
+            _column(atoms, 30, 38).astype(np.float64), 
+            _column(atoms, 38, 46).astype(np.float64), 
+            _column(atoms, 46, 54).astype(np.float64),
+        ], axis=1)
+
+        # Consecutive atoms with the same chain, residue number and insertion code 
+        key = _column(atoms, 21, 27)
+        new_residue = np.r_[True, key[1:] != key[:-1]]
+        residue = np.cumsum(new_residue) - 1
+        n_residues = residue[-1] + 1
+
+        heavy = elements != b"H"
+        counts = np.bincount(residue[heavy], minlength=n_residues)
+        centroids = np.stack([
+            np.bincount(residue[heavy], weights=xyz[heavy, i], minlength=n_residues) 
+            for i in range(3)
+        ], axis=1) / np.maximum(counts, 1)[:, None]
+
+        # One C-alpha per residue 
+        ca = np.flatnonzero(names == b"CA")
+        ca = ca[np.r_[True, residue[ca][1:] != residue[ca][:-1]]]
+        ca_atoms = atoms[ca]
+
+        return cls(
+            chain_ids=_column(ca_atoms, 21, 22),
+            residue_names=np.char.strip(_column(ca_atoms, 17, 20)),
+            residue_numbers=_column(ca_atoms, 22, 26).astype(np.int32),
+            insertions=np.char.strip(_column(ca_atoms, 26, 27)),
+            coords=xyz[ca],
+            centroids=centroids[residue[ca]],
+            plddt=_column(ca_atoms, 60, 66).astype(np.float32),
+        )
+
+    def renumbered(
+        self,
+        offset: int,
+    ) -> "PDBResidues":
+        """The same residues with ``offset`` added to every residue number."""
+        if not offset:
+            return self
+        return PDBResidues(
+            chain_ids=self.chain_ids,
+            residue_names=self.residue_names,
+            residue_numbers=self.residue_numbers + offset,
+            insertions=self.insertions,
+            coords=self.coords,
+            centroids=self.centroids,
+            plddt=self.plddt,
+        )
+
+    def node_ids(self) -> np.ndarray:
+        """Graphein node ID of each residue (e.g. ``A:SER:15``, or ``A:SER:15:A`` with an insertion code)."""
+        return _node_ids(self.chain_ids, self.residue_names, self.residue_numbers, self.insertions)
+
+    def __len__(self) -> int:
+        return len(self.residue_numbers)
+
+    def __repr__(self) -> str:
+        return f"PDBResidues(n_residues={len(self)})"
+
+
+class PDBAtoms():
+    """Heavy atoms of a protein structure, as arrays.
+
+    Atoms are grouped into residues (consecutive atoms with the same chain, residue 
+    number and insertion code): ``residues`` holds the residue of each atom, and the 
+    chain, name, number and insertion code of each residue are kept once, so atoms 
+    can be mapped to graph nodes (see `node_ids`).  Coordinates are single precision. 
+    """
+
+    def __init__(
+        self,
+        atom_names: np.ndarray,
+        residues: np.ndarray, # Residue of each atom 
+        coords: np.ndarray,
+        chain_ids: np.ndarray, # The following are per residue 
+        residue_names: np.ndarray,
+        residue_numbers: np.ndarray,
+        insertions: np.ndarray,
+    ) -> None:
+        self.atom_names: np.ndarray = np.asarray(atom_names, dtype="S4")
+        self.residues: np.ndarray = np.asarray(residues, dtype=np.intp)
+        self.coords: np.ndarray = np.asarray(coords, dtype=np.float32).reshape(-1, 3)
+        self.chain_ids: np.ndarray = np.asarray(chain_ids, dtype="S1")
+        self.residue_names: np.ndarray = np.asarray(residue_names, dtype="S3")
+        self.residue_numbers: np.ndarray = np.asarray(residue_numbers, dtype=np.int32)
+        self.insertions: np.ndarray = np.asarray(insertions, dtype="S1")
+
+    @classmethod
+    def from_file(
+        cls,
+        path: Union[Path, str],
+    ) -> "PDBAtoms":
+        """Read the heavy atoms of a PDB file."""
+        return cls.from_records(read_atom_records(path))
+
+    @classmethod
+    def from_records(
+        cls,
+        atoms: np.ndarray,
+    ) -> "PDBAtoms":
+        """Heavy atoms of the atom records returned by `read_atom_records`."""
+        atoms = atoms[np.char.strip(_column(atoms, 76, 78)) != b"H"]
+
+        key = _column(atoms, 21, 27)
+        new_residue = np.r_[True, key[1:] != key[:-1]] if len(atoms) else np.zeros(0, dtype=bool)
+        residue_atoms = atoms[new_residue]
+
+        return cls(
+            atom_names=np.char.strip(_column(atoms, 12, 16)),
+            residues=np.cumsum(new_residue) - 1,
+            coords=np.stack([
+                _column(atoms, 30, 38).astype(np.float64), 
+                _column(atoms, 38, 46).astype(np.float64), 
+                _column(atoms, 46, 54).astype(np.float64),
+            ], axis=1),
+            chain_ids=_column(residue_atoms, 21, 22),
+            residue_names=np.char.strip(_column(residue_atoms, 17, 20)),
+            residue_numbers=_column(residue_atoms, 22, 26).astype(np.int32),
+            insertions=np.char.strip(_column(residue_atoms, 26, 27)),
+        )
+
+    def renumbered(
+        self,
+        offset: int,
+    ) -> "PDBAtoms":
+        """The same atoms with ``offset`` added to every residue number."""
+        if not offset:
+            return self
+        return PDBAtoms(
+            atom_names=self.atom_names,
+            residues=self.residues,
+            coords=self.coords,
+            chain_ids=self.chain_ids,
+            residue_names=self.residue_names,
+            residue_numbers=self.residue_numbers + offset,
+            insertions=self.insertions,
+        )
+
+    def node_ids(self) -> np.ndarray:
+        """Graphein node ID of each residue (not atom)."""
+        return _node_ids(self.chain_ids, self.residue_names, self.residue_numbers, self.insertions)
+
+    def __len__(self) -> int:
+        return len(self.atom_names)
+
+    def __repr__(self) -> str:
+        return f"PDBAtoms(n_atoms={len(self)}, n_residues={len(self.residue_numbers)})"
@@ -0,0 +1,77 @@
+"""Reading structures ahead of use in background threads."""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Tuple, TypeVar, Union
+
+from kimono.utils.profiling import PROFILER
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_END = object()
+
+
+def read_ahead(
+    path: Union[Path, str],
+    block_size: int = 1 << 20,
+) -> None:
+    """Read a file without keeping its contents, so that it is in the page cache when it is parsed."""
+    with open(path, "rb") as f:
+        while f.read(block_size):
+            pass
+
+
+class Prefetcher():
+    """Apply a function to the upcoming items of an iterable in background threads.
+
+    Reading and decompressing structure files mostly waits on I/O (and zlib
+    releases the GIL), so it can overlap with the processing of the current
+    item.  At most ``depth`` items are read ahead of the one being consumed:
+    the input is only advanced as results are taken, so memory stays bounded
+    and a streamed input is not read to the end.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[T], R],
+        depth: int = 4, # Maximum number of items read ahead of the one being consumed
+    ) -> None:
+
+        if depth < 1:
+            raise ValueError(f"Invalid prefetch depth: {depth}")
+
+        self.fn = fn
+        self.depth = depth
+
+    def map(
+        self,
+        items: Iterable[T],
+    ) -> Iterator[Tuple[T, R]]:
+        """Yield ``(item, fn(item))`` in input order; exceptions of ``fn`` are raised when its item is reached."""
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.depth, thread_name_prefix="kimono-prefetch") as executor:
+            pending = deque()
+            try:
+                while True:
+                    while len(pending) < self.depth + 1:
+                        item = next(items, _END)
+                        if item is _END:
+                            break
+                        pending.append((item, executor.submit(self.fn, item)))
+                    if not pending:
+                        return
+
+                    item, future = pending.popleft()
+                    with PROFILER.stage("wait_for_prefetch"):
+                        result = future.result()
+                    yield item, result
+            finally:
+                # Items read ahead but not consumed (e.g. the consumer stopped early)
+                for _, future in pending:
+                    future.cancel()
+
+    def __repr__(self) -> str:
+        return f"Prefetcher(depth={self.depth})"
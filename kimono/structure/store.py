@@ -0,0 +1,177 @@
+"""Memory-mapped store of residue coordinates extracted from structure files."""
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from kimono.structure.index import CoordinateIndex
+from kimono.structure.pdb import PDBResidues
+
+
+"""Columns of the store: dtype and shape of each residue's entry."""
+STORE_COLUMNS: Dict[str, Tuple[str, Tuple[int, ...]]] = {
+    "chain_ids": ("S1", ()),
+    "residue_names": ("S3", ()),
+    "residue_numbers": ("int32", ()),
+    "insertions": ("S1", ()),
+    "coords": ("float32", (3,)),
+    "centroids": ("float32", (3,)),
+    "plddt": ("float32", ()),
+}
+
+_INDEX_FILENAME = "index.json"
+
+
+def structure_name(
+    path: Union[Path, str],
+) -> str:
+    """Name of a structure in the store: its file name without extensions (e.g. ``AF-P12345-F1-model_v3``)."""
+    name = Path(path).name
+    for ext in (".gz", ".pdb", ".cif", ".ent"):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    return name
+
+
+class ResidueStore():
+    """Residue coordinates, names, numbers and pLDDT of many structures.
+
+    Each column is a flat binary file of all residues, memory-mapped on first 
+    use, and ``index.json`` maps each structure name to its (offset, length) in 
+    the columns.  Reading a structure returns views into the memory maps, so no 
+    structure file needs to be decompressed or parsed. 
+    """
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+    ) -> None:
+        
+        self.path = Path(path)
+        
+        index_path = self.path / _INDEX_FILENAME
+        if not index_path.is_file():
+            raise FileNotFoundError(f"Residue store not found at {self.path}")
+
+        with open(index_path) as f:
+            index = json.load(f)
+
+        self.n_residues: int = index["n_residues"]
+        self.structures: Dict[str, Tuple[int, int]] = {
+            name: tuple(entry) for name, entry in index["structures"].items()
+        }
+        self._columns: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def build(
+        cls,
+        structure_dir: Union[Path, str],
+        path: Union[Path, str],
+        pattern: str = "AF-*.pdb.gz",
+        n_workers: int = 1,
+    ) -> "ResidueStore":
+        """Extract the residues of every structure file in a directory into a new store.
+
+        Columns are appended one structure at a time, so the memory used does not 
+        depend on the number of structures. 
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        structure_paths = sorted(Path(structure_dir).glob(pattern))
+
+        structures = {}
+        offset = 0
+        files = {name: open(path / f"{name}.bin", "wb") for name in STORE_COLUMNS}
+        try:
+            for structure_path, residues in _read_residues(structure_paths, n_workers=n_workers):
+                if residues is None:
+                    print(f"Could not read residues from {structure_path}")
+                    continue
+
+                for name, (dtype, _) in STORE_COLUMNS.items():
+                    files[name].write(np.ascontiguousarray(getattr(residues, name), dtype=dtype).tobytes())
+
+                structures[structure_name(structure_path)] = (offset, len(residues))
+                offset += len(residues)
+        finally:
+            for f in files.values():
+                f.close()
+
+        with open(path / _INDEX_FILENAME, "w") as f:
+            json.dump({"n_residues": offset, "structures": structures}, f)
+
+        return cls(path)
+
+    def column(
+        self,
+        name: str,
+    ) -> np.ndarray:
+        """Memory map of a column for all residues in the store."""
+        if name not in self._columns:
+            dtype, shape = STORE_COLUMNS[name]
+            if self.n_residues == 0:
+                self._columns[name] = np.empty((0, *shape), dtype=dtype)
+            else:
+                self._columns[name] = np.memmap(
+                    self.path / f"{name}.bin", dtype=dtype, mode="r", shape=(self.n_residues, *shape),
+                )
+        return self._columns[name]
+
+    def residues(
+        self,
+        name: str,
+    ) -> PDBResidues:
+        """Residues of a structure, as views into the store."""
+        try:
+            offset, length = self.structures[name]
+        except KeyError:
+            raise KeyError(f"Structure {name} not in residue store {self.path}")
+
+        return PDBResidues(**{
+            column: self.column(column)[offset:offset + length] for column in STORE_COLUMNS
+        })
+
+    def index(
+        self,
+        name: str,
+    ) -> CoordinateIndex:
+        """Coordinate index of a structure."""
+        return CoordinateIndex.from_residues(self.residues(name))
+
+    def keys(self) -> List[str]:
+        return list(self.structures)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.structures
+
+    def __len__(self) -> int:
+        return len(self.structures)
+
+    def __repr__(self) -> str:
+        return f"ResidueStore({self.path}, n_structures={len(self)}, n_residues={self.n_residues})"
+
+
+def _read_residues_or_none(
+    structure_path: Path,
+) -> PDBResidues:
+    try:
+        return PDBResidues.from_file(structure_path)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_residues(
+    structure_paths: List[Path],
+    n_workers: int = 1,
+) -> Iterator[Tuple[Path, PDBResidues]]:
+    """Read the residues of each structure file, in order, optionally in a process pool."""
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            yield from zip(structure_paths, executor.map(_read_residues_or_none, structure_paths, chunksize=16))
+    else:
+        for structure_path in structure_paths:
+            yield structure_path, _read_residues_or_none(structure_path)
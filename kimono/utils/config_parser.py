@@ -6,6 +6,7 @@ from typing import Callable, Union
 import yaml
 from pydantic import BaseModel
 
+from kimono.analysis import MotifAnalysisConfig
 from kimono.motif.config import (
     MotifGraphConfig,
     # etc.
@@ -59,6 +60,7 @@ def get_loader() -> yaml.Loader:
     loader = yaml.FullLoader
     configs = [
         MotifGraphConfig.__name__,
+        MotifAnalysisConfig.__name__,
         # etc.
     ]
     for config in configs:
@@ -0,0 +1,149 @@
+"""Stage timers and counters for profiling the analysis pipeline."""
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, Union
+
+
+"""Supported whole-program profilers (see `Profiler.start`)."""
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+class Profiler():
+    """Wall-clock time and number of calls of each pipeline stage, and event counters.
+
+    When disabled (the default), ``stage`` returns a shared no-op context and
+    ``count`` returns immediately, so instrumented code costs next to nothing.
+    A module-level instance, `PROFILER`, is shared by all instrumented code,
+    including background threads (e.g. a `Prefetcher`), whose stage times add
+    up alongside those of the main thread.
+    """
+
+    _NULL = nullcontext()
+
+    def __init__(
+        self,
+        enabled: bool = False,
+    ) -> None:
+
+        self.enabled = enabled
+        self.times: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+        self._profiler = None
+        self._profiler_kind: str = None
+
+    def stage(
+        self,
+        name: str,
+    ):
+        """Context manager that times a stage; stages may be nested."""
+        if not self.enabled:
+            return self._NULL
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(
+        self,
+        name: str,
+    ):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.times[name] += elapsed
+                self.calls[name] += 1
+
+    def count(
+        self,
+        name: str,
+        n: int = 1,
+    ) -> None:
+        """Add ``n`` to a counter."""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def reset(self) -> None:
+        self.times.clear()
+        self.calls.clear()
+        self.counters.clear()
+
+    def merge(
+        self,
+        report: dict,
+    ) -> None:
+        """Add a report from another process (see `report`)."""
+        if not self.enabled or report is None:
+            return
+        for name, stage in report["stages"].items():
+            self.times[name] += stage["time"]
+            self.calls[name] += stage["calls"]
+        for name, n in report["counters"].items():
+            self.counters[name] += n
+
+    def report(self) -> dict:
+        """Structured report: time (s) and calls of each stage, and counters."""
+        return {
+            "stages": {
+                name: {"time": self.times[name], "calls": self.calls[name]}
+                for name in sorted(self.times, key=self.times.get, reverse=True)
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def start(
+        self,
+        kind: str = "cprofile", # See `PROFILERS`
+    ) -> None:
+        """Start a whole-program profiler (pyinstrument must be installed separately)."""
+        if kind not in PROFILERS:
+            raise ValueError(f"Invalid profiler: {kind}")
+
+        if kind == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            from pyinstrument import Profiler as PyinstrumentProfiler
+            self._profiler = PyinstrumentProfiler()
+            self._profiler.start()
+        self._profiler_kind = kind
+
+    def stop(
+        self,
+        path: Union[Path, str],
+    ) -> Path:
+        """Stop the whole-program profiler and write its output (``.pstats`` or ``.html``)."""
+        if self._profiler is None:
+            return None
+
+        path = Path(path)
+        if self._profiler_kind == "cprofile":
+            self._profiler.disable()
+            path = path.with_suffix(".pstats")
+            self._profiler.dump_stats(path)
+        else:
+            self._profiler.stop()
+            path = path.with_suffix(".html")
+            path.write_text(self._profiler.output_html())
+
+        self._profiler = None
+        return path
+
+    @property
+    def is_running(self) -> bool:
+        return self._profiler is not None
+
+    def __repr__(self) -> str:
+        return f"Profiler(enabled={self.enabled}, stages={len(self.times)}, counters={len(self.counters)})"
+
+
+PROFILER = Profiler()
@@ -1,13 +1,11 @@
 """Setup python package"""
 
-from setuptools import setup
+from setuptools import find_packages, setup
 
 setup(
     name='kimono', 
     version='0.1', 
-    packages=[
-        "kimono",
-    ],
+    packages=find_packages(include=["kimono", "kimono.*"]),
     entry_points={
         "console_scripts": [
             "kimono = kimono.cli:main",